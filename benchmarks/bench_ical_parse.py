@@ -0,0 +1,45 @@
+"""
+Benchmark parsing of large ICal feeds, serial versus process pool.
+
+Usage: python -m benchmarks.bench_ical_parse [nr_events ...]
+"""
+import os
+import sys
+import time
+
+from benchmarks.feeds import make_feed
+from src.api_client.ical import ICal
+from src.models.ical import ICalendar
+from src.models.settings import Settings
+
+
+def main(sizes):
+    icalendar = ICalendar(name="benchmark", url="", calendar_id="")
+    nr_workers = max(os.cpu_count() or 1, 2)
+    print(f"{os.cpu_count()} cpus, {nr_workers} workers")
+
+    for nr_events in sizes:
+        content = make_feed(nr_events)
+
+        for name, settings in [
+            ("serial", Settings(ical_parse_cache=False, ical_parse_workers=1)),
+            (
+                "parallel",
+                Settings(
+                    ical_parse_cache=False,
+                    ical_parallel_threshold=0,
+                    ical_parse_workers=nr_workers,
+                ),
+            ),
+        ]:
+            start = time.perf_counter()
+            records = list(ICal(settings).parse_events(icalendar, content))
+            duration = time.perf_counter() - start
+            print(
+                f"{nr_events:>7} events  {len(content) / 1e6:6.1f} MB  {name:<8} "
+                f"{duration:7.2f} s  {len(records)} records"
+            )
+
+
+if __name__ == "__main__":
+    main([int(_) for _ in sys.argv[1:]] or [10_000, 50_000, 200_000])
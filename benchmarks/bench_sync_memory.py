@@ -0,0 +1,112 @@
+"""
+Benchmark peak memory of a Notion database sync, default versus streaming mode.
+
+Both sides arrive in opposite order, so nearly every event waits in the join for its counterpart.
+Mutations are planned but not written.
+
+Usage: python -m benchmarks.bench_sync_memory [nr_events ...]
+"""
+import logging
+import sys
+import time
+import tracemalloc
+from typing import Iterator, Optional
+
+import pendulum as dt
+
+from src.common.journal import Journal
+from src.jobs.executor import PlanExecutor
+from src.jobs.sync_notion import sync_database
+from src.models.database import Database
+from src.models.event import CalendarEventDate, NotionCalendarEvent
+from src.models.plan import Mutation
+from src.models.settings import Settings
+from src.models.sync_window import SyncWindow
+
+DATABASE = Database.from_dict(
+    {
+        "workspace": "benchmark",
+        "name": "benchmark",
+        "id": "benchmark",
+        "calendar_id": "benchmark",
+        "title_property": "Name",
+        "date_property": "Date",
+        "icon_property_path": "State/status/name",
+        "icon_value_mapping": {},
+        "icon_default": "",
+    }
+)
+
+
+def make_events(
+    nr_events: int, reverse: bool, google: bool
+) -> Iterator[NotionCalendarEvent]:
+    now = dt.now().start_of("hour")
+    for i in reversed(range(nr_events)) if reverse else range(nr_events):
+        start = now.add(hours=i)
+        yield NotionCalendarEvent(
+            database=DATABASE,
+            title=f"Event {i}" if google or i % 10 else f"Event {i} (changed)",
+            date=CalendarEventDate(start, start.add(hours=1), all_day=False),
+            notion_page_id=f"page-{i}",
+            notion_page_url=f"https://www.notion.so/page-{i}",
+            icon_property_value="Todo",
+            google_event_id=f"event{i}" if google else "",
+        )
+
+
+class FakeNotion:
+    def __init__(self, nr_events: int):
+        self.nr_events = nr_events
+
+    def get_events(
+        self, database: Database, window: Optional[SyncWindow] = None
+    ) -> Iterator[NotionCalendarEvent]:
+        return make_events(self.nr_events, reverse=True, google=False)
+
+
+class FakeGCalendar:
+    def __init__(self, nr_events: int):
+        self.nr_events = nr_events
+
+    def get_events_notion(
+        self, database: Database, window: Optional[SyncWindow] = None
+    ) -> Iterator[NotionCalendarEvent]:
+        return make_events(self.nr_events, reverse=False, google=True)
+
+
+class NullExecutor(PlanExecutor):
+    def execute_mutation(
+        self, mutation: Mutation, journal: Optional[Journal] = None
+    ) -> None:
+        pass
+
+
+def main(sizes):
+    logging.basicConfig(level=logging.WARNING)
+
+    for nr_events in sizes:
+        for name, settings in [
+            ("default", Settings()),
+            ("streaming", Settings(streaming_sync=True)),
+        ]:
+            tracemalloc.start()
+            start = time.perf_counter()
+            plan = sync_database(
+                FakeNotion(nr_events),
+                FakeGCalendar(nr_events),
+                DATABASE,
+                NullExecutor(),
+                settings,
+            )
+            duration = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f"{nr_events:>7} events  {name:<9} {duration:7.2f} s  "
+                f"peak {peak / 2**20:7.1f} MiB  {plan.counts()}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(_) for _ in sys.argv[1:]] or [10_000, 50_000, 200_000])
@@ -0,0 +1,97 @@
+import random
+
+import pendulum as dt
+
+TIMEZONE = """BEGIN:VTIMEZONE\r
+TZID:W. Europe Standard Time\r
+BEGIN:STANDARD\r
+DTSTART:16010101T030000\r
+TZOFFSETFROM:+0200\r
+TZOFFSETTO:+0100\r
+RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU\r
+END:STANDARD\r
+BEGIN:DAYLIGHT\r
+DTSTART:16010101T020000\r
+TZOFFSETFROM:+0100\r
+TZOFFSETTO:+0200\r
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU\r
+END:DAYLIGHT\r
+END:VTIMEZONE\r
+"""
+
+
+def vevent(
+    uid: int,
+    start: dt.DateTime,
+    rrule: str = None,
+    recurrence_id: dt.DateTime = None,
+    all_day: bool = False,
+    description_length: int = 200,
+) -> str:
+    tz = "W. Europe Standard Time"
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}@example.com",
+        f"SUMMARY:Event {uid}",
+        "STATUS:CONFIRMED",
+        f"DESCRIPTION:{'x' * description_length}",
+        "DTSTAMP:20230101T000000Z",
+        "LAST-MODIFIED:20230101T000000Z",
+        "LOCATION:Room 1",
+    ]
+    if all_day:
+        lines += [
+            f"DTSTART;VALUE=DATE:{start.format('YYYYMMDD')}",
+            f"DTEND;VALUE=DATE:{start.add(days=1).format('YYYYMMDD')}",
+        ]
+    else:
+        lines += [
+            f"DTSTART;TZID={tz}:{start.format('YYYYMMDD[T]HHmmss')}",
+            f"DTEND;TZID={tz}:{start.add(hours=1).format('YYYYMMDD[T]HHmmss')}",
+        ]
+    if rrule:
+        lines.append(f"RRULE:{rrule}")
+    if recurrence_id:
+        lines.append(
+            f"RECURRENCE-ID;TZID={tz}:{recurrence_id.format('YYYYMMDD[T]HHmmss')}"
+        )
+    lines.append("END:VEVENT")
+
+    return "\r\n".join(lines) + "\r\n"
+
+
+def make_feed(nr_events: int, seed: int = 0) -> bytes:
+    """
+    Synthetic ICal feed with a production-like mix: years of history, expired and open-ended series,
+    recurring exceptions and all-day events.
+    """
+
+    rnd = random.Random(seed)
+    now = dt.now().start_of("hour").naive()
+    parts = ["BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:benchmark\r\n", TIMEZONE]
+
+    for uid in range(nr_events):
+        r = rnd.random()
+        start = now.add(days=rnd.randint(-1500, 200), hours=rnd.randint(0, 10))
+        if r < 0.1:
+            until = start.add(days=rnd.randint(10, 400))
+            rrule = f"FREQ=WEEKLY;UNTIL={until.format('YYYYMMDD[T]HHmmss')}Z"
+            parts.append(vevent(uid, start, rrule=rrule))
+        elif r < 0.15:
+            parts.append(
+                vevent(uid, start, rrule=f"FREQ=DAILY;COUNT={rnd.randint(2, 50)}")
+            )
+        elif r < 0.2:
+            start = now.add(days=rnd.randint(-20, 20))
+            parts.append(vevent(uid, start, rrule="FREQ=DAILY"))
+            parts.append(
+                vevent(uid, start.add(days=3, hours=2), recurrence_id=start.add(days=3))
+            )
+        elif r < 0.3:
+            parts.append(vevent(uid, start, all_day=True))
+        else:
+            parts.append(vevent(uid, start))
+
+    parts.append("END:VCALENDAR\r\n")
+
+    return "".join(parts).encode()
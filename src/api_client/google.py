@@ -1,19 +1,54 @@
+import base64
+import hashlib
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from functools import partial
 from pathlib import Path
-from typing import Any, List, Mapping, Type
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
+from urllib.parse import urlsplit
 
+import httplib2
 import pendulum as dt
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2.service_account import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 
+from src.common import tracing
+from src.common.cassette import Cassette
+from src.common.deadline import Deadline
+from src.common.log import event_log
+from src.common.mirror import MirrorStore
+from src.common.utils import iterate_concurrently, split_time_range
 from src.models.database import Database
 from src.models.event import CalendarEvent, ICalCalendarEvent, NotionCalendarEvent
 from src.models.ical import ICalendar
+from src.models.settings import Settings
+from src.models.sync_window import SyncWindow
 from src.transformations.event_title import format_event_title
 from src.transformations.google_to_calendar_event import (
     google_to_ical_calendar_event,
     google_to_notion_calendar_event,
+    parse_start,
 )
 
 logger = logging.getLogger(__name__)
@@ -25,83 +60,670 @@ SCOPES = [
 CREDENTIALS_PATH = Path(__file__).parents[2] / "config" / "secrets" / "google.json"
 
 
+BATCH_SIZE = 50
+MAX_PARALLEL_PAGINATION = 10
+
+# Max nr of requests of a parallel execution that are sent at the same time
+MAX_IN_FLIGHT = 10
+
+
+@dataclass
+class CalendarListing:
+    """
+    Planned listing of a calendar, fetched once for all sources that sync to it.
+    """
+
+    calendar_id: str
+    time_min: dt.DateTime
+    params: Mapping[str, Any]
+
+    # Nr of sources that did not get their events from the listing yet
+    nr_sources: int
+
+    time_max: Optional[dt.DateTime] = None
+
+    events: Optional[List[Mapping]] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
 class GCalendar:
     """
     Google Calendar API client.
     """
 
-    def __init__(self):
-        self.credentials = Credentials.from_service_account_file(
-            filename=CREDENTIALS_PATH,
-            scopes=SCOPES,
-        )
+    def __init__(
+        self, settings: Optional[Settings] = None, cassette: Optional[Cassette] = None
+    ):
+        self.settings = settings or Settings()
+
+        # Api calls are recorded to or replayed from the cassette, if any. A replay needs no credentials.
+        self.cassette = cassette
+        if cassette and cassette.replaying:
+            self.credentials = AnonymousCredentials()
+        else:
+            self.credentials = SharedCredentials.from_service_account_file(
+                filename=CREDENTIALS_PATH,
+                scopes=SCOPES,
+            )
         self.calendar = build("calendar", "v3", credentials=self.credentials)
 
+        # httplib2 is not thread-safe, every request takes a transport from the pool and returns it after.
+        # Transports outlive the threads that use them, which keeps their connections open.
+        self.pool: queue.LifoQueue[AuthorizedHttp] = queue.LifoQueue()
+
+        self.listings: Dict[str, CalendarListing] = {}
+
+        # Deadline of the current sync, caps the timeout of every request
+        self.deadline = Deadline()
+
+        # Local copy of the calendars, kept up to date with the writes of the sync, when reconciling
+        self.mirror = MirrorStore() if self.settings.reconcile_ranges else None
+
+    @contextmanager
+    def http(self) -> Iterator[AuthorizedHttp]:
+        """
+        Authorized http transport from the pool, with the timeout of the next request.
+        It is used by the current thread only, until it is returned to the pool on exit.
+        """
+
+        try:
+            http = self.pool.get_nowait()
+        except queue.Empty:
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+
+        try:
+            # httplib2 has a single timeout for connecting and reading
+            _, timeout = self.deadline.timeout(
+                self.settings.connect_timeout_seconds,
+                self.settings.read_timeout_seconds,
+            )
+            set_http_timeout(http.http, timeout)
+
+            yield TracedHttp(http) if tracing.tracer.enabled else http
+        finally:
+            self.pool.put(http)
+
+    def execute(self, request: HttpRequest) -> Mapping:
+        """
+        Execute an api request on a transport from the pool.
+        """
+
+        def _send() -> Mapping:
+            with self.http() as http:
+                return request.execute(http=http)
+
+        if self.cassette:
+            response = self.cassette.execute("google", request, _send)
+        else:
+            response = _send()
+
+        if self.mirror:
+            self.mirror.record_write(request, response)
+
+        return response
+
+    def execute_parallel(
+        self, requests: List[HttpRequest], max_in_flight: int = MAX_IN_FLIGHT
+    ) -> List[Mapping]:
+        """
+        Execute independent requests in parallel, with at most max_in_flight requests at the same time.
+        Unlike a batch, every request is a http call of its own and is retried on its own.
+
+        :return: The responses in the order of the requests, the first error is raised.
+        """
+
+        if not requests:
+            return []
+
+        with ThreadPoolExecutor(
+            max_workers=max(min(max_in_flight, len(requests)), 1),
+            thread_name_prefix="google",
+        ) as executor:
+            return list(executor.map(self.execute, requests))
+
+    def execute_batch(self, requests: List[HttpRequest]) -> List[Mapping]:
+        """
+        Execute independent requests bundled in batch http calls of at most BATCH_SIZE requests.
+
+        :return: The responses in the order of the requests, the error of the first failed request is raised.
+        """
+
+        # Batched requests are recorded and replayed one by one, batch bodies differ between runs
+        if self.cassette and self.cassette.replaying:
+            return [self.execute(request) for request in requests]
+
+        responses: List[Optional[Mapping]] = [None] * len(requests)
+        errors: Dict[int, Exception] = {}
+
+        def _callback(request_id: str, response: Mapping, exception: Exception):
+            if exception:
+                errors[int(request_id)] = exception
+            responses[int(request_id)] = response
+
+        for offset in range(0, len(requests), BATCH_SIZE):
+            batch = self.calendar.new_batch_http_request(callback=_callback)
+            batch_requests = requests[offset : offset + BATCH_SIZE]
+            for i, request in enumerate(batch_requests, start=offset):
+                batch.add(request, request_id=str(i))
+            start = time.perf_counter()
+            with self.http() as http:
+                batch.execute(http=http)
+
+            # The latency of the batch is spread over its requests
+            if self.cassette:
+                latency = (time.perf_counter() - start) / len(batch_requests)
+                for i, request in enumerate(batch_requests, start=offset):
+                    self.cassette.record_google(
+                        "google", request, responses[i], errors.get(i), latency
+                    )
+
+            if errors:
+                raise errors[min(errors)]
+
+        return responses
+
+    def paginate(
+        self,
+        make_request: Callable[[Optional[str]], HttpRequest],
+        response: Optional[Mapping] = None,
+    ) -> Iterator[Mapping]:
+        """
+        Get all items of a paginated request.
+
+        :param make_request: Builds the request for a given page token.
+        :param response: Already fetched first page to continue from.
+        """
+
+        if response is None:
+            response = self.execute(make_request(None))
+
+        while True:
+            yield from response.get("items", [])
+
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+            response = self.execute(make_request(page_token))
+
+    def paginate_batch(
+        self, make_requests: List[Callable[[Optional[str]], HttpRequest]]
+    ) -> Iterator[Tuple[int, Mapping]]:
+        """
+        Get all items of multiple paginated requests.
+        The first pages are fetched in batch http calls, follow-up pages are then listed concurrently.
+
+        :return: The items, tagged with the index of their request.
+        """
+
+        first_pages = self.execute_batch(
+            [make_request(None) for make_request in make_requests]
+        )
+
+        return iterate_concurrently(
+            [
+                tag_items(i, self.paginate(make_request, first_page))
+                for i, (make_request, first_page) in enumerate(
+                    zip(make_requests, first_pages)
+                )
+            ],
+            max_workers=MAX_PARALLEL_PAGINATION,
+        )
+
+    def list_request(
+        self,
+        page_token: Optional[str],
+        calendar_id: str,
+        time_min: dt.DateTime,
+        time_max: Optional[dt.DateTime] = None,
+        **params,
+    ) -> HttpRequest:
+        """
+        Build the request for one page of an event listing.
+        """
+
+        return self.calendar.events().list(
+            calendarId=calendar_id,
+            timeMin=format_request_time(time_min),
+            **({"timeMax": format_request_time(time_max)} if time_max else {}),
+            **({"pageToken": page_token} if page_token else {}),
+            maxResults=2500,
+            **params,
+        )
+
+    def instances_request(
+        self,
+        page_token: Optional[str],
+        calendar_id: str,
+        event_id: str,
+    ) -> HttpRequest:
+        """
+        Build the request for one page of the instances of a recurring event.
+        """
+
+        return self.calendar.events().instances(
+            calendarId=calendar_id,
+            eventId=event_id,
+            **({"pageToken": page_token} if page_token else {}),
+            maxResults=2500,
+        )
+
+    def list_events(
+        self,
+        calendar_id: str,
+        time_min: dt.DateTime,
+        time_max: Optional[dt.DateTime] = None,
+        **params,
+    ) -> Iterator[Mapping]:
+        """
+        List all events of a calendar in the given time range, following pagination.
+        """
+
+        return self.paginate(
+            partial(
+                self.list_request,
+                calendar_id=calendar_id,
+                time_min=time_min,
+                time_max=time_max,
+                **params,
+            )
+        )
+
+    def list_digest_events(
+        self, calendar_id: str, time_min: dt.DateTime, time_max: dt.DateTime
+    ) -> Iterator[Mapping]:
+        """
+        List only the id, etag and start of the events of a calendar, to compare them with its mirror.
+        """
+
+        return self.list_events(
+            calendar_id,
+            time_min=time_min,
+            time_max=time_max,
+            singleEvents=False,
+            fields="items(id,etag,start),nextPageToken",
+        )
+
+    def listing_slices(
+        self, time_min: dt.DateTime, time_max: Optional[dt.DateTime] = None
+    ) -> List[Tuple[dt.DateTime, Optional[dt.DateTime]]]:
+        """
+        Split a listing from "time_min" onwards into "list_shards" time slices.
+        Without a "time_max" the last slice is open-ended.
+        """
+
+        nr_shards = max(self.settings.list_shards, 1)
+        if time_max:
+            return split_time_range(time_min, max(time_max, time_min), nr_shards)
+
+        horizon = dt.now().add(days=self.settings.list_shard_horizon_days)
+        slices = split_time_range(time_min, max(horizon, time_min), nr_shards)
+        slices[-1] = (slices[-1][0], None)
+
+        return slices
+
+    def list_events_sharded(
+        self,
+        calendar_id: str,
+        time_min: dt.DateTime,
+        time_max: Optional[dt.DateTime] = None,
+        **params,
+    ) -> Iterator[Mapping]:
+        """
+        List all events of a calendar from "time_min" onwards, up to "time_max" if given.
+
+        The time range is split into "list_shards" slices that are listed and paginated in parallel.
+        Events overlapping a slice boundary and recurring root events are returned by multiple slices,
+        so only the first occurence of every event id is yielded.
+        """
+
+        if self.settings.list_shards <= 1:
+            yield from self.list_events(calendar_id, time_min, time_max, **params)
+            return
+
+        yield from unique_events(
+            iterate_concurrently(
+                [
+                    self.list_events(calendar_id, slice_min, slice_max, **params)
+                    for slice_min, slice_max in self.listing_slices(time_min, time_max)
+                ]
+            )
+        )
+
+    def plan_listings(
+        self,
+        sources: Iterable[Union[Database, ICalendar]],
+        windows: Optional[Mapping[str, SyncWindow]] = None,
+    ) -> None:
+        """
+        Plan the listings for a sync run.
+
+        Calendars that multiple sources sync to are listed once, the events are then fanned out
+        to the sources based on their extended properties. This way the nr of list requests scales
+        with the nr of calendars instead of the nr of sources.
+        With "batch_reads" enabled, every calendar is planned so all listings can be prefetched in batch.
+
+        :param windows: Synced window per source name for this run, the cold window by default.
+            A calendar is listed for the union of the windows of its sources.
+        """
+
+        windows = windows or {}
+
+        sources_per_calendar: Dict[str, List[Union[Database, ICalendar]]] = {}
+        for source in sources:
+            sources_per_calendar.setdefault(source.calendar_id, []).append(source)
+
+        self.listings = {}
+        for calendar_id, calendar_sources in sources_per_calendar.items():
+            if len(calendar_sources) == 1 and not self.settings.batch_reads:
+                continue
+
+            # A calendar of a single database can be filtered server-side
+            source = calendar_sources[0]
+            if len(calendar_sources) == 1 and isinstance(source, Database):
+                params = {
+                    "sharedExtendedProperty": [
+                        f"{NotionCalendarEvent.notion_database_id_property_name}={source.id}",
+                    ],
+                    "singleEvents": True,
+                }
+            else:
+                params = {"singleEvents": False}
+
+            time_ranges = [
+                windows.get(source.name, source.sync.cold).resolve()
+                for source in calendar_sources
+            ]
+            time_maxs = [time_range.time_max for time_range in time_ranges]
+            self.listings[calendar_id] = CalendarListing(
+                calendar_id=calendar_id,
+                time_min=min(time_range.time_min for time_range in time_ranges),
+                time_max=None if None in time_maxs else max(time_maxs),
+                params=params,
+                nr_sources=len(calendar_sources),
+            )
+
+    def prefetch_listings(self) -> None:
+        """
+        Fetch all planned listings.
+
+        The first pages of all calendars (and all their slices) are fetched in batch http calls,
+        follow-up pages are then listed concurrently.
+        """
+
+        listings = [_ for _ in self.listings.values() if _.events is None]
+        if not listings:
+            return
+
+        logger.info(f"Prefetching {len(listings)} calendars from Google Calendar.")
+
+        make_requests = [
+            (
+                i,
+                partial(
+                    self.list_request,
+                    calendar_id=listing.calendar_id,
+                    time_min=slice_min,
+                    time_max=slice_max,
+                    **listing.params,
+                ),
+            )
+            for i, listing in enumerate(listings)
+            for slice_min, slice_max in self.listing_slices(
+                listing.time_min, listing.time_max
+            )
+        ]
+        first_pages = self.execute_batch(
+            [make_request(None) for _, make_request in make_requests]
+        )
+
+        events: List[List[Mapping]] = [[] for _ in listings]
+        for i, event in iterate_concurrently(
+            [
+                tag_items(i, self.paginate(make_request, first_page))
+                for (i, make_request), first_page in zip(make_requests, first_pages)
+            ],
+            max_workers=MAX_PARALLEL_PAGINATION,
+        ):
+            events[i].append(event)
+
+        for listing, listing_events in zip(listings, events):
+            listing.events = list(unique_events(listing_events))
+
+    def get_calendar_listing(self, calendar_id: str) -> List[Mapping]:
+        """
+        Get all events of a planned calendar listing, listing it for the first source that requests it.
+        Every source releases the listing with `release_listing` once it is done.
+        """
+
+        listing = self.listings[calendar_id]
+        with listing.lock:
+            if listing.events is None:
+                logger.info(f"Listing calendar {calendar_id}.")
+                listing.events = list(
+                    self.list_events_sharded(
+                        calendar_id=calendar_id,
+                        time_min=listing.time_min,
+                        time_max=listing.time_max,
+                        **listing.params,
+                    )
+                )
+
+            return listing.events
+
+    def release_listing(self, calendar_id: str) -> None:
+        """
+        Release a planned calendar listing for one of its sources, whether or not the source got its
+        events. The events are dropped after the last source released the listing.
+        """
+
+        listing = self.listings.get(calendar_id)
+        if listing is None:
+            return
+
+        with listing.lock:
+            listing.nr_sources -= 1
+            if listing.nr_sources <= 0:
+                self.listings.pop(calendar_id, None)
+
     def get_events_notion(
         self,
         database: Database,
-        cutoff_days: int = 30,
-    ) -> List[NotionCalendarEvent]:
+        window: Optional[SyncWindow] = None,
+    ) -> Iterator[NotionCalendarEvent]:
         """
         Get all events in google calendar corresponsing to the given database.
-        Only events from the past "cutoff_days" nr of days are retured.
+        Only events that start in the sync window are retured, the cold window of the database by default.
         """
 
         logger.info("Getting all events from Google Calendar.")
 
-        request = self.calendar.events().list(
-            calendarId=database.calendar_id,
-            sharedExtendedProperty=[
-                f"{NotionCalendarEvent.notion_database_id_property_name}={database.id}",
-            ],
-            timeMin=dt.now().naive().subtract(days=cutoff_days).isoformat() + "Z",
-            orderBy="startTime",
-            singleEvents=True,
-            maxResults=2500,
-        )
-        # TODO: pagination
+        time_range = (window or database.sync.cold).resolve()
+
+        if database.calendar_id in self.listings:
+            response = filter(
+                lambda _: _.get("extendedProperties", {})
+                .get("shared", {})
+                .get(NotionCalendarEvent.notion_database_id_property_name)
+                == database.id,
+                self.get_calendar_listing(database.calendar_id),
+            )
+        else:
+            response = self.list_events_sharded(
+                calendar_id=database.calendar_id,
+                time_min=time_range.time_min,
+                time_max=time_range.time_max,
+                sharedExtendedProperty=[
+                    f"{NotionCalendarEvent.notion_database_id_property_name}={database.id}",
+                ],
+                singleEvents=True,
+            )
         # TODO: implement incremental request with nextSyncToken
 
-        response = request.execute().get("items", [])
-        return list(
-            filter(
-                lambda _: _ is not None,
-                map(
-                    partial(google_to_notion_calendar_event, database=database),
+        # Google Calendar lists events that end in the time range, only keep the ones that start in it.
+        # Only the start is parsed, the dates of the events are parsed when they are compared.
+        return filter(
+            lambda _: _ is not None,
+            map(
+                partial(google_to_notion_calendar_event, database=database),
+                filter(
+                    lambda _: (start := parse_start(_)) and time_range.contains(start),
                     response,
                 ),
-            )
+            ),
         )
 
     def get_events_ical(
         self,
         icalendar: ICalendar,
-        cutoff_days: int = 30,
-    ) -> List[ICalCalendarEvent]:
+        window: Optional[SyncWindow] = None,
+    ) -> Iterator[ICalCalendarEvent]:
         """
         Get all events in google calendar corresponsing to the given ical calendar.
+        Only recurring root events and events that start in the sync window are retured,
+        the cold window of the ical calendar by default.
         """
 
         logger.info("Getting all events from Google Calendar.")
 
-        request = self.calendar.events().list(
-            calendarId=icalendar.calendar_id,
-            # NOTE: recurring root events seem to be retrieved regardless of timeMin, that is what we want.
-            timeMin=dt.now().naive().subtract(days=cutoff_days).isoformat() + "Z",
-            singleEvents=False,
-            maxResults=2500,
-        )
+        time_range = (window or icalendar.sync.cold).resolve()
 
-        response = request.execute().get("items", [])
-        return list(
-            filter(
-                lambda _: _ is not None,
-                map(
-                    partial(google_to_ical_calendar_event, icalendar=icalendar),
+        # NOTE: events without an ical uid are filtered out when parsing.
+        if icalendar.calendar_id in self.listings:
+            response = self.get_calendar_listing(icalendar.calendar_id)
+        else:
+            response = self.list_events_sharded(
+                calendar_id=icalendar.calendar_id,
+                # NOTE: recurring root events seem to be retrieved regardless of timeMin, that is what we want.
+                time_min=time_range.time_min,
+                time_max=time_range.time_max,
+                singleEvents=False,
+            )
+
+        return filter(
+            lambda _: _ is not None,
+            map(
+                partial(google_to_ical_calendar_event, icalendar=icalendar),
+                filter(
+                    lambda _: (start := parse_start(_))
+                    and time_range.contains(start, recurring="recurrence" in _),
                     response,
                 ),
-            )
+            ),
+        )
+
+    def find_event_notion(
+        self, database: Database, notion_page_id: str
+    ) -> Optional[NotionCalendarEvent]:
+        """
+        Find the event of a notion page anywhere in the cold window of its database.
+        """
+
+        response = self.list_events(
+            calendar_id=database.calendar_id,
+            time_min=database.sync.cold.resolve().time_min,
+            sharedExtendedProperty=[
+                f"{NotionCalendarEvent.notion_database_id_property_name}={database.id}",
+                f"{NotionCalendarEvent.notion_page_id_property_name}={notion_page_id}",
+            ],
+            singleEvents=True,
         )
+        for event in response:
+            event = google_to_notion_calendar_event(event, database=database)
+            if event is not None:
+                return event
+
+        return None
+
+    def find_events_ical(
+        self, icalendar: ICalendar, ical_uid: str
+    ) -> List[ICalCalendarEvent]:
+        """
+        Find the events of an ical uid anywhere in the cold window of its ical calendar.
+        """
+
+        response = self.list_events(
+            calendar_id=icalendar.calendar_id,
+            time_min=icalendar.sync.cold.resolve().time_min,
+            sharedExtendedProperty=[
+                f"{ICalCalendarEvent.ical_uid_property_name}={ical_uid}",
+            ],
+            singleEvents=False,
+        )
+
+        return [
+            event
+            for event in map(
+                partial(google_to_ical_calendar_event, icalendar=icalendar), response
+            )
+            if event is not None
+        ]
+
+    def find_events_notion_batch(
+        self, database: Database, notion_page_ids: List[str]
+    ) -> Mapping[str, NotionCalendarEvent]:
+        """
+        Find the events of multiple notion pages anywhere in the cold window of their database, in batch.
+
+        :return: The event per notion page id, pages without an event are left out.
+        """
+
+        if not notion_page_ids:
+            return {}
+
+        make_requests = [
+            partial(
+                self.list_request,
+                calendar_id=database.calendar_id,
+                time_min=database.sync.cold.resolve().time_min,
+                sharedExtendedProperty=[
+                    f"{NotionCalendarEvent.notion_database_id_property_name}={database.id}",
+                    f"{NotionCalendarEvent.notion_page_id_property_name}={notion_page_id}",
+                ],
+                singleEvents=True,
+            )
+            for notion_page_id in notion_page_ids
+        ]
+
+        events = {}
+        for i, event in self.paginate_batch(make_requests):
+            event = google_to_notion_calendar_event(event, database=database)
+            if event is not None:
+                events.setdefault(notion_page_ids[i], event)
+
+        return events
+
+    def find_events_ical_batch(
+        self, icalendar: ICalendar, ical_uids: List[str]
+    ) -> Mapping[str, List[ICalCalendarEvent]]:
+        """
+        Find the events of multiple ical uids anywhere in the cold window of their ical calendar, in batch.
+
+        :return: The events per ical uid.
+        """
+
+        if not ical_uids:
+            return {}
+
+        make_requests = [
+            partial(
+                self.list_request,
+                calendar_id=icalendar.calendar_id,
+                time_min=icalendar.sync.cold.resolve().time_min,
+                sharedExtendedProperty=[
+                    f"{ICalCalendarEvent.ical_uid_property_name}={ical_uid}",
+                ],
+                singleEvents=False,
+            )
+            for ical_uid in ical_uids
+        ]
+
+        events = {ical_uid: [] for ical_uid in ical_uids}
+        for i, event in self.paginate_batch(make_requests):
+            event = google_to_ical_calendar_event(event, icalendar=icalendar)
+            if event is not None:
+                events[ical_uids[i]].append(event)
+
+        return events
 
     def get_event_instances_ical(
         self,
@@ -111,41 +733,88 @@ class GCalendar:
         Get all individual instances of a recurring event.
         """
 
-        logger.info(
-            f"Getting recurring event instances for '{event_root.title}' from Google Calendar."
-        )
+        return self.get_event_instances_ical_batch([event_root])[
+            event_root.google_event_id
+        ]
 
-        request = self.calendar.events().instances(
-            calendarId=event_root.icalendar.calendar_id,
-            eventId=event_root.google_event_id,
-            maxResults=2500,
+    def get_event_instances_ical_batch(
+        self,
+        event_roots: List[ICalCalendarEvent],
+    ) -> Mapping[str, List[ICalCalendarEvent]]:
+        """
+        Get all individual instances of multiple recurring events.
+        The first pages are fetched in batch http calls, follow-up pages are then listed concurrently.
+
+        :return: The instances per google event id of the recurring root.
+        """
+
+        if not event_roots:
+            return {}
+
+        logger.info(
+            f"Getting recurring event instances for {len(event_roots)} events from Google Calendar."
         )
 
-        response = request.execute().get("items", [])
-        return list(
-            filter(
-                lambda _: _ is not None,
-                map(
-                    partial(
-                        google_to_ical_calendar_event, icalendar=event_root.icalendar
-                    ),
-                    response,
-                ),
+        make_requests = [
+            partial(
+                self.instances_request,
+                calendar_id=event_root.icalendar.calendar_id,
+                event_id=event_root.google_event_id,
             )
+            for event_root in event_roots
+        ]
+
+        instances = {event_root.google_event_id: [] for event_root in event_roots}
+        for i, event in self.paginate_batch(make_requests):
+            event_root = event_roots[i]
+            event = google_to_ical_calendar_event(event, icalendar=event_root.icalendar)
+            if event is not None:
+                instances[event_root.google_event_id].append(event)
+
+        return instances
+
+    def insert_event(self, calendar_id: str, body: Mapping[str, Any]) -> Mapping:
+        """
+        Insert an event in Google Calendar.
+
+        If the body contains a (deterministic) id that already exists, the insert becomes an update.
+        This makes inserts idempotent, also for events that were deleted in Google Calendar.
+        """
+
+        request = self.calendar.events().insert(calendarId=calendar_id, body=body)
+
+        try:
+            return self.execute(request)
+        except HttpError as e:
+            if e.resp.status != 409 or "id" not in body:
+                raise
+
+        logger.info(f"Event {body['id']} already exists, updating instead.")
+        request = self.calendar.events().update(
+            calendarId=calendar_id,
+            eventId=body["id"],
+            body={"status": "confirmed", **body},
         )
 
-    def create_event_from_notion(self, event: NotionCalendarEvent) -> None:
+        return self.execute(request)
+
+    def create_event_from_notion(self, event: NotionCalendarEvent) -> str:
         """
         Create a new event in Google Calendar.
+
+        :return: The Google Calendar event id.
         """
 
-        request = self.calendar.events().insert(
-            calendarId=event.database.calendar_id,
-            body=self.event_to_request_body_notion(event),
+        body = self.event_to_request_body_notion(event)
+        if self.settings.deterministic_ids:
+            body["id"] = deterministic_event_id("notion", event.notion_page_id)
+
+        response = self.insert_event(event.database.calendar_id, body)
+        event_log.event(
+            logger, "create", event.title, "Created event '%s' in Google Calendar."
         )
 
-        request.execute()
-        logger.info(f"Created event '{event.title}' in Google Calendar.")
+        return response["id"]
 
     def create_event_from_ical(self, event: ICalCalendarEvent) -> str:
         """
@@ -154,43 +823,176 @@ class GCalendar:
         :return: The Google Calendar event id.
         """
 
-        request = self.calendar.events().insert(
-            calendarId=event.icalendar.calendar_id,
-            body=self.event_to_request_body_ical(event),
-        )
+        body = self.event_to_request_body_ical(event)
+        if self.settings.deterministic_ids:
+            body["id"] = deterministic_event_id(
+                "ical",
+                event.ical_uid,
+                event.recurrence_start.isoformat() if event.recurrence_start else "",
+            )
 
-        response = request.execute()
-        logger.info(f"Created event '{event.title}' in Google Calendar.")
+        response = self.insert_event(event.icalendar.calendar_id, body)
+        event_log.event(
+            logger, "create", event.title, "Created event '%s' in Google Calendar."
+        )
 
         return response["id"]
 
-    def update_event_from_notion(self, event: NotionCalendarEvent) -> None:
+    def patch_event(
+        self,
+        calendar_id: str,
+        event_id: str,
+        body: Mapping[str, Any],
+        body_google: Mapping[str, Any],
+        etag: Optional[str] = None,
+        to_body_google: Optional[Callable[[Mapping], Optional[Mapping]]] = None,
+    ) -> None:
         """
-        Update the given event in Google Calendar.
+        Patch an event in Google Calendar with only the fields of the body that changed compared to
+        the body of its current Google Calendar version. Fields that are not managed are left untouched.
+
+        The write is conditional on the etag of the listed Google Calendar version. If the event changed
+        since it was listed, it is fetched again and the patch is computed against the fresh version,
+        converted with `to_body_google`. Without it, or when the event changes again, the update is
+        left for the next run.
         """
 
-        request = self.calendar.events().update(
-            calendarId=event.database.calendar_id,
-            eventId=event.google_event_id,
-            body=self.event_to_request_body_notion(event),
+        for attempt in range(2):
+            patch = diff_request_body(body_google, body)
+
+            # Patch cannot remove fields, fall back to a full update
+            if patch is None:
+                request = self.calendar.events().update(
+                    calendarId=calendar_id, eventId=event_id, body=body
+                )
+                self.execute(request)
+                return
+
+            if not patch:
+                return
+
+            request = self.calendar.events().patch(
+                calendarId=calendar_id, eventId=event_id, body=patch
+            )
+            if etag:
+                request.headers["If-Match"] = etag
+
+            try:
+                self.execute(request)
+                return
+            except HttpError as e:
+                if e.resp.status != 412:
+                    raise
+
+            if to_body_google is None or attempt:
+                break
+
+            # Diff against the version that is in Google Calendar now
+            logger.info(
+                f"Event {event_id} changed in Google Calendar since it was listed, fetching it again."
+            )
+            resource = self.execute(
+                self.calendar.events().get(calendarId=calendar_id, eventId=event_id)
+            )
+            body_google, etag = to_body_google(resource), resource.get("etag")
+            if body_google is None:
+                break
+
+        logger.warning(
+            f"Event {event_id} keeps changing in Google Calendar, leaving the update for the next run."
         )
 
-        request.execute()
-        logger.info(f"Updating event '{event.title}' in Google Calendar.")
+    def update_event_from_notion(
+        self,
+        event: NotionCalendarEvent,
+        event_google: Optional[NotionCalendarEvent] = None,
+    ) -> None:
+        """
+        Update the given event in Google Calendar.
+        If its current Google Calendar version is given, only the changed fields are sent.
+        """
+
+        if event_google and self.settings.patch_updates:
+
+            def _to_body_google(resource: Mapping) -> Optional[Mapping]:
+                event_fresh = google_to_notion_calendar_event(
+                    resource, database=event.database
+                )
+                return (
+                    self.event_to_request_body_notion(event_fresh)
+                    if event_fresh
+                    else None
+                )
+
+            self.patch_event(
+                calendar_id=event.database.calendar_id,
+                event_id=event.google_event_id,
+                body=self.event_to_request_body_notion(event),
+                body_google=self.event_to_request_body_notion(event_google),
+                etag=event_google.google_etag,
+                to_body_google=_to_body_google,
+            )
+        else:
+            request = self.calendar.events().update(
+                calendarId=event.database.calendar_id,
+                eventId=event.google_event_id,
+                body=self.event_to_request_body_notion(event),
+            )
+            self.execute(request)
+
+        event_log.event(
+            logger, "update", event.title, "Updating event '%s' in Google Calendar."
+        )
 
-    def update_event_from_ical(self, event: ICalCalendarEvent) -> None:
+    def update_event_from_ical(
+        self,
+        event: ICalCalendarEvent,
+        event_google: Optional[ICalCalendarEvent] = None,
+    ) -> None:
         """
         Update the given event in Google Calendar based on the ICal event.
+        If its current Google Calendar version is given, only the changed fields are sent.
         """
 
-        request = self.calendar.events().update(
-            calendarId=event.icalendar.calendar_id,
-            eventId=event.google_event_id,
-            body=self.event_to_request_body_ical(event),
-        )
+        if event_google and self.settings.patch_updates:
+            body = self.event_to_request_body_ical(event)
+
+            def _comparable_body(
+                event_google: Optional[ICalCalendarEvent],
+            ) -> Optional[Mapping]:
+                if event_google is None:
+                    return None
+                body_google = self.event_to_request_body_ical(event_google)
+
+                # Google reorders the rrule string, compare the original rrule instead
+                if event.ical_rrule == event_google.ical_rrule:
+                    body_google.pop("recurrence", None)
+                    if "recurrence" in body:
+                        body_google["recurrence"] = body["recurrence"]
+
+                return body_google
 
-        request.execute()
-        logger.info(f"Updating event '{event.title}' in Google Calendar.")
+            self.patch_event(
+                calendar_id=event.icalendar.calendar_id,
+                event_id=event.google_event_id,
+                body=body,
+                body_google=_comparable_body(event_google),
+                etag=event_google.google_etag,
+                to_body_google=lambda resource: _comparable_body(
+                    google_to_ical_calendar_event(resource, icalendar=event.icalendar)
+                ),
+            )
+        else:
+            request = self.calendar.events().update(
+                calendarId=event.icalendar.calendar_id,
+                eventId=event.google_event_id,
+                body=self.event_to_request_body_ical(event),
+            )
+            self.execute(request)
+
+        event_log.event(
+            logger, "update", event.title, "Updating event '%s' in Google Calendar."
+        )
 
     def delete_event_notion(self, event: NotionCalendarEvent) -> None:
         """
@@ -202,8 +1004,10 @@ class GCalendar:
             eventId=event.google_event_id,
         )
 
-        request.execute()
-        logger.info(f"Deleted event '{event.title}' from Google Calendar.")
+        self.execute(request)
+        event_log.event(
+            logger, "delete", event.title, "Deleted event '%s' from Google Calendar."
+        )
 
     def delete_event_ical(self, event: ICalCalendarEvent) -> None:
         """
@@ -215,8 +1019,10 @@ class GCalendar:
             eventId=event.google_event_id,
         )
 
-        request.execute()
-        logger.info(f"Deleted event '{event.title}' from Google Calendar.")
+        self.execute(request)
+        event_log.event(
+            logger, "delete", event.title, "Deleted event '%s' from Google Calendar."
+        )
 
     def event_to_request_body(self, event: Type[CalendarEvent]) -> Mapping[str, Any]:
         """
@@ -316,6 +1122,191 @@ class GCalendar:
             },
         }
 
+    def watch_events(
+        self,
+        calendar_id: str,
+        channel_id: str,
+        address: str,
+        token: str,
+        ttl_seconds: int,
+    ) -> Mapping:
+        """
+        Open a channel that pushes a notification to the address on every change of the calendar.
+
+        :return: The channel, with its resource id and expiration in ms since the epoch.
+        """
+
+        request = self.calendar.events().watch(
+            calendarId=calendar_id,
+            body={
+                "id": channel_id,
+                "type": "web_hook",
+                "address": address,
+                "token": token,
+                "params": {"ttl": str(ttl_seconds)},
+            },
+        )
+
+        return self.execute(request)
+
+    def stop_channel(self, channel_id: str, resource_id: str) -> None:
+        """
+        Stop the notifications of a watch channel.
+        """
+
+        request = self.calendar.channels().stop(
+            body={"id": channel_id, "resourceId": resource_id}
+        )
+        self.execute(request)
+
     def __del__(self):
         if self.calendar:
             self.calendar.close()
+
+
+class SharedCredentials(Credentials):
+    """
+    Service account credentials shared by the transports of all threads, the token is refreshed by one
+    thread at a time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Reentrant, a refresh before a request calls refresh itself
+        self.refresh_lock = threading.RLock()
+
+    def before_request(
+        self, request: Any, method: str, url: str, headers: Dict[str, str]
+    ) -> None:
+        # Threads that waited for a refresh find a valid token, and do not refresh again
+        with self.refresh_lock:
+            super().before_request(request, method, url, headers)
+
+    def refresh(self, request: Any) -> None:
+        with self.refresh_lock:
+            super().refresh(request)
+
+
+class TracedHttp:
+    """
+    Http transport that records a span for every request it sends.
+
+    A new instance is used for every api call, so repeated requests of the call are its retries.
+    The other attributes are those of the wrapped transport.
+    """
+
+    def __init__(self, http: AuthorizedHttp):
+        self.http = http
+        self.nr_requests = 0
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body: Optional[Union[str, bytes]] = None,
+        *args,
+        **kwargs,
+    ):
+        with tracing.span(
+            "google.request",
+            "http",
+            method=method,
+            endpoint=urlsplit(uri).path,
+            retry=self.nr_requests,
+            bytes_sent=len(body or b""),
+        ) as current:
+            self.nr_requests += 1
+            response, content = self.http.request(uri, method, body, *args, **kwargs)
+            current.set(status=response.status, bytes_received=len(content or b""))
+
+        return response, content
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.http, name)
+
+
+def set_http_timeout(http: httplib2.Http, timeout: float) -> None:
+    """
+    Set the timeout of an httplib2 transport, including its open connections.
+    """
+
+    http.timeout = timeout
+    for connection in http.connections.values():
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+
+def diff_request_body(
+    body_old: Mapping[str, Any], body_new: Mapping[str, Any]
+) -> Optional[Mapping[str, Any]]:
+    """
+    Get the fields of the new request body that differ from the old one, as body for a patch request.
+    Shared extended properties are compared per key, patch requests merge them.
+
+    :return: None if the new body removes fields, which a patch cannot express.
+    """
+
+    patch = {}
+    for key, value in body_new.items():
+        if key == "extendedProperties":
+            shared_old = body_old.get(key, {}).get("shared", {})
+            shared_new = value.get("shared", {})
+            if shared_old.keys() - shared_new.keys():
+                return None
+
+            shared = {k: v for k, v in shared_new.items() if shared_old.get(k) != v}
+            if shared:
+                patch[key] = {"shared": shared}
+        elif body_old.get(key) != value:
+            patch[key] = value
+
+    if body_old.keys() - body_new.keys():
+        return None
+
+    return patch
+
+
+def deterministic_event_id(*parts: str) -> str:
+    """
+    Derive a stable Google Calendar event id from the given parts.
+
+    Event ids may only contain the lowercase base32hex characters a-v and 0-9,
+    see https://developers.google.com/calendar/api/v3/reference/events/insert
+    """
+
+    digest = hashlib.sha256("/".join(parts).encode("utf-8")).digest()
+
+    return base64.b32hexencode(digest).decode("ascii").rstrip("=").lower()
+
+
+def unique_events(events: Iterable[Mapping]) -> Iterator[Mapping]:
+    """
+    Yield only the first occurence of every event id.
+    """
+
+    event_ids = set()
+    for event in events:
+        if event["id"] in event_ids:
+            continue
+        event_ids.add(event["id"])
+
+        yield event
+
+
+def tag_items(tag: Any, items: Iterable[Any]) -> Iterator[Tuple[Any, Any]]:
+    """
+    Pair every item with the given tag.
+    """
+
+    for item in items:
+        yield tag, item
+
+
+def format_request_time(time: dt.DateTime) -> str:
+    """
+    Format a datetime as RFC3339 UTC timestamp for api requests.
+    """
+
+    return time.in_tz("UTC").naive().isoformat() + "Z"
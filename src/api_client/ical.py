@@ -1,18 +1,53 @@
+import hashlib
 import logging
-from functools import partial
-from typing import List
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
 
 import icalendar as ical
 import pendulum as dt
 import requests
 
-from src.common.utils import to_datetime
+from src.common.cassette import Cassette
+from src.common.deadline import Deadline
+from src.common.tracing import span, traced
+from src.common.state import read_state, write_state
+from src.common.utils import slugify
 from src.models.event import ICalCalendarEvent
 from src.models.ical import ICalendar
-from src.transformations.ical_to_calendar_event import ical_to_calendar_event
+from src.models.settings import Settings
+from src.models.sync_window import SyncWindow
+from src.transformations.ical_to_calendar_event import (
+    ICalEventRecord,
+    calendar_event_to_record,
+    get_recurrence_end,
+    ical_to_calendar_event,
+    record_from_json,
+    record_to_calendar_event,
+)
 
 logger = logging.getLogger(__name__)
 
+# Bump when the parsing logic or the record format changes, this invalidates all caches
+CACHE_VERSION = 3
+
+VEVENT_PATTERN = re.compile(
+    rb"^BEGIN:VEVENT\r?$.*?^END:VEVENT\r?$", re.MULTILINE | re.DOTALL | re.IGNORECASE
+)
+# Size of the chunks a feed is downloaded in, the deadline is checked between chunks
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+VTIMEZONE_PATTERN = re.compile(
+    rb"^BEGIN:VTIMEZONE\r?$.*?^END:VTIMEZONE\r?$",
+    re.MULTILINE | re.DOTALL | re.IGNORECASE,
+)
+
 
 class ICal:
     """
@@ -21,46 +56,245 @@ class ICal:
     Interfaces with a simple .ics link to get information from arbitrary shared calendars.
     """
 
-    def __init__(self) -> None:
-        pass
+    def __init__(
+        self, settings: Optional[Settings] = None, cassette: Optional[Cassette] = None
+    ) -> None:
+        self.settings = settings or Settings()
+
+        # Feeds are recorded to or replayed from the cassette, if any
+        self.session = cassette.session("ical") if cassette else requests
+
+        # Deadline of the current sync, caps the download of a feed
+        self.deadline = Deadline()
 
     def get_events(
         self,
         icalendar: ICalendar,
-        cutoff_days: int = 30,
-    ) -> List[ICalCalendarEvent]:
+        window: Optional[SyncWindow] = None,
+    ) -> Iterator[ICalCalendarEvent]:
         """
         Get all events in google calendar corresponsing to the given database.
-        Only events from the past "cutoff_days" nr of days are retured.
-        Only events from of "extend_days" nre of days in the future are retured.
+        Only recurring events and events that start in the sync window are retured,
+        the cold window of the ical calendar by default.
+
+        Events are yielded as they are parsed. With "prune_expired_series" the compact records are kept
+        until the whole feed is parsed, as a series is only known to be expired after its root is parsed.
         """
 
         logger.info("Getting all events from ICal.")
 
-        # Get request
-        response = requests.get(icalendar.url)
-
-        # Parse ical content
-        calendar: ical.Calendar = ical.Calendar.from_ical(response.content)
-        events: List[ical.Event] = []
-        for item in calendar.walk():
-            if item.name == "VEVENT":
-                event = ical.Event.from_ical(item.to_ical())
-
-                # Filter on date
-                date = to_datetime(event.get("DTSTART").dt)
-                time_min = dt.now().subtract(days=cutoff_days)
-                if date < time_min and not event.get("RRULE"):
-                    continue
-
-                events.append(event)
-
-        # Parse into calendar events
-        events = list(
-            filter(
-                lambda _: _ is not None,
-                map(partial(ical_to_calendar_event, icalendar=icalendar), events),
+        # Parse ical content, the raw feed is only held until it is split into events
+        records = traced(
+            self.parse_events(icalendar, self.download(icalendar.url)),
+            "ical.parse",
+            "parse",
+        )
+
+        # Filter on date
+        time_range = (window or icalendar.sync.cold).resolve()
+        time_min = time_range.time_min
+        records = (
+            record
+            for record in records
+            if record is not None
+            and time_range.contains(
+                dt.parse(record.start[0]), recurring=bool(record.ical_rrule)
             )
         )
 
-        return events
+        # Filter recurring events that ended before the sync window, and their exceptions.
+        # A margin keeps series that Google Calendar might still list around the window edge.
+        if self.settings.prune_expired_series:
+            records = list(records)
+            time_expired = time_min.subtract(days=1)
+            expired = {
+                record.ical_uid
+                for record in records
+                if record.ical_rrule
+                and record.recurrence_end
+                and dt.parse(record.recurrence_end[0]) < time_expired
+            }
+            records = (record for record in records if record.ical_uid not in expired)
+            if expired:
+                logger.info(f"Skipping {len(expired)} expired recurring events.")
+
+        for record in records:
+            yield record_to_calendar_event(record, icalendar)
+
+    def download(self, url: str) -> bytes:
+        """
+        Download a feed within the deadline.
+        The read timeout only bounds the wait for each chunk, a slow host that keeps sending is
+        stopped by checking the deadline between chunks.
+        """
+
+        # Feed urls often contain access tokens, only the host is traced
+        with span("ical.get", "http", endpoint=urlsplit(url).hostname) as current:
+            response = self.session.get(
+                url,
+                timeout=self.deadline.timeout(
+                    self.settings.connect_timeout_seconds,
+                    self.settings.read_timeout_seconds,
+                ),
+                stream=True,
+            )
+
+            chunks = []
+            with response:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    self.deadline.check()
+                    chunks.append(chunk)
+            content = b"".join(chunks)
+            current.set(status=response.status_code, bytes_received=len(content))
+
+        return content
+
+    def parse_events(
+        self, icalendar: ICalendar, content: bytes
+    ) -> Iterator[Optional[ICalEventRecord]]:
+        """
+        Parse every VEVENT of the raw feed to a compact record, None for invalid events, in feed order.
+        Records are yielded as they are parsed. The raw feed is dropped once it is split into blocks,
+        and every block once it is parsed.
+
+        Records are cached across runs by the hash of their raw VEVENT block, so only new or changed
+        blocks are parsed. Blocks that are no longer in the feed are evicted from the cache.
+        Timezone definitions of the feed are part of the cache key, as parsing depends on them.
+        The cache is written once all records are consumed, it holds the records of the whole feed.
+        """
+
+        blocks = VEVENT_PATTERN.findall(content)
+        timezones = VTIMEZONE_PATTERN.findall(content)
+        del content
+
+        register_timezones(timezones)
+
+        cache_name = f"ical/{slugify(icalendar.name)}"
+        cache_key = f"{CACHE_VERSION}:{hash_block(b''.join(timezones))}"
+        cache: Mapping[str, Optional[List]] = {}
+        if self.settings.ical_parse_cache:
+            state = read_state(cache_name, default={})
+            if state.get("key") == cache_key:
+                cache = state.get("records", {})
+
+        # Only the new or changed blocks are kept, to be parsed
+        block_hashes = [hash_block(block) for block in blocks]
+        blocks = deque(
+            block
+            for block, block_hash in zip(blocks, block_hashes)
+            if block_hash not in cache
+        )
+        nr_parsed = len(blocks)
+        records_parsed = self.parse_blocks(blocks, timezones, icalendar)
+
+        # Restore cached records, in between the parsed ones
+        cache_new: Dict[str, Optional[ICalEventRecord]] = {}
+        for block_hash in block_hashes:
+            if block_hash in cache:
+                record = (
+                    record_from_json(cache[block_hash]) if cache[block_hash] else None
+                )
+            else:
+                record = next(records_parsed)
+            if self.settings.ical_parse_cache:
+                cache_new[block_hash] = record
+            yield record
+
+        logger.info(f"Parsed {nr_parsed} of {len(block_hashes)} events from ICal.")
+
+        if self.settings.ical_parse_cache:
+            write_state(cache_name, {"key": cache_key, "records": cache_new})
+
+    def parse_blocks(
+        self, blocks: Deque[bytes], timezones: List[bytes], icalendar: ICalendar
+    ) -> Iterator[Optional[ICalEventRecord]]:
+        """
+        Parse raw VEVENT blocks to records, in order. Blocks are taken from the queue as they are parsed.
+
+        With more than one "ical_parse_workers" and above "ical_parallel_threshold" blocks, chunks of
+        blocks are parsed in a process pool. Workers are spawned, so they do not inherit the threads and
+        locks of the sync, and return the compact records, which are cheap to pickle, together with the
+        parse errors. The errors are logged here, so both ways log the same warnings.
+        """
+
+        nr_workers = self.settings.ical_parse_workers or os.cpu_count() or 1
+        if len(blocks) < self.settings.ical_parallel_threshold or nr_workers <= 1:
+            while blocks:
+                yield log_parse_error(*parse_block(blocks.popleft(), icalendar))
+            return
+
+        chunk_size = math.ceil(len(blocks) / (nr_workers * 4))
+        chunks = [
+            [blocks.popleft() for _ in range(min(chunk_size, len(blocks)))]
+            for _ in range(math.ceil(len(blocks) / chunk_size))
+        ]
+
+        logger.info(
+            f"Parsing {sum(map(len, chunks))} events from ICal in {nr_workers} processes."
+        )
+
+        with ProcessPoolExecutor(
+            max_workers=nr_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=register_timezones,
+            initargs=(timezones,),
+        ) as executor:
+            results = executor.map(parse_chunk, chunks, repeat(icalendar))
+            del chunks
+
+            for results_chunk in results:
+                for record, error in results_chunk:
+                    yield log_parse_error(record, error)
+
+
+def register_timezones(timezones: List[bytes]) -> None:
+    """
+    Register custom timezone definitions of a feed, icalendar caches them when they are parsed.
+    """
+
+    for timezone in timezones:
+        ical.Timezone.from_ical(timezone)
+
+
+def hash_block(block: bytes) -> str:
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+def parse_block(
+    block: bytes, icalendar: ICalendar
+) -> Tuple[Optional[ICalEventRecord], Optional[str]]:
+    """
+    Parse a single raw VEVENT block to a compact record.
+
+    :return: The record, None for an invalid event, and the error if the event could not be parsed.
+    """
+
+    try:
+        event_ical = ical.Event.from_ical(block)
+        event = ical_to_calendar_event(event_ical, icalendar)
+    except Exception as e:
+        return None, str(e)
+
+    if event is None:
+        return None, None
+
+    return calendar_event_to_record(event, get_recurrence_end(event_ical)), None
+
+
+def parse_chunk(
+    blocks: List[bytes], icalendar: ICalendar
+) -> List[Tuple[Optional[ICalEventRecord], Optional[str]]]:
+    """
+    Parse a chunk of raw VEVENT blocks, runs in a worker process.
+    """
+
+    return [parse_block(block, icalendar) for block in blocks]
+
+
+def log_parse_error(
+    record: Optional[ICalEventRecord], error: Optional[str]
+) -> Optional[ICalEventRecord]:
+    if error is not None:
+        logger.warning(f"An event from ical could not be parsed: {error}.")
+
+    return record
@@ -1,17 +1,21 @@
 import json
 import logging
 import urllib.parse
-from functools import partial
-from itertools import takewhile
+from collections import defaultdict
+from itertools import chain, takewhile
 from pathlib import Path
-from typing import Any, Iterator, List, Mapping, Optional
+from typing import Any, Iterator, List, Mapping, Optional, Tuple
 
-import pendulum as dt
 import requests
 
+from src.common.cassette import Cassette
+from src.common.deadline import Deadline
+from src.common.tracing import span
 from src.models.database import Database, DatabaseName, WorkspaceName
 from src.models.event import CalendarEvent, NotionCalendarEvent
-from src.transformations.notion_to_calendar_event import page_to_calendar_event
+from src.models.settings import Settings
+from src.models.sync_window import SyncWindow
+from src.transformations.notion_to_calendar_event import PageTransformer
 
 logger = logging.getLogger(__name__)
 
@@ -28,14 +32,28 @@ class Notion:
     Versioning: https://developers.notion.com/reference/changes-by-version
     """
 
-    def __init__(self):
+    def __init__(
+        self, settings: Optional[Settings] = None, cassette: Optional[Cassette] = None
+    ):
+        self.settings = settings or Settings()
         self.base_url = BASE_URL.rstrip("/")
         self.version = NOTION_VERSION
 
+        # Requests are recorded to or replayed from the cassette, if any
+        self.session = cassette.session("notion") if cassette else requests
+
+        # A replay needs no credentials
         self.auth_headers: Mapping[WorkspaceName, Mapping[str, str]]
-        self.init_integration_tokens_per_workspace()
+        if cassette and cassette.replaying:
+            self.auth_headers = defaultdict(lambda: {"Notion-Version": self.version})
+        else:
+            self.init_integration_tokens_per_workspace()
 
         self.database_objects: Mapping[DatabaseName, Mapping] = {}
+        self.page_transformers: Mapping[DatabaseName, PageTransformer] = {}
+
+        # Deadline of the current sync, caps the timeout of every request
+        self.deadline = Deadline()
 
     def init_integration_tokens_per_workspace(self):
         """
@@ -66,10 +84,15 @@ class Notion:
                 f"Workspace {database.workspace} does not have an integration token configured."
             )
 
-        response = requests.get(
-            f"{self.base_url}/{path.lstrip('/')}",
-            headers=auth_headers,
-        )
+        with span("notion.get", "http", endpoint=path) as current:
+            response = self.session.get(
+                f"{self.base_url}/{path.lstrip('/')}",
+                headers=auth_headers,
+                timeout=self.timeout(),
+            )
+            current.set(
+                status=response.status_code, bytes_received=len(response.content)
+            )
 
         if not 200 <= response.status_code <= 299:
             raise Exception(f"Get request failed: {response.text}.")
@@ -94,21 +117,38 @@ class Notion:
                 f"Workspace {database.workspace} does not have an integration token configured."
             )
 
-        response = requests.post(
-            f"{self.base_url}/{path.lstrip('/')}",
-            json=body,
-            params=query,
-            headers={
-                **auth_headers,
-                "content-type": "application/json",
-            },
-        )
+        with span("notion.post", "http", endpoint=path) as current:
+            response = self.session.post(
+                f"{self.base_url}/{path.lstrip('/')}",
+                json=body,
+                params=query,
+                headers={
+                    **auth_headers,
+                    "content-type": "application/json",
+                },
+                timeout=self.timeout(),
+            )
+            if current.recording:
+                current.set(
+                    status=response.status_code,
+                    bytes_sent=len(response.request.body or b""),
+                    bytes_received=len(response.content),
+                )
 
         if not 200 <= response.status_code <= 299:
             raise Exception(f"Post request failed: {response.text}.")
 
         return response.json()
 
+    def timeout(self) -> Tuple[float, float]:
+        """
+        Connect and read timeout of the next request.
+        """
+
+        return self.deadline.timeout(
+            self.settings.connect_timeout_seconds, self.settings.read_timeout_seconds
+        )
+
     def post_paginated(
         self,
         path: str,
@@ -118,23 +158,41 @@ class Notion:
         start_cursor: Optional[str] = None,
     ) -> Iterator[Any]:
         """
-        Post request with recursive pagination.
+        Post request with pagination.
+        Results are yielded page by page as they arrive, so the next page is only requested when needed.
         """
 
-        body = {
-            **body,
-            **({"start_cursor": start_cursor} if start_cursor else {}),
-            "page_size": 100,
-        }
+        for results in self.post_paginated_batches(
+            path, body, database, query, start_cursor
+        ):
+            yield from results
+
+    def post_paginated_batches(
+        self,
+        path: str,
+        body: Mapping[str, Any],
+        database: Database,
+        query: Optional[Mapping[str, Any]] = None,
+        start_cursor: Optional[str] = None,
+    ) -> Iterator[List[Any]]:
+        """
+        Post request with pagination, yielding the results of each response as one batch.
+        """
 
-        response = self.post(path, body, database, query)
+        while True:
+            body = {
+                **body,
+                **({"start_cursor": start_cursor} if start_cursor else {}),
+                "page_size": 100,
+            }
 
-        next_cursor = response.get("next_cursor")
-        if next_cursor:
-            logger.info(f"Performing recursive paginated request")
-            yield from self.post_paginated(path, body, database, query, next_cursor)
+            response = self.post(path, body, database, query)
+            yield response["results"]
 
-        yield from response["results"]
+            start_cursor = response.get("next_cursor")
+            if not start_cursor:
+                break
+            logger.info(f"Performing paginated request")
 
     def get_database(self, database: Database, ignore_cache: bool = False) -> Mapping:
         """
@@ -149,14 +207,25 @@ class Notion:
 
         return response
 
+    def get_page_transformer(self, database: Database) -> PageTransformer:
+        """
+        Get the page transformer of a database, it is created once and reused for every query.
+        """
+
+        if database.name not in self.page_transformers:
+            self.page_transformers[database.name] = PageTransformer(database)
+
+        return self.page_transformers[database.name]
+
     def get_events(
         self,
         database: Database,
-        cutoff_days: int = 30,
-    ) -> List[NotionCalendarEvent]:
+        window: Optional[SyncWindow] = None,
+    ) -> Iterator[NotionCalendarEvent]:
         """
         Get all pages in database that have a set date property as calendar events.
-        Only events from the past "cutoff_days" nr of days are retured.
+        Only events that start in the sync window are retured, the cold window of the database by default.
+        Pages are streamed, later pages are only requested while the events are consumed.
         """
 
         logger.info("Getting all pages from Notion.")
@@ -172,27 +241,42 @@ class Notion:
                 urllib.parse.unquote(database_object["properties"][property]["id"])
             )
 
+        # The date filter is by day, the exact range is filtered on the events
+        time_range = (window or database.sync.cold).resolve()
+        date_filters = [
+            {"is_not_empty": True},
+            {"on_or_after": time_range.time_min.to_date_string()},
+        ]
+        if time_range.time_max:
+            date_filters.append(
+                {"on_or_before": time_range.time_max.add(days=1).to_date_string()}
+            )
+
         body = {
             "filter": {
-                "property": database.date_property,
-                "date": {"is_not_empty": True},
+                "and": [
+                    {"property": database.date_property, "date": date_filter}
+                    for date_filter in date_filters
+                ]
             },
             "sorts": [{"property": database.date_property, "direction": "descending"}],
         }
         query = {"filter_properties": property_ids}
 
-        response = self.post_paginated(
+        batches = self.post_paginated_batches(
             f"databases/{database.id}/query",
             body,
             database,
             query,
         )
 
-        events = map(partial(page_to_calendar_event, database=database), response)
+        # Convert each response of up to 100 pages in one go
+        events = chain.from_iterable(map(self.get_page_transformer(database), batches))
 
         def _date_cutoff(event: CalendarEvent):
-            return event.date.start >= dt.now().subtract(days=cutoff_days)
+            return event.date.start >= time_range.time_min
 
-        events = list(takewhile(_date_cutoff, events))
-
-        return events
+        return filter(
+            lambda event: time_range.contains(event.date.start),
+            takewhile(_date_cutoff, events),
+        )
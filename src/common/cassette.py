@@ -0,0 +1,326 @@
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+from urllib.parse import unquote, urlsplit
+
+import httplib2
+import pendulum as dt
+import requests
+from googleapiclient.errors import HttpError
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from src.common import state
+
+logger = logging.getLogger(__name__)
+
+# Bump when the format of recorded interactions changes
+CASSETTE_VERSION = 1
+
+# Timestamps in requests depend on the time of the run, they are left out when matching requests
+TIME_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}(?:T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?)?"
+)
+EMAIL_PATTERN = re.compile(rb"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+
+class CassetteMiss(Exception):
+    """
+    A request was not recorded in the cassette.
+    """
+
+
+class Cassette:
+    """
+    Recorded responses of the Notion, Google Calendar and ICal clients, to run a sync offline.
+
+    While recording, every response a client receives is kept together with its latency. A replay
+    answers the same requests from the cassette, in the recorded order per request, and waits for the
+    recorded latency times the latency factor.
+
+    Cassettes are sanitized: auth headers are never recorded, ical feed urls are only kept as a hash
+    and email addresses are replaced by stable placeholders. Event titles, descriptions and dates are
+    kept as they are, so a cassette contains the private content of the calendars.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        replaying: bool = False,
+        latency_factor: float = 1.0,
+    ):
+        self.path = path
+        self.replaying = replaying
+        self.latency_factor = latency_factor
+
+        # Start of the recorded run and the tier every source was synced in
+        self.time: Optional[dt.DateTime] = None
+        self.tiers: Dict[str, str] = {}
+
+        self.interactions: List[Dict[str, Any]] = []
+        self.replays: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path, latency_factor: float = 1.0) -> "Cassette":
+        cassette = cls(path, replaying=True, latency_factor=latency_factor)
+
+        with gzip.open(path, "rt") as f:
+            header = json.loads(f.readline())
+            if header["version"] != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version {header['version']}.")
+            cassette.time = dt.parse(header["time"])
+            cassette.tiers = header["tiers"]
+
+            for line in f:
+                interaction = json.loads(line)
+                cassette.replays[interaction["key"]].append(interaction)
+
+        logger.info(
+            f"Replaying {sum(map(len, cassette.replays.values()))} responses from {path}."
+        )
+
+        return cassette
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(self.path, "wt") as f:
+            header = {
+                "version": CASSETTE_VERSION,
+                "time": self.time.isoformat() if self.time else None,
+                "tiers": self.tiers,
+            }
+            f.write(json.dumps(header) + "\n")
+            for interaction in self.interactions:
+                f.write(json.dumps(interaction) + "\n")
+
+        logger.info(f"Recorded {len(self.interactions)} responses to {self.path}.")
+
+    def record(
+        self,
+        client: str,
+        method: str,
+        url: str,
+        body: Union[str, bytes, None],
+        status: int,
+        content: bytes,
+        latency: float,
+    ) -> None:
+        interaction = {
+            "key": interaction_key(client, method, url, body),
+            "client": client,
+            "method": method,
+            "path": sanitize(describe_url(client, url).encode()).decode(),
+            "status": status,
+            "content": base64.b64encode(sanitize(content)).decode("ascii"),
+            "latency": latency,
+        }
+        with self.lock:
+            self.interactions.append(interaction)
+
+    def replay(
+        self, client: str, method: str, url: str, body: Union[str, bytes, None]
+    ) -> Tuple[int, bytes]:
+        """
+        Answer a request from the cassette after the scaled recorded latency.
+
+        :return: The status and content of the response.
+        """
+
+        key = interaction_key(client, method, url, body)
+        with self.lock:
+            interactions = self.replays.get(key)
+            if not interactions:
+                raise CassetteMiss(
+                    f"No recorded response for {client} {method} {describe_url(client, url)}."
+                )
+            interaction = interactions.popleft()
+
+        if self.latency_factor:
+            time.sleep(interaction["latency"] * self.latency_factor)
+
+        return interaction["status"], base64.b64decode(interaction["content"])
+
+    def session(self, client: str) -> requests.Session:
+        """
+        Requests session that records or replays the requests of a client.
+        """
+
+        session = requests.Session()
+        adapter = (
+            ReplayAdapter(self, client)
+            if self.replaying
+            else RecordingAdapter(self, client)
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        return session
+
+    def execute(self, client: str, request: Any, send) -> Mapping:
+        """
+        Execute a Google api request, or answer it from the cassette.
+        Error responses are raised as HttpError, like the api client does.
+        """
+
+        if self.replaying:
+            status, content = self.replay(
+                client, request.method, request.uri, request.body
+            )
+            if status >= 300:
+                raise HttpError(httplib2.Response({"status": status}), content)
+            return json.loads(content) if content else {}
+
+        start = time.perf_counter()
+        try:
+            response = send()
+        except HttpError as e:
+            self.record_google(client, request, None, e, time.perf_counter() - start)
+            raise
+        self.record_google(client, request, response, None, time.perf_counter() - start)
+
+        return response
+
+    def record_google(
+        self,
+        client: str,
+        request: Any,
+        response: Optional[Mapping],
+        exception: Optional[Exception],
+        latency: float,
+    ) -> None:
+        if isinstance(exception, HttpError):
+            status, content = exception.resp.status, exception.content or b""
+        elif exception is not None:
+            return
+        else:
+            status, content = 200, json.dumps(response).encode() if response else b""
+
+        self.record(
+            client, request.method, request.uri, request.body, status, content, latency
+        )
+
+    @contextmanager
+    def offline(self) -> Iterator[None]:
+        """
+        Replay at the recorded time, with state that is isolated from the state of real runs.
+        """
+
+        state_path = state.STATE_PATH
+        with tempfile.TemporaryDirectory(prefix="notion-google-calendar-") as path:
+            state.STATE_PATH = Path(path)
+            dt.set_test_now(self.time)
+            try:
+                yield
+            finally:
+                dt.set_test_now()
+                state.STATE_PATH = state_path
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    Transport adapter that records every response it receives.
+    """
+
+    def __init__(self, cassette: Cassette, client: str):
+        super().__init__()
+        self.cassette = cassette
+        self.client = client
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+
+        # Reading the content here keeps streamed responses readable by the caller
+        self.cassette.record(
+            self.client,
+            request.method,
+            request.url,
+            request.body,
+            response.status_code,
+            response.content,
+            time.perf_counter() - start,
+        )
+
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Transport adapter that answers every request from the cassette.
+    """
+
+    def __init__(self, cassette: Cassette, client: str):
+        super().__init__()
+        self.cassette = cassette
+        self.client = client
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        status, content = self.cassette.replay(
+            self.client, request.method, request.url, request.body
+        )
+
+        response = requests.Response()
+        response.status_code = status
+        response._content = content
+        response._content_consumed = True
+        response.headers = CaseInsensitiveDict()
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.connection = self
+
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+def describe_url(client: str, url: str) -> str:
+    """
+    Url without the parts that can contain secrets, ical feed urls often contain an access token.
+    """
+
+    if client == "ical":
+        return "feed-" + hashlib.sha256(url.encode()).hexdigest()[:16]
+
+    parts = urlsplit(unquote(url))
+
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+def interaction_key(
+    client: str, method: str, url: str, body: Union[str, bytes, None]
+) -> str:
+    """
+    Key to match a request with a recorded one, independent of the time of the run.
+    """
+
+    if isinstance(body, str):
+        body = body.encode()
+    request = f"{client} {method} {describe_url(client, url)} ".encode() + (body or b"")
+    request = TIME_PATTERN.sub("<time>", sanitize(request).decode(errors="replace"))
+
+    return hashlib.sha256(request.encode()).hexdigest()
+
+
+def sanitize(content: bytes) -> bytes:
+    """
+    Replace email addresses by a placeholder that is stable for the same address.
+    """
+
+    return EMAIL_PATTERN.sub(
+        lambda match: b"user-%s@example.com"
+        % hashlib.sha256(match.group()).hexdigest()[:8].encode(),
+        content,
+    )
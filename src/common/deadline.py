@@ -0,0 +1,89 @@
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from src.common.state import read_state, write_state
+
+STATE_NAME = "deferred_sources"
+
+Source = TypeVar("Source")
+
+
+class BudgetExceeded(Exception):
+    """
+    The time budget of a run or source ran out.
+    """
+
+
+class Deadline:
+    """
+    Point in time by which work has to be done, unbounded when no budget is given.
+
+    Http calls turn the remaining time into their timeouts, so a slow host cannot hold a run past its
+    budget. Deadlines are monotonic and can be nested, a nested deadline never outlives its parent.
+    """
+
+    def __init__(
+        self, budget_seconds: Optional[float] = None, parent: "Deadline" = None
+    ):
+        expires_at = (
+            time.monotonic() + budget_seconds if budget_seconds is not None else None
+        )
+        if parent is not None and parent.expires_at is not None:
+            expires_at = (
+                min(expires_at, parent.expires_at)
+                if expires_at is not None
+                else parent.expires_at
+            )
+        self.expires_at = expires_at
+
+    def remaining(self) -> Optional[float]:
+        """
+        Seconds left, None when unbounded.
+        """
+
+        if self.expires_at is None:
+            return None
+
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() == 0
+
+    def check(self) -> None:
+        """
+        Raise when the deadline has passed.
+        """
+
+        if self.expired():
+            raise BudgetExceeded("Time budget exceeded.")
+
+    def timeout(self, connect: float, read: float) -> Tuple[float, float]:
+        """
+        Connect and read timeout for an http call, capped by the remaining time.
+        """
+
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return connect, read
+
+        return min(connect, remaining), min(read, remaining)
+
+
+def order_deferred_first(sources: Sequence[Source]) -> List[Source]:
+    """
+    Order the sources that ran out of budget in an earlier run first, the order is kept otherwise.
+    """
+
+    deferred = set(read_state(STATE_NAME, []))
+
+    return sorted(sources, key=lambda source: source.name not in deferred)
+
+
+def record_deferred(synced: Iterable[str], deferred: Iterable[str]) -> None:
+    """
+    Remember which sources ran out of budget, sources that were synced completely are forgotten.
+    """
+
+    names = (set(read_state(STATE_NAME, [])) - set(synced)) | set(deferred)
+    write_state(STATE_NAME, sorted(names))
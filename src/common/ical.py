@@ -1,21 +1,9 @@
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Mapping, Optional, Tuple
 
+from src.common.spill import SpillBuffer
 from src.models.event import ICalCalendarEvent
 
 
-def get_events_by_ical_uid(
-    events: List[ICalCalendarEvent], ical_uid: str
-) -> ICalCalendarEvent:
-    """
-    Get event by ical uid.
-
-    If multiple events exist with the same uid, this means there is a recurring event with an exception.
-    In that case, explicitly return the original event.
-    """
-
-    return [event for event in events if event.ical_uid == ical_uid]
-
-
 def are_events_equivalent(
     event_ical: ICalCalendarEvent,
     event_google: ICalCalendarEvent,
@@ -38,32 +26,35 @@ def are_events_equivalent(
     return True
 
 
-def map_events(
-    events_ical: List[ICalCalendarEvent],
-    events_google: List[ICalCalendarEvent],
-) -> List[Tuple[List[ICalCalendarEvent], List[ICalCalendarEvent]]]:
+def group_events(
+    events: Iterable[ICalCalendarEvent], spill_threshold: Optional[int] = None
+) -> SpillBuffer:
     """
-    Map events from ICal to events from Google Calendar, based on the ical uid.
-    If multiple events have the same uid, this means there is a recurring event with an exception.
+    Group events by their ical uid.
+    Groups above the spill threshold are kept on disk.
     """
 
-    events = []
+    groups = SpillBuffer(spill_threshold)
+    for event in events:
+        groups.append(event.ical_uid, event)
 
-    ids_ical = [_.ical_uid for _ in events_ical]
-    ids_google = [_.ical_uid for _ in events_google]
-    ids_all = set(ids_ical).union(ids_google)
+    return groups
 
-    events.extend(
-        [
-            (
-                get_events_by_ical_uid(events_ical, ical_uid),
-                get_events_by_ical_uid(events_google, ical_uid),
-            )
-            for ical_uid in ids_all
-        ]
-    )
 
-    return events
+def map_groups(
+    groups_ical: Mapping[str, List[ICalCalendarEvent]],
+    groups_google: Mapping[str, List[ICalCalendarEvent]],
+) -> Iterator[Tuple[List[ICalCalendarEvent], List[ICalCalendarEvent]]]:
+    """
+    Map events from ICal to events from Google Calendar that are grouped by ical uid.
+    """
+
+    for ical_uid in groups_ical:
+        yield groups_ical[ical_uid], groups_google.get(ical_uid, [])
+
+    for ical_uid in groups_google:
+        if ical_uid not in groups_ical:
+            yield [], groups_google[ical_uid]
 
 
 def get_recurring_root(
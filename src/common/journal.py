@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+from typing import IO, Dict, Hashable, Iterable, Optional, Set
+
+from src.common import state
+from src.common.utils import slugify
+from src.models.plan import Mutation
+
+logger = logging.getLogger(__name__)
+
+# Journals are kept next to the other state, one file per source
+JOURNAL_DIRECTORY = "journal"
+
+
+class Journal:
+    """
+    Write-ahead journal of the creates of one source.
+
+    Every create is journaled as planned before it is executed and as done once Google Calendar
+    confirmed it, together with the id of the created event. The journal is removed when the sync of the
+    source completes, a journal that is still there at the start of a sync belongs to an interrupted run.
+
+    Only creates are deduplicated, a resumed run plans its updates and deletes from a fresh listing
+    of Google Calendar, so those are not journaled.
+
+    Lines are flushed as they are written, so they survive a crash of the run, but not of the os.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.path = state.STATE_PATH / JOURNAL_DIRECTORY / f"{slugify(source)}.jsonl"
+
+        # Google Calendar ids of the events that interrupted runs created
+        self.created: Dict[str, str] = {}
+
+        # Creates that interrupted runs started but that were never confirmed
+        self.unconfirmed: Set[str] = set()
+
+        self.nr_recovered = 0
+        self.recover()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file: IO[str] = open(self.path, "a")
+
+    def recover(self) -> None:
+        """
+        Read the journal of interrupted runs.
+        """
+
+        if not self.path.exists():
+            return
+
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line of a crashed run can be incomplete
+                    continue
+
+                self.nr_recovered += 1
+                if entry["op"] == "planned":
+                    self.unconfirmed.add(entry["key"])
+                elif entry["op"] == "done":
+                    self.unconfirmed.discard(entry["key"])
+                    self.created[entry["key"]] = entry["google_event_id"]
+
+        if not self.nr_recovered:
+            return
+
+        logger.warning(
+            f"Resuming the interrupted sync of {self.source}: {len(self.created)} events were created, "
+            f"{len(self.unconfirmed)} creates are unconfirmed."
+        )
+
+    def planned(self, mutations: Iterable[Mutation]) -> None:
+        self.write("planned", mutations)
+
+    def done(self, mutation: Mutation) -> None:
+        self.write("done", [mutation])
+        if mutation.kind == "create":
+            key = journal_key(mutation.key)
+            self.unconfirmed.discard(key)
+            self.created[key] = mutation.event.google_event_id
+
+    def write(self, op: str, mutations: Iterable[Mutation]) -> None:
+        creates = [mutation for mutation in mutations if mutation.kind == "create"]
+        if not creates:
+            return
+
+        for mutation in creates:
+            entry = {
+                "op": op,
+                "key": journal_key(mutation.key),
+                "google_event_id": mutation.event.google_event_id or None,
+            }
+            self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+
+    def created_event_id(self, mutation: Mutation) -> Optional[str]:
+        """
+        Google Calendar id of the event that an interrupted run created for the given create.
+        """
+
+        return self.created.get(journal_key(mutation.key))
+
+    def is_unconfirmed(self, mutation: Mutation) -> bool:
+        """
+        Check if an interrupted run may have created the event without confirming it.
+        """
+
+        return journal_key(mutation.key) in self.unconfirmed
+
+    def close(self) -> None:
+        """
+        Close the journal and keep it for the next run, e.g. when the sync of the source failed.
+        """
+
+        self.file.close()
+
+    def complete(self) -> None:
+        """
+        Remove the journal once the sync of the source completed.
+        """
+
+        self.close()
+        os.remove(self.path)
+
+
+def journal_key(key: Hashable) -> str:
+    return json.dumps(key, default=str)
@@ -0,0 +1,114 @@
+import atexit
+import logging
+import queue
+import random
+import threading
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s %(levelname)-8s %(message)s"
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the writer thread.
+    The queue never leaves the process, records are queued as they are.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class StoppableQueueListener(QueueListener):
+    """
+    Queue listener that can be stopped more than once, e.g. explicitly and again at exit.
+    """
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            super().stop()
+
+
+def setup_logging(
+    level: int = logging.INFO, handler: Optional[logging.Handler] = None
+) -> Optional[StoppableQueueListener]:
+    """
+    Log through an unbounded queue, records are formatted and written by a background thread so
+    logging never blocks the sync threads. Records that are still queued are written at exit.
+
+    :return: The listener that writes the records, None when logging was already set up.
+    """
+
+    root = logging.getLogger()
+    if any(isinstance(_, DeferredQueueHandler) for _ in root.handlers):
+        return None
+
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    records = queue.SimpleQueue()
+    listener = StoppableQueueListener(records, handler, respect_handler_level=True)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+
+    return listener
+
+
+class EventLog:
+    """
+    Per-event lines of the mutations of a run.
+
+    Every mutation is counted per kind, for a summary per source, but only a sample of them is logged
+    line by line. Lines carry the source, kind and title of the event as structured record attributes.
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        self.sample_rate = sample_rate
+        self.counts: Counter = Counter()
+        self.nr_logged = 0
+        self.lock = threading.Lock()
+
+    def event(
+        self, event_logger: logging.Logger, kind: str, title: str, message: str
+    ) -> None:
+        """
+        Count a mutation and log a sample of them, the message is formatted with the title.
+        """
+
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        with self.lock:
+            self.counts[kind] += 1
+            self.nr_logged += sampled
+
+        if sampled:
+            event_logger.info(
+                message, title, extra={"mutation": kind, "event_title": title}
+            )
+
+    def summary(self, source: str) -> None:
+        """
+        Log the nr of mutations of the source per kind, and start counting the next source.
+        """
+
+        with self.lock:
+            counts, nr_logged = self.counts, self.nr_logged
+            self.counts, self.nr_logged = Counter(), 0
+
+        total = sum(counts.values())
+        if not total:
+            return
+
+        kinds = ", ".join(f"{kind} {count}" for kind, count in sorted(counts.items()))
+        logger.info(
+            f"Mutations of {source}: {kinds} ({nr_logged} of {total} logged).",
+            extra={"source": source, "mutations": dict(counts)},
+        )
+
+
+event_log = EventLog()
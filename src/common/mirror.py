@@ -0,0 +1,152 @@
+import bisect
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+from urllib.parse import unquote, urlsplit
+
+import pendulum as dt
+
+from src.common.state import read_state, write_state
+from src.common.utils import slugify
+
+logger = logging.getLogger(__name__)
+
+# Api methods of which the response is the new version of the written event
+WRITE_METHODS = {
+    "calendar.events.insert",
+    "calendar.events.update",
+    "calendar.events.patch",
+}
+DELETE_METHOD = "calendar.events.delete"
+
+
+class CalendarMirror:
+    """
+    Local copy of the events of a Google calendar, by event id.
+    Recurring events are kept as their root event and modified instances, as listed without singleEvents.
+    """
+
+    def __init__(self, calendar_id: str):
+        self.calendar_id = calendar_id
+        self.state_name = f"mirror/{slugify(calendar_id)}"
+
+        state = read_state(self.state_name, {})
+        self.events: Dict[str, Mapping[str, Any]] = state.get("events", {})
+
+        # Time of the last reconciliation, None until the mirror was filled from a full listing
+        self.reconciled_at: Optional[str] = state.get("reconciled_at")
+
+        # Changes that are not saved yet
+        self.changed = False
+
+    def put(self, event: Mapping[str, Any]) -> None:
+        if event.get("status") == "cancelled":
+            self.events.pop(event["id"], None)
+        else:
+            self.events[event["id"]] = event
+        self.changed = True
+
+    def remove(self, event_id: str) -> None:
+        self.events.pop(event_id, None)
+        self.changed = True
+
+    def mark_reconciled(self) -> None:
+        self.reconciled_at = dt.now().isoformat()
+        self.changed = True
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+
+        write_state(
+            self.state_name,
+            {"reconciled_at": self.reconciled_at, "events": self.events},
+        )
+        self.changed = False
+
+
+class MirrorStore:
+    """
+    Mirrors of all Google calendars that are written to or reconciled during a run, loaded on first use.
+    """
+
+    def __init__(self):
+        self.mirrors: Dict[str, CalendarMirror] = {}
+        self.lock = threading.Lock()
+
+    def get(self, calendar_id: str) -> CalendarMirror:
+        with self.lock:
+            if calendar_id not in self.mirrors:
+                self.mirrors[calendar_id] = CalendarMirror(calendar_id)
+
+            return self.mirrors[calendar_id]
+
+    def record_write(self, request: Any, response: Optional[Mapping]) -> None:
+        """
+        Apply a write of the sync to the mirror of its calendar, other requests are ignored.
+        """
+
+        method_id = getattr(request, "methodId", None)
+        if method_id not in WRITE_METHODS and method_id != DELETE_METHOD:
+            return
+
+        # Path: /calendar/v3/calendars/<calendar id>/events[/<event id>]
+        parts = urlsplit(request.uri).path.split("/")
+        calendar_id = unquote(parts[parts.index("calendars") + 1])
+        mirror = self.get(calendar_id)
+        with self.lock:
+            if method_id == DELETE_METHOD:
+                mirror.remove(unquote(parts[-1]))
+            elif response:
+                mirror.put(response)
+
+    def save(self) -> None:
+        """
+        Save the mirrors that changed since they were last saved.
+        """
+
+        with self.lock:
+            for mirror in self.mirrors.values():
+                mirror.save()
+
+
+def event_start(event: Mapping[str, Any]) -> float:
+    """
+    Start of a Google Calendar event as timestamp, all-day events start at midnight UTC.
+    """
+
+    start = event.get("start", {})
+
+    return dt.parse(start.get("dateTime") or start["date"]).timestamp()
+
+
+def bucket_events(
+    events: Iterable[Mapping[str, Any]], bounds: List[float]
+) -> List[Dict[str, str]]:
+    """
+    Etag per event id of the events that start in each range between consecutive bounds.
+    Events that start outside the bounds are left out.
+    """
+
+    buckets: List[Dict[str, str]] = [{} for _ in bounds[1:]]
+    for event in events:
+        if "start" not in event:
+            continue
+        i = bisect.bisect_right(bounds, event_start(event)) - 1
+        if 0 <= i < len(buckets):
+            buckets[i][event["id"]] = event.get("etag", "")
+
+    return buckets
+
+
+def range_digest(etags: Mapping[str, str]) -> str:
+    """
+    Digest of the ids and etags of the events in a range, independent of their order.
+    """
+
+    digest = hashlib.sha256()
+    for event_id in sorted(etags):
+        digest.update(f"{event_id}:{etags[event_id]}\n".encode())
+
+    return digest.hexdigest()
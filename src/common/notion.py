@@ -1,21 +1,6 @@
-from typing import List, Tuple
-
 from src.models.event import NotionCalendarEvent
 
 
-def get_event_by_page_id(
-    events: List[NotionCalendarEvent], notion_page_id: str
-) -> NotionCalendarEvent:
-    """
-    Get event by notion page id.
-    """
-
-    return next(
-        (event for event in events if event.notion_page_id == notion_page_id),
-        None,
-    )
-
-
 def are_events_equivalent(
     event_notion: NotionCalendarEvent,
     event_google: NotionCalendarEvent,
@@ -34,31 +19,3 @@ def are_events_equivalent(
             return False
 
     return True
-
-
-def map_events(
-    events_notion: List[NotionCalendarEvent],
-    events_google: List[NotionCalendarEvent],
-) -> List[Tuple[NotionCalendarEvent, NotionCalendarEvent]]:
-    """
-    Map events from Notion to events from Google Calendar.
-    Based on the notion page id.
-    """
-
-    events = []
-
-    page_ids_notion = [_.notion_page_id for _ in events_notion]
-    page_ids_google = [_.notion_page_id for _ in events_google]
-    page_ids_all = set(page_ids_notion).union(page_ids_google)
-
-    events.extend(
-        [
-            (
-                get_event_by_page_id(events_notion, notion_page_id),
-                get_event_by_page_id(events_google, notion_page_id),
-            )
-            for notion_page_id in page_ids_all
-        ]
-    )
-
-    return events
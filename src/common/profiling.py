@@ -0,0 +1,128 @@
+import cProfile
+import json
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import ContextManager, Dict, Iterator, List
+
+from src.common.utils import slugify
+
+logger = logging.getLogger(__name__)
+
+# Nr of frames kept per traced allocation
+TRACEMALLOC_FRAMES = 10
+
+
+@dataclass
+class PhaseStats:
+    # Elapsed time, and cpu time of all threads of the process
+    wall_seconds: float
+    cpu_seconds: float
+
+    # Highest nr of bytes allocated at the same time during the phase
+    peak_memory_bytes: int
+
+    @property
+    def wait_seconds(self) -> float:
+        """
+        Time not spent on the cpu, mostly waiting on the network.
+        """
+
+        return max(self.wall_seconds - self.cpu_seconds, 0.0)
+
+
+class NullProfiler:
+    """
+    Profiler that does nothing, used when profiling is disabled.
+    """
+
+    def phase(self, name: str) -> ContextManager[None]:
+        return nullcontext()
+
+    def close(self) -> None:
+        pass
+
+
+class Profiler(NullProfiler):
+    """
+    Profiles the phases of a run, e.g. the sync job of every source.
+
+    For every phase a cpu profile `<phase>.prof` of all threads that start during the phase and a
+    tracemalloc snapshot `<phase>.snapshot` of the memory still allocated at its end are written to the
+    directory. The peak memory and the wall versus cpu time of all phases are written to `report.json`.
+    Events parsed in a process pool are not part of the cpu profile.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.stats: Dict[str, PhaseStats] = {}
+
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        # Threads that start during the phase get their own profile
+        profiles: List[cProfile.Profile] = []
+
+        def _profile_thread(*args):
+            profile = cProfile.Profile()
+            profiles.append(profile)
+            profile.enable()
+
+        profile = cProfile.Profile()
+        profiles.append(profile)
+        tracemalloc.reset_peak()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        threading.setprofile(_profile_thread)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            threading.setprofile(None)
+            wall, cpu = (
+                time.perf_counter() - wall_start,
+                time.process_time() - cpu_start,
+            )
+            _, peak = tracemalloc.get_traced_memory()
+
+            stats = pstats.Stats(profiles[0])
+            for thread_profile in profiles[1:]:
+                thread_profile.disable()
+                stats.add(thread_profile)
+            stats.dump_stats(self.directory / f"{slugify(name)}.prof")
+            tracemalloc.take_snapshot().dump(
+                str(self.directory / f"{slugify(name)}.snapshot")
+            )
+
+            self.stats[name] = PhaseStats(
+                wall_seconds=wall, cpu_seconds=cpu, peak_memory_bytes=peak
+            )
+            logger.info(
+                f"Profiled {name}: {wall:.2f}s wall, {cpu:.2f}s cpu, "
+                f"{self.stats[name].wait_seconds:.2f}s waiting, "
+                f"{peak / 2**20:.1f} MiB peak memory."
+            )
+
+    def close(self) -> None:
+        """
+        Write the report and stop tracing allocations.
+        """
+
+        tracemalloc.stop()
+        with open(self.directory / "report.json", "w") as f:
+            json.dump(
+                {
+                    name: {**asdict(stats), "wait_seconds": stats.wait_seconds}
+                    for name, stats in self.stats.items()
+                },
+                f,
+                indent=2,
+            )
+        logger.info(f"Wrote profiles to {self.directory}.")
@@ -0,0 +1,109 @@
+import logging
+from typing import Iterable, List, Mapping, TypeVar, Union
+
+import pendulum as dt
+
+from src.common.state import read_state, write_state
+from src.models.database import Database
+from src.models.ical import ICalendar
+from src.models.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = "scheduler"
+
+# Weight of the latest poll in the moving average of the change rate
+CHANGE_RATE_WEIGHT = 0.3
+
+# Nr of mutations a poll is expected to find, the interval is the time the source takes to produce them
+TARGET_MUTATIONS_PER_POLL = 1.0
+
+# Factor the poll interval grows with at most per poll, idle sources back off gradually
+BACKOFF_FACTOR = 2.0
+
+# Sources that are due shortly after a run starts are polled in that run, this absorbs scheduling jitter
+POLL_SLACK_SECONDS = 60
+
+Source = TypeVar("Source", bound=Union[Database, ICalendar])
+
+
+def get_due_sources(sources: Iterable[Source], now: dt.DateTime = None) -> List[Source]:
+    """
+    Get the sources of which the poll interval has passed.
+    Sources without a schedule yet are always due.
+    """
+
+    schedules = read_state(STATE_NAME, {})
+    now = now or dt.now()
+
+    due = []
+    for source in sources:
+        schedule = schedules.get(source.name)
+        if not schedule or dt.parse(schedule["next_poll"]) <= now.add(
+            seconds=POLL_SLACK_SECONDS
+        ):
+            due.append(source)
+        else:
+            logger.info(
+                f"Skipping {source.name}, next poll at {schedule['next_poll']}."
+            )
+
+    return due
+
+
+def record_poll(
+    source: Union[Database, ICalendar],
+    counts: Mapping[str, int],
+    settings: Settings,
+    now: dt.DateTime = None,
+) -> None:
+    """
+    Adjust the poll interval of a source to the rate at which it changes.
+
+    The change rate is a moving average of the nr of mutations per minute since the previous poll.
+    The interval is the time the source takes to produce TARGET_MUTATIONS_PER_POLL mutations at that
+    rate, so it shrinks at once when a source becomes active. It grows at most BACKOFF_FACTOR times per
+    poll, and stays within the configured bounds. The next poll is planned from the start of the sync run,
+    so a source at the minimum interval is polled on every tick of a schedule with that interval.
+    """
+
+    schedules = read_state(STATE_NAME, {})
+    now = now or dt.now()
+    interval_min = settings.poll_interval_min_minutes
+    interval_max = max(settings.poll_interval_max_minutes, interval_min)
+
+    schedule = schedules.get(source.name) or {
+        "interval_minutes": interval_min,
+        "last_change": None,
+    }
+
+    # Mutations per minute since the previous poll, a poll shortly after another counts as a full interval
+    nr_mutations = sum(counts.values())
+    last_poll = schedule.get("last_poll")
+    elapsed_minutes = (
+        (now - dt.parse(last_poll)).total_minutes()
+        if last_poll
+        else schedule["interval_minutes"]
+    )
+    rate = nr_mutations / max(elapsed_minutes, interval_min, 1e-6)
+
+    # Moving average of the change rate
+    change_rate = schedule.get("change_rate")
+    schedule["change_rate"] = (
+        rate
+        if change_rate is None
+        else CHANGE_RATE_WEIGHT * rate + (1 - CHANGE_RATE_WEIGHT) * change_rate
+    )
+    if nr_mutations:
+        schedule["last_change"] = now.isoformat()
+
+    # Poll as often as the source is expected to change, back off gradually
+    interval = schedule["interval_minutes"] * BACKOFF_FACTOR
+    if schedule["change_rate"] > 0:
+        interval = min(interval, TARGET_MUTATIONS_PER_POLL / schedule["change_rate"])
+    schedule["interval_minutes"] = min(max(interval, interval_min), interval_max)
+    schedule["last_poll"] = now.isoformat()
+    schedule["next_poll"] = now.add(minutes=schedule["interval_minutes"]).isoformat()
+
+    schedules[source.name] = schedule
+    write_state(STATE_NAME, schedules)
@@ -0,0 +1,144 @@
+import logging
+import pickle
+import tempfile
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Tuple,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SpillBuffer(MutableMapping):
+    """
+    Mapping that holds up to "threshold" items in memory and spills the remaining items to a temporary
+    file on disk. Without a threshold it is a plain in-memory mapping.
+
+    Only the keys and file offsets of spilled items stay in memory. Values read from disk are copies,
+    store a changed value again to keep the change, or use `append` for list values.
+    """
+
+    def __init__(self, threshold: Optional[int] = None):
+        self.threshold = threshold
+        self.memory: Dict[Hashable, Any] = {}
+
+        # Offset and size of every segment of a spilled item, appended lists have multiple segments
+        self.spilled: Dict[Hashable, List[Tuple[int, int]]] = {}
+        self.file: Optional[IO[bytes]] = None
+
+    def __getitem__(self, key: Hashable) -> Any:
+        if key in self.memory:
+            return self.memory[key]
+        if key in self.spilled:
+            return self.read_segments(self.spilled[key])
+        raise KeyError(key)
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        # Keep an item where it already is, new items go to memory while there is room
+        if key in self.spilled or (
+            key not in self.memory
+            and self.threshold is not None
+            and len(self.memory) >= self.threshold
+        ):
+            self.spilled[key] = [self.write(value)]
+        else:
+            self.memory[key] = value
+
+    def append(self, key: Hashable, item: Any) -> None:
+        """
+        Append an item to the list value of a key, a new key gets a list of only the item.
+        The item of a spilled list is written on its own, the list itself is not read or written again.
+        """
+
+        if key in self.memory:
+            self.memory[key].append(item)
+        elif key in self.spilled:
+            self.spilled[key].append(self.write([item]))
+        else:
+            self[key] = [item]
+
+    def __delitem__(self, key: Hashable) -> None:
+        if key in self.memory:
+            del self.memory[key]
+        else:
+            del self.spilled[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.memory or key in self.spilled
+
+    def __iter__(self) -> Iterator[Hashable]:
+        yield from list(self.memory)
+        yield from list(self.spilled)
+
+    def __len__(self) -> int:
+        return len(self.memory) + len(self.spilled)
+
+    def values(self) -> Iterator[Any]:
+        """
+        Iterate the values without looking every key up again.
+        """
+
+        yield from list(self.memory.values())
+        for segments in list(self.spilled.values()):
+            yield self.read_segments(segments)
+
+    def write(self, value: Any) -> Tuple[int, int]:
+        """
+        Append a value to the spill file and return its offset and size.
+        The file is created for the first item that does not fit in memory.
+        """
+
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(prefix="notion-google-calendar-")
+            logger.info(
+                f"More than {self.threshold} buffered events, spilling to disk."
+            )
+
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        offset = self.file.seek(0, 2)
+        self.file.write(data)
+
+        return offset, len(data)
+
+    def read(self, offset: int, size: int) -> Any:
+        self.file.seek(offset)
+
+        return pickle.loads(self.file.read(size))
+
+    def read_segments(self, segments: List[Tuple[int, int]]) -> Any:
+        """
+        Read a spilled item, the segments of an appended list are joined.
+        """
+
+        if len(segments) == 1:
+            return self.read(*segments[0])
+
+        value = []
+        for offset, size in segments:
+            value.extend(self.read(offset, size))
+
+        return value
+
+    def close(self) -> None:
+        """
+        Drop all items and remove the spill file.
+        """
+
+        self.memory.clear()
+        self.spilled.clear()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self) -> "SpillBuffer":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,78 @@
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+STATE_PATH = Path(__file__).parents[2] / "config" / "state"
+
+# Interval at which a held lock is tried again
+LOCK_POLL_SECONDS = 1
+
+
+class StateLocked(Exception):
+    """
+    The lock is held by another process.
+    """
+
+
+def read_state(name: str, default: Any = None) -> Any:
+    """
+    Read persisted state that is kept across runs.
+    """
+
+    path = STATE_PATH / f"{name}.json"
+    if not path.exists():
+        return default
+
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except ValueError:
+        return default
+
+
+def write_state(name: str, data: Any) -> None:
+    """
+    Persist state across runs.
+    The file is replaced atomically, so an interrupted run never leaves a corrupt file behind.
+    """
+
+    path = STATE_PATH / f"{name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    path_tmp = path.with_suffix(".tmp")
+    with open(path_tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(path_tmp, path)
+
+
+@contextmanager
+def lock_state(name: str, timeout: float = 0) -> Iterator[None]:
+    """
+    Hold an exclusive lock across processes, e.g. to prevent overlapping runs.
+    The lock is released by the os when the process dies, so a crashed run never leaves it behind.
+
+    :param timeout: Seconds to wait for the lock, raises StateLocked when it is still held.
+    """
+
+    path = STATE_PATH / f"{name}.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, "a") as f:
+        time_stop = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= time_stop:
+                    raise StateLocked(f"Lock {name} is held by another process.")
+                time.sleep(LOCK_POLL_SECONDS)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
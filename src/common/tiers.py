@@ -0,0 +1,56 @@
+from typing import Dict, Iterable, Union
+
+import pendulum as dt
+
+from src.common.state import read_state, write_state
+from src.models.database import Database
+from src.models.ical import ICalendar
+from src.models.sync_window import SyncTier
+
+STATE_NAME = "sync_tiers"
+
+
+def get_due_tiers(sources: Iterable[Union[Database, ICalendar]]) -> Dict[str, SyncTier]:
+    """
+    Get the tier to sync per source name.
+    A source is synced cold when it has no hot window or its last cold sync is older than its interval.
+    """
+
+    last_cold_syncs = read_state(STATE_NAME, {})
+    now = dt.now()
+
+    tiers: Dict[str, SyncTier] = {}
+    for source in sources:
+        last_cold_sync = last_cold_syncs.get(source.name)
+        if (
+            source.sync.hot
+            and last_cold_sync
+            and dt.parse(last_cold_sync).add(minutes=source.sync.cold_interval_minutes)
+            > now
+        ):
+            tiers[source.name] = "hot"
+        else:
+            tiers[source.name] = "cold"
+
+    return tiers
+
+
+def request_cold_sync(names: Iterable[str]) -> None:
+    """
+    Sync the cold window of the named sources in the next run.
+    """
+
+    last_cold_syncs = read_state(STATE_NAME, {})
+    for name in names:
+        last_cold_syncs.pop(name, None)
+    write_state(STATE_NAME, last_cold_syncs)
+
+
+def record_cold_sync(source: Union[Database, ICalendar]) -> None:
+    """
+    Remember when the cold window of a source was last synced.
+    """
+
+    last_cold_syncs = read_state(STATE_NAME, {})
+    last_cold_syncs[source.name] = dt.now().isoformat()
+    write_state(STATE_NAME, last_cold_syncs)
@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, Mapping, Optional, TypeVar
+
+import pendulum as dt
+
+from src.models.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+TRACES_PATH = Path(__file__).parents[2] / "logs" / "traces"
+
+Item = TypeVar("Item")
+
+
+class NullSpan:
+    """
+    Span that records nothing, used when a run is not traced.
+    """
+
+    # Skip collecting span attributes that are costly to compute when false
+    recording = False
+
+    def set(self, **args: Any) -> None:
+        pass
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span(NullSpan):
+    """
+    Timed operation of a traced run, exported when it ends.
+    """
+
+    recording = True
+
+    def __init__(
+        self, tracer: "Tracer", name: str, category: str, args: Dict[str, Any]
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start: Optional[float] = None
+
+    def set(self, **args: Any) -> None:
+        self.args.update(args)
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.finish(self, time.perf_counter())
+
+
+class NullExporter:
+    """
+    Exporter that drops every event.
+    """
+
+    def export(self, event: Mapping[str, Any]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class FileExporter(NullExporter):
+    """
+    Writes events to a file in the Chrome trace event format, one event per line.
+
+    The file is a json array of which the closing bracket is optional, as accepted by chrome://tracing,
+    Perfetto and speedscope, so it can be loaded while the run is still busy.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file: IO[str] = open(path, "w")
+        self.file.write("[\n")
+        self.lock = threading.Lock()
+
+    def export(self, event: Mapping[str, Any]) -> None:
+        line = json.dumps(event, default=str) + ",\n"
+        with self.lock:
+            # Threads that outlive the run are no longer traced
+            if not self.file.closed:
+                self.file.write(line)
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+class LogExporter(NullExporter):
+    """
+    Logs every event as json.
+    """
+
+    def export(self, event: Mapping[str, Any]) -> None:
+        logger.info(f"Span: {json.dumps(event, default=str)}")
+
+
+class NullTracer:
+    """
+    Tracer of runs that are not sampled, spans cost a single call.
+    """
+
+    enabled = False
+
+    def span(self, name: str, category: str = "sync", **args: Any) -> NullSpan:
+        return NULL_SPAN
+
+    def close(self) -> None:
+        pass
+
+
+class Tracer(NullTracer):
+    """
+    Records spans of a run and hands them to an exporter.
+    Spans nest by time per thread, every span also carries the source that is being synced.
+    """
+
+    enabled = True
+
+    def __init__(self, exporter: NullExporter):
+        self.exporter = exporter
+        self.source: Optional[str] = None
+
+        # Timestamps are wall clock time, durations are measured with the monotonic clock
+        self.time_offset = time.time() - time.perf_counter()
+        self.pid = os.getpid()
+        self.thread_ids = set()
+
+    def span(self, name: str, category: str = "sync", **args: Any) -> Span:
+        if self.source is not None:
+            args.setdefault("source", self.source)
+
+        return Span(self, name, category, args)
+
+    def finish(self, span: Span, end: float) -> None:
+        thread_id = threading.get_ident()
+
+        # Name the thread in trace viewers the first time it has a span
+        if thread_id not in self.thread_ids:
+            self.thread_ids.add(thread_id)
+            self.exporter.export(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self.pid,
+                    "tid": thread_id,
+                    "args": {"name": threading.current_thread().name},
+                }
+            )
+
+        self.exporter.export(
+            {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((self.time_offset + span.start) * 1e6),
+                "dur": round((end - span.start) * 1e6),
+                "pid": self.pid,
+                "tid": thread_id,
+                "args": span.args,
+            }
+        )
+
+    def close(self) -> None:
+        self.exporter.close()
+
+
+tracer: NullTracer = NullTracer()
+
+
+def span(name: str, category: str = "sync", **args: Any) -> NullSpan:
+    """
+    Span of the current run, it records nothing when the run is not traced.
+    """
+
+    return tracer.span(name, category, **args)
+
+
+def set_source(source: Optional[str]) -> None:
+    """
+    Set the source that later spans belong to.
+    """
+
+    if tracer.enabled:
+        tracer.source = source
+
+
+def traced(
+    iterable: Iterable[Item], name: str, category: str = "fetch", **args: Any
+) -> Iterable[Item]:
+    """
+    Span from the first until the last item of an iterable, with the nr of items.
+    The span includes the time the consumer spends between items.
+    """
+
+    if not tracer.enabled:
+        return iterable
+
+    def _traced() -> Iterator[Item]:
+        with span(name, category, **args) as current:
+            nr_items = 0
+            for item in iterable:
+                nr_items += 1
+                yield item
+            current.set(items=nr_items)
+
+    return _traced()
+
+
+@contextmanager
+def trace_run(settings: Settings, now: dt.DateTime) -> Iterator[None]:
+    """
+    Trace a sampled run, the spans are exported while the run is busy.
+    """
+
+    global tracer
+
+    if random.random() >= settings.trace_sample_rate:
+        yield
+        return
+
+    if settings.trace_exporter == "file":
+        path = TRACES_PATH / f"{now.format('YYYYMMDD-HHmmss')}.json"
+        exporter = FileExporter(path)
+        logger.info(f"Tracing this run to {path}.")
+    elif settings.trace_exporter == "log":
+        exporter = LogExporter()
+    else:
+        raise ValueError(f"Unknown trace exporter {settings.trace_exporter}.")
+
+    tracer = Tracer(exporter)
+    try:
+        with span("run", "run"):
+            yield
+    finally:
+        tracer.close()
+        tracer = NullTracer()
@@ -1,9 +1,29 @@
-from typing import Type, Union
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from queue import Full, Queue
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 import datetime
+import re
+import threading
 import pendulum as dt
 
+from src.common.spill import SpillBuffer
 from src.models.event import CalendarEvent
 
+_DONE = object()
+
 
 def is_older_than(event: Type[CalendarEvent], cutoff_days: int = 5) -> bool:
     """
@@ -22,3 +42,157 @@ def to_datetime(date: Union[datetime.datetime, datetime.date]) -> dt.DateTime:
         date = datetime.datetime.combine(date, datetime.time.min)
 
     return dt.instance(date)
+
+
+def slugify(name: str) -> str:
+    """
+    Turn an arbitrary source name into a safe file name.
+    """
+
+    return re.sub(r"[^a-zA-Z0-9_-]+", "_", name).strip("_").lower() or "_"
+
+
+def split_time_range(
+    time_min: dt.DateTime, time_max: dt.DateTime, nr_slices: int
+) -> List[Tuple[dt.DateTime, dt.DateTime]]:
+    """
+    Split a time range into consecutive slices of equal length.
+    """
+
+    step = (time_max - time_min).as_timedelta() / nr_slices
+
+    return [(time_min + step * i, time_min + step * (i + 1)) for i in range(nr_slices)]
+
+
+def iterate_concurrently(
+    iterables: List[Iterable[Any]],
+    max_workers: Optional[int] = None,
+    queue_size: int = 0,
+) -> Iterator[Any]:
+    """
+    Consume each iterable in its own thread and yield items as soon as they arrive.
+    Items of a single iterable keep their order, items of different iterables are interleaved.
+
+    :param max_workers: Max nr of iterables consumed at the same time, all of them by default.
+    :param queue_size: Max nr of items waiting to be yielded, threads pause while it is full. Unbounded by default.
+    """
+
+    queue = Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def _put(entry: Tuple[Any, Optional[Exception]]):
+        while not stopped.is_set():
+            try:
+                queue.put(entry, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def _consume(iterable: Iterable[Any]):
+        try:
+            for item in iterable:
+                if stopped.is_set():
+                    return
+                _put((item, None))
+        except Exception as e:
+            _put((None, e))
+        finally:
+            _put((_DONE, None))
+
+    max_workers = min(max_workers or len(iterables), len(iterables))
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        for iterable in iterables:
+            executor.submit(_consume, iterable)
+
+        try:
+            nr_running = len(iterables)
+            while nr_running:
+                item, error = queue.get()
+                if error:
+                    raise error
+                if item is _DONE:
+                    nr_running -= 1
+                    continue
+                yield item
+        finally:
+            # Let the threads finish when the items are no longer consumed
+            stopped.set()
+
+
+def run_concurrently(*functions: Callable[[], Any]) -> List[Any]:
+    """
+    Run functions in parallel threads and return their results in order.
+    """
+
+    with ThreadPoolExecutor(max_workers=max(len(functions), 1)) as executor:
+        futures = [executor.submit(function) for function in functions]
+
+        return [future.result() for future in futures]
+
+
+def join_concurrently(
+    left: Iterable[Any],
+    right: Iterable[Any],
+    key: Callable[[Any], Hashable],
+    queue_size: int = 0,
+    spill_threshold: Optional[int] = None,
+) -> Iterator[Tuple[Optional[Any], Optional[Any]]]:
+    """
+    Join two iterables on a key while both are consumed concurrently.
+
+    A pair is yielded as soon as both of its items have arrived. Left items without a match are yielded
+    once the right side is exhausted, right items without a match once both sides are exhausted.
+
+    Only the first item of every key is used on both sides. With a spill threshold the joined keys are
+    not kept, so memory does not grow with the nr of joined items: a later item with the key of a joined
+    pair is then joined again as a new item, or yielded without a match.
+
+    :param queue_size: Max nr of arrived items waiting to be joined, see `iterate_concurrently`.
+    :param spill_threshold: Max nr of unmatched items per side held in memory, the rest is spilled to disk.
+    """
+
+    LEFT, RIGHT = 0, 1
+
+    def _tagged(side: int, iterable: Iterable[Any]) -> Iterator[Tuple[int, Any]]:
+        return chain(((side, item) for item in iterable), [(side, _DONE)])
+
+    pending = [SpillBuffer(spill_threshold), SpillBuffer(spill_threshold)]
+    matched = set()
+    track_matched = spill_threshold is None
+    right_done = False
+
+    try:
+        for side, item in iterate_concurrently(
+            [_tagged(LEFT, left), _tagged(RIGHT, right)], queue_size=queue_size
+        ):
+            # Right side exhausted: pending left items will never get a match
+            if item is _DONE:
+                if side == RIGHT:
+                    right_done = True
+                    for item_left in pending[LEFT].values():
+                        yield item_left, None
+                    pending[LEFT].close()
+                continue
+
+            item_key = key(item)
+            if item_key in matched or item_key in pending[side]:
+                continue
+
+            other = RIGHT if side == LEFT else LEFT
+            if item_key in pending[other]:
+                item_other = pending[other].pop(item_key)
+                if track_matched:
+                    matched.add(item_key)
+                yield (item, item_other) if side == LEFT else (item_other, item)
+            elif side == LEFT and right_done:
+                if track_matched:
+                    matched.add(item_key)
+                yield item, None
+            else:
+                pending[side][item_key] = item
+
+        for item_right in pending[RIGHT].values():
+            yield None, item_right
+    finally:
+        for buffer in pending:
+            buffer.close()
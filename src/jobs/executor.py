@@ -0,0 +1,213 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Type
+
+import pendulum as dt
+from googleapiclient.errors import HttpError
+
+from src.api_client.google import GCalendar
+from src.common.journal import Journal
+from src.common.log import event_log
+from src.common.tracing import span
+from src.models.event import CalendarEvent, ICalCalendarEvent, NotionCalendarEvent
+from src.models.plan import Mutation, SyncPlan
+
+logger = logging.getLogger(__name__)
+
+# Nr of planned mutations that are executed together while events are still arriving
+PLAN_WAVE_SIZE = 50
+
+
+class PlanExecutor(ABC):
+    """
+    Executes the planned mutations of a sync job.
+    """
+
+    def execute(self, plan: SyncPlan) -> None:
+        """
+        Execute all pending mutations of the plan, upcoming events first.
+        """
+
+        with span("execute") as current:
+            mutations = plan.drain()
+            journal = self.journal(plan.source)
+            if journal:
+                journal.planned(mutations)
+
+            for mutation in mutations:
+                self.execute_mutation(mutation, journal)
+                if journal:
+                    journal.done(mutation)
+                self.record_lag(plan, mutation)
+            current.set(mutations=len(mutations))
+
+    @abstractmethod
+    def execute_mutation(
+        self, mutation: Mutation, journal: Optional[Journal] = None
+    ) -> None:
+        """
+        Write a single mutation.
+        """
+
+    def journal(self, source: str) -> Optional[Journal]:
+        """
+        Write-ahead journal of the source, None when mutations are not journaled.
+        """
+
+        return None
+
+    def complete(self, plan: SyncPlan) -> None:
+        """
+        Called once all mutations of the sync job are executed.
+        """
+
+        pass
+
+    def close(self, source: str) -> None:
+        """
+        Called when the sync job of the source ends, also when it failed.
+        """
+
+        pass
+
+    def record_lag(self, plan: SyncPlan, mutation: Mutation) -> None:
+        pass
+
+
+class GCalendarExecutor(PlanExecutor):
+    """
+    Writes the planned mutations to Google Calendar.
+    """
+
+    def __init__(self, gcalendar: GCalendar):
+        self.gcalendar = gcalendar
+        self.journals: Dict[str, Journal] = {}
+
+    def journal(self, source: str) -> Optional[Journal]:
+        if not self.gcalendar.settings.journal_mutations:
+            return None
+        if source not in self.journals:
+            self.journals[source] = Journal(source)
+
+        return self.journals[source]
+
+    def complete(self, plan: SyncPlan) -> None:
+        journal = self.journals.pop(plan.source, None)
+        if journal:
+            journal.complete()
+
+    def close(self, source: str) -> None:
+        # The journal of a failed job is kept for the next run
+        journal = self.journals.pop(source, None)
+        if journal:
+            journal.close()
+
+    def execute_mutation(
+        self, mutation: Mutation, journal: Optional[Journal] = None
+    ) -> None:
+        event = mutation.event
+
+        # An interrupted run may already have created the event
+        if (
+            mutation.kind == "create"
+            and journal
+            and self.resume_create(mutation, journal)
+        ):
+            return
+
+        if isinstance(event, NotionCalendarEvent):
+            if mutation.kind == "create":
+                event.google_event_id = self.gcalendar.create_event_from_notion(event)
+            elif mutation.kind == "update":
+                self.gcalendar.update_event_from_notion(event, mutation.event_google)
+            elif mutation.kind == "delete":
+                self.gcalendar.delete_event_notion(event)
+
+        elif isinstance(event, ICalCalendarEvent):
+            if mutation.kind == "create":
+                event.google_event_id = self.gcalendar.create_event_from_ical(event)
+            elif mutation.kind == "update":
+                self.gcalendar.update_event_from_ical(event, mutation.event_google)
+            elif mutation.kind == "delete":
+                self.gcalendar.delete_event_ical(event)
+
+    def resume_create(self, mutation: Mutation, journal: Journal) -> bool:
+        """
+        Update the event instead of creating it, if an interrupted run already created it.
+        Creates that were never confirmed are looked up in Google Calendar, the response may have been lost.
+
+        :return: True if the event was updated.
+        """
+
+        event = mutation.event
+        event_google = None
+        event_id = journal.created_event_id(mutation)
+        if event_id is None and journal.is_unconfirmed(mutation):
+            event_google = self.find_event(event)
+            event_id = event_google.google_event_id if event_google else None
+        if event_id is None:
+            return False
+
+        logger.info(
+            f"Event '{event.title}' was created by an interrupted run, updating instead."
+        )
+        event.google_event_id = event_id
+        try:
+            if isinstance(event, NotionCalendarEvent):
+                self.gcalendar.update_event_from_notion(event, event_google)
+            else:
+                self.gcalendar.update_event_from_ical(event, event_google)
+        except HttpError as e:
+            # The event was deleted since
+            if e.resp.status not in (404, 410):
+                raise
+            event.google_event_id = None
+            return False
+
+        return True
+
+    def find_event(self, event: Type[CalendarEvent]) -> Optional[Type[CalendarEvent]]:
+        """
+        Find the Google Calendar version of an event that has no Google Calendar id.
+        """
+
+        if isinstance(event, NotionCalendarEvent):
+            return self.gcalendar.find_event_notion(
+                event.database, event.notion_page_id
+            )
+
+        events_google = [
+            event_google
+            for event_google in self.gcalendar.find_events_ical(
+                event.icalendar, event.ical_uid
+            )
+            if event_google.recurrence_start == event.recurrence_start
+        ]
+
+        return events_google[0] if events_google else None
+
+    def record_lag(self, plan: SyncPlan, mutation: Mutation) -> None:
+        """
+        Record how long the edit at the source took to reach Google Calendar.
+        Deletes are not recorded, the source does not tell when an event was removed.
+        """
+
+        if mutation.kind != "delete" and mutation.event.last_modified:
+            lag = dt.now() - dt.parse(mutation.event.last_modified)
+            plan.lags.observe(lag.total_seconds())
+
+
+class DryRunExecutor(PlanExecutor):
+    """
+    Only logs the planned mutations, nothing is written to Google Calendar.
+    """
+
+    def execute_mutation(
+        self, mutation: Mutation, journal: Optional[Journal] = None
+    ) -> None:
+        event_log.event(
+            logger,
+            mutation.kind,
+            mutation.event.title,
+            f"Dry run: would {mutation.kind} event '%s' in Google Calendar.",
+        )
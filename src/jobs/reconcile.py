@@ -0,0 +1,144 @@
+import logging
+import random
+from collections import defaultdict
+from typing import Dict, List, Union
+
+import pendulum as dt
+
+from src.api_client.google import MAX_PARALLEL_PAGINATION, GCalendar
+from src.common.mirror import CalendarMirror, bucket_events, range_digest
+from src.common.utils import iterate_concurrently, split_time_range
+from src.models.database import Database
+from src.models.ical import ICalendar
+from src.models.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+def reconcile(
+    gcalendar: GCalendar,
+    sources: List[Union[Database, ICalendar]],
+    settings: Settings,
+) -> List[str]:
+    """
+    Reconcile the mirror of every Google calendar that the sources sync to, over the cold windows of
+    its sources. Open-ended windows are reconciled up to the listing horizon.
+
+    :return: The names of the sources of which the calendar drifted from its mirror.
+    """
+
+    sources_per_calendar: Dict[str, List[Union[Database, ICalendar]]] = defaultdict(
+        list
+    )
+    for source in sources:
+        sources_per_calendar[source.calendar_id].append(source)
+
+    horizon = dt.now().add(days=settings.list_shard_horizon_days)
+    drifted = []
+    try:
+        for calendar_id, calendar_sources in sources_per_calendar.items():
+            time_ranges = [source.sync.cold.resolve() for source in calendar_sources]
+            nr_drifted = reconcile_calendar(
+                gcalendar,
+                gcalendar.mirror.get(calendar_id),
+                time_min=min(time_range.time_min for time_range in time_ranges),
+                time_max=max(
+                    time_range.time_max or horizon for time_range in time_ranges
+                ),
+                settings=settings,
+            )
+            if nr_drifted:
+                drifted.extend(source.name for source in calendar_sources)
+    finally:
+        # Keep the calendars that were reconciled before the budget ran out
+        gcalendar.mirror.save()
+
+    return drifted
+
+
+def reconcile_calendar(
+    gcalendar: GCalendar,
+    mirror: CalendarMirror,
+    time_min: dt.DateTime,
+    time_max: dt.DateTime,
+    settings: Settings,
+) -> int:
+    """
+    Reconcile the mirror of a Google calendar without listing it in full.
+
+    The time range is split into "reconcile_ranges" ranges by event start. The digest of the ids and etags
+    of every range in a listing of only those fields is compared with the digest of the mirror. Ranges
+    that differ, and "reconcile_sample_ranges" random ranges that match, are listed in full and replace
+    the range in the mirror. A mirror that was never reconciled is filled without reporting drift.
+
+    :return: The nr of events that were added, changed or removed in Google Calendar.
+    """
+
+    bounds = [
+        range_min.timestamp()
+        for range_min, _ in split_time_range(
+            time_min, time_max, max(settings.reconcile_ranges, 1)
+        )
+    ] + [time_max.timestamp()]
+
+    # Compare digests per range
+    listed = bucket_events(
+        gcalendar.list_digest_events(mirror.calendar_id, time_min, time_max), bounds
+    )
+    mirrored = bucket_events(mirror.events.values(), bounds)
+    differing = [
+        i
+        for i, (etags_listed, etags_mirrored) in enumerate(zip(listed, mirrored))
+        if range_digest(etags_listed) != range_digest(etags_mirrored)
+    ]
+
+    # Verify a sample of the matching ranges in full
+    matching = [i for i in range(len(listed)) if i not in differing]
+    sampled = random.sample(
+        matching, min(settings.reconcile_sample_ranges, len(matching))
+    )
+
+    # List the differing and sampled ranges in full
+    def _list_range(i: int):
+        events = gcalendar.list_events(
+            mirror.calendar_id,
+            time_min=dt.from_timestamp(bounds[i]),
+            time_max=dt.from_timestamp(bounds[i + 1]),
+            singleEvents=False,
+        )
+        return ((i, event) for event in events)
+
+    events_per_range: Dict[int, List] = {i: [] for i in [*differing, *sampled]}
+    for i, event in iterate_concurrently(
+        [_list_range(i) for i in events_per_range],
+        max_workers=MAX_PARALLEL_PAGINATION,
+    ):
+        events_per_range[i].append(event)
+
+    # Replace the listed ranges in the mirror
+    nr_drifted = 0
+    for i, events in events_per_range.items():
+        range_bounds = bounds[i : i + 2]
+        (etags_listed,) = bucket_events(events, range_bounds)
+        nr_drifted += sum(
+            etags_listed.get(event_id) != mirrored[i].get(event_id)
+            for event_id in etags_listed.keys() | mirrored[i].keys()
+        )
+
+        for event_id in mirrored[i]:
+            mirror.remove(event_id)
+        for event in events:
+            if event["id"] in etags_listed:
+                mirror.put(event)
+
+    # A new mirror differs everywhere
+    if mirror.reconciled_at is None:
+        nr_drifted = 0
+    mirror.mark_reconciled()
+
+    logger.info(
+        f"Reconciled calendar {mirror.calendar_id}: {len(differing)} of {len(listed)} ranges differed, "
+        f"{len(sampled)} matching ranges verified, {nr_drifted} events drifted."
+    )
+
+    return nr_drifted
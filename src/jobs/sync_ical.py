@@ -1,39 +1,79 @@
 import copy
 import logging
+from typing import Optional
 
 from src.models.ical import ICalendar
-from src.api_client.google import GCalendar
+from src.models.plan import Mutation, SyncPlan
+from src.api_client.google import BATCH_SIZE, GCalendar
 from src.api_client.ical import ICal
-from src.common.utils import is_older_than
+from src.jobs.executor import PLAN_WAVE_SIZE, GCalendarExecutor, PlanExecutor
+from src.common.tracing import traced
+from src.common.utils import is_older_than, run_concurrently
 from src.common.ical import (
     are_events_equivalent,
     get_recurring_exceptions,
     get_recurring_root,
-    map_events,
+    group_events,
     map_exceptions,
+    map_groups,
 )
+from src.models.settings import Settings
+from src.models.sync_window import SyncTier
 
 logger = logging.getLogger(__name__)
 
 
-def sync_icalendar(ical: ICal, gcalendar: GCalendar, icalendar: ICalendar):
+def sync_icalendar(
+    ical: ICal,
+    gcalendar: GCalendar,
+    icalendar: ICalendar,
+    executor: Optional[PlanExecutor] = None,
+    settings: Optional[Settings] = None,
+    tier: SyncTier = "cold",
+) -> SyncPlan:
     """
     Sync an ical feed with Google Calendar.
 
-    NOTE: Manually deleted instances of recurring events in google calendar in ical are not synced.
-    """
+    Root events are planned and written first, recurring exceptions need the Google Calendar
+    instances of their (possibly newly created) root event and are planned and written afterwards.
 
-    logger.info(f"Starting to sync icalendar {icalendar.name}.")
+    In the hot tier only the hot window of the ical calendar is synced. Events that are missing in
+    Google Calendar are looked up before they are created, deletes and resets are left to the cold tier.
 
-    # Get events from ICal and Google Calendar
-    events_ical = ical.get_events(icalendar)
-    events_google = gcalendar.get_events_ical(icalendar)
-
-    # Map events from ICal to events from Google Calendar
-    events_map = map_events(events_ical, events_google)
+    NOTE: Manually deleted instances of recurring events in google calendar in ical are not synced.
+    """
 
-    # Create/Update/Delete events
-    for events_ical, events_google in events_map:
+    logger.info(f"Starting to sync icalendar {icalendar.name} ({tier}).")
+
+    settings = settings or Settings()
+    executor = executor or GCalendarExecutor(gcalendar)
+    plan = SyncPlan(
+        source=icalendar.name,
+        are_events_equivalent=are_events_equivalent,
+        keep_done=not settings.streaming_sync,
+    )
+    spill_threshold = (
+        settings.stream_spill_threshold if settings.streaming_sync else None
+    )
+
+    window = icalendar.sync.window(tier)
+    hot = window is not icalendar.sync.cold
+    cutoff_days = icalendar.sync.create_cutoff_days
+
+    # Get events from ICal and Google Calendar concurrently, grouped by ical uid
+    groups_ical, groups_google = run_concurrently(
+        lambda: group_events(ical.get_events(icalendar, window), spill_threshold),
+        lambda: group_events(
+            traced(gcalendar.get_events_ical(icalendar, window), "fetch.google"),
+            spill_threshold,
+        ),
+    )
+
+    # Map events from ICal to events from Google Calendar.
+    # The span also covers planning and the mutations executed in between.
+    events_map = traced(map_groups(groups_ical, groups_google), "map", "sync")
+
+    def _plan_group(events_ical, events_google) -> None:
         # Get root events & recurring exceptions
         event_root_ical = get_recurring_root(events_ical)
         event_exceptions_ical = get_recurring_exceptions(events_ical, event_root_ical)
@@ -44,43 +84,106 @@ def sync_icalendar(ical: ICal, gcalendar: GCalendar, icalendar: ICalendar):
 
         # Create root event
         if event_root_ical and not event_root_google:
-            # Dont create new events that are older that 5 days
-            if is_older_than(event_root_ical) and not event_root_ical.recurrence:
-                continue
+            # Dont create new events that are older than the cutoff
+            if (
+                is_older_than(event_root_ical, cutoff_days)
+                and not event_root_ical.recurrence
+            ):
+                return
 
-            id = gcalendar.create_event_from_ical(event_root_ical)
-            event_root_google = copy.deepcopy(event_root_ical)
-            event_root_google.google_event_id = id
+            plan.add(Mutation("create", event_root_ical))
 
         # Update root event
-        if event_root_ical and event_root_google:
-            if not are_events_equivalent(event_root_ical, event_root_google):
-                event_root_ical.google_event_id = event_root_google.google_event_id
-                gcalendar.update_event_from_ical(event_root_ical)
+        elif event_root_ical and event_root_google:
+            event_root_ical.google_event_id = event_root_google.google_event_id
+            plan.add(Mutation("update", event_root_ical, event_root_google))
 
         # Delete root event
-        if not event_root_ical and event_root_google:
-            gcalendar.delete_event_ical(event_root_google)
+        if not event_root_ical and event_root_google and not hot:
+            plan.add(Mutation("delete", event_root_google))
 
-        # Create/Reset recurring exceptions
+        # Map recurring exceptions
         events_map_exceptions = map_exceptions(
             event_exceptions_ical, event_exceptions_google
         )
-        event_instances_google = []
+        if len(events_map_exceptions):
+            recurring_events.append(
+                (event_root_ical, event_root_google, events_map_exceptions)
+            )
+
+    def _plan_missing() -> None:
+        # Look up events that moved into the hot window, in batch
+        if not missing:
+            return
+
+        events_found = gcalendar.find_events_ical_batch(
+            icalendar, [events_ical[0].ical_uid for events_ical in missing]
+        )
+        for events_ical in missing:
+            _plan_group(events_ical, events_found[events_ical[0].ical_uid])
+        missing.clear()
+
+    # Plan Create/Update/Delete root events
+    recurring_events = []
+    missing = []
+    for events_ical, events_google in events_map:
+        if hot and events_ical and not events_google:
+            missing.append(events_ical)
+            if len(missing) >= BATCH_SIZE:
+                _plan_missing()
+        else:
+            _plan_group(events_ical, events_google)
+
+        # Bound the nr of pending mutations in streaming mode
+        if settings.streaming_sync and len(plan) >= PLAN_WAVE_SIZE:
+            executor.execute(plan)
+
+    _plan_missing()
+    executor.execute(plan)
+    groups_ical.close()
+    groups_google.close()
+
+    # Created root events now have a Google Calendar id
+    recurring_events = [
+        (
+            event_root_ical,
+            event_root_google or copy.deepcopy(event_root_ical),
+            events_map_exceptions,
+        )
+        for event_root_ical, event_root_google, events_map_exceptions in recurring_events
+    ]
+
+    # Get the google instances of all recurring events that get a new exception, in batch
+    event_instances_google = gcalendar.get_event_instances_ical_batch(
+        [
+            event_root_google
+            for _, event_root_google, events_map_exceptions in recurring_events
+            if event_root_google.google_event_id
+            and any(
+                event_ical
+                and not event_google
+                and not is_older_than(event_ical, cutoff_days)
+                for event_ical, event_google in events_map_exceptions
+            )
+        ]
+    )
+
+    # Plan Create/Reset recurring exceptions
+    for event_root_ical, event_root_google, events_map_exceptions in recurring_events:
         for event_ical, event_google in events_map_exceptions:
             # Create new exception
             if event_ical and not event_google:
-                if is_older_than(event_ical):
+                if is_older_than(event_ical, cutoff_days):
+                    continue
+                if event_root_google.google_event_id not in event_instances_google:
                     continue
 
                 # Get matching instance from google calendar
-                if not len(event_instances_google):
-                    event_instances_google = gcalendar.get_event_instances_ical(
-                        event_root_google
-                    )
                 event_google = [
                     event
-                    for event in event_instances_google
+                    for event in event_instances_google[
+                        event_root_google.google_event_id
+                    ]
                     if event.recurrence_start == event_ical.recurrence_start
                 ]
                 assert len(event_google) == 1
@@ -89,25 +192,31 @@ def sync_icalendar(ical: ICal, gcalendar: GCalendar, icalendar: ICalendar):
                 # Update google instance with ical exception
                 event_ical.google_event_id = event_google.google_event_id
                 event_ical.recurrence_id = event_google.recurrence_id
-                gcalendar.update_event_from_ical(event_ical)
+                plan.add(Mutation("update", event_ical, event_google))
 
             # Reset exception
-            if not event_ical and event_google and event_root_ical:
-                if is_older_than(event_google):
+            if not event_ical and event_google and event_root_ical and not hot:
+                if is_older_than(event_google, cutoff_days):
                     continue
 
+                event_google_reset = copy.deepcopy(event_google)
                 event_root_duration = (
                     event_root_google.date.end - event_root_google.date.start
                 )
-                event_google.date.end = (
+                event_google_reset.date.end = (
                     event_google.recurrence_start + event_root_duration
                 )
-                event_google.date.start = event_google.recurrence_start
-                event_google.date.all_day = event_root_google.date.all_day
-                event_google.title = event_root_google.title
-                event_google.location = event_root_google.location
-                event_google.status = event_root_google.status
+                event_google_reset.date.start = event_google.recurrence_start
+                event_google_reset.date.all_day = event_root_google.date.all_day
+                event_google_reset.title = event_root_google.title
+                event_google_reset.location = event_root_google.location
+                event_google_reset.status = event_root_google.status
+
+                plan.add(Mutation("update", event_google_reset, event_google))
 
-                gcalendar.update_event_from_ical(event_google)
+    executor.execute(plan)
+    executor.complete(plan)
 
     logger.info(f"Done syncing icalendar {icalendar.name}!")
+
+    return plan
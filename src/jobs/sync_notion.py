@@ -1,49 +1,123 @@
 import logging
+from typing import Optional
 
-from src.api_client.google import GCalendar
+from src.api_client.google import BATCH_SIZE, GCalendar
 from src.api_client.notion import Notion
-from src.common.notion import are_events_equivalent, map_events
-from src.common.utils import is_older_than
+from src.common.notion import are_events_equivalent
+from src.common.tracing import traced
+from src.common.utils import is_older_than, join_concurrently
+from src.jobs.executor import PLAN_WAVE_SIZE, GCalendarExecutor, PlanExecutor
 from src.models.database import Database
+from src.models.plan import Mutation, SyncPlan
+from src.models.settings import Settings
+from src.models.sync_window import SyncTier
 
 logger = logging.getLogger(__name__)
 
 
-def sync_database(notion: Notion, gcalendar: GCalendar, database: Database) -> None:
+def sync_database(
+    notion: Notion,
+    gcalendar: GCalendar,
+    database: Database,
+    executor: Optional[PlanExecutor] = None,
+    settings: Optional[Settings] = None,
+    tier: SyncTier = "cold",
+) -> SyncPlan:
     """
     Sync dated notion pages for a single database to the specified Google Calendar.
+
+    Notion and Google Calendar are fetched concurrently. Pages are mapped and synced as soon as their
+    Google Calendar counterpart has arrived, while the remaining pages are still being fetched.
+    In streaming mode the events waiting for their counterpart are bounded in memory.
+
+    In the hot tier only the hot window of the database is synced. Pages that have no event in the
+    window are looked up before they are created, as they may have moved into the window.
+    Events without a page in the window are not deleted, that is left to the cold tier.
     """
 
-    logger.info(f"Starting to sync database {database.name}.")
+    logger.info(f"Starting to sync database {database.name} ({tier}).")
+
+    settings = settings or Settings()
+    executor = executor or GCalendarExecutor(gcalendar)
+    plan = SyncPlan(
+        source=database.name,
+        are_events_equivalent=are_events_equivalent,
+        keep_done=not settings.streaming_sync,
+    )
 
     # Get events from Notion and Google Calendar
-    events_notion = notion.get_events(database)
-    events_google = gcalendar.get_events_notion(database)
+    window = database.sync.window(tier)
+    hot = window is not database.sync.cold
+    events_notion = traced(notion.get_events(database, window), "fetch.notion")
+    events_google = traced(
+        gcalendar.get_events_notion(database, window), "fetch.google"
+    )
 
-    # Map events from Notion to events from Google Calendar
-    events = map_events(events_notion, events_google)
+    # Map events from Notion to events from Google Calendar, while they arrive.
+    # The span also covers planning and the waves of mutations executed in between.
+    events = join_concurrently(
+        events_notion,
+        events_google,
+        key=lambda event: event.notion_page_id,
+        **(
+            {
+                "queue_size": settings.stream_queue_size,
+                "spill_threshold": settings.stream_spill_threshold,
+            }
+            if settings.streaming_sync
+            else {}
+        ),
+    )
+    events = traced(events, "map", "sync")
 
-    # Create/Update/Delete events
-    for event_notion, event_google in events:
+    def _plan_events(event_notion, event_google) -> None:
         # Update event
         if event_notion and event_google:
-            # Check if update is needed
-            if are_events_equivalent(event_notion, event_google):
-                continue
-
             event_notion.google_event_id = event_google.google_event_id
-            gcalendar.update_event_from_notion(event_notion)
+            plan.add(Mutation("update", event_notion, event_google))
 
         # Add event
         if event_notion and not event_google:
-            # Dont create new events that are older that 5 days
-            if is_older_than(event_notion):
-                continue
+            # Dont create new events that are older than the cutoff
+            if is_older_than(event_notion, database.sync.create_cutoff_days):
+                return
 
-            gcalendar.create_event_from_notion(event_notion)
+            plan.add(Mutation("create", event_notion))
 
         # Remove event
-        if not event_notion and event_google:
-            gcalendar.delete_event_notion(event_google)
+        if not event_notion and event_google and not hot:
+            plan.add(Mutation("delete", event_google))
+
+    def _plan_missing() -> None:
+        # Look up events that moved into the hot window, in batch
+        if not missing:
+            return
+
+        events_found = gcalendar.find_events_notion_batch(
+            database, [event_notion.notion_page_id for event_notion in missing]
+        )
+        for event_notion in missing:
+            _plan_events(event_notion, events_found.get(event_notion.notion_page_id))
+        missing.clear()
+
+    # Plan Create/Update/Delete events
+    missing = []
+    for event_notion, event_google in events:
+        if hot and event_notion and not event_google:
+            missing.append(event_notion)
+            if len(missing) >= BATCH_SIZE:
+                _plan_missing()
+        else:
+            _plan_events(event_notion, event_google)
+
+        # Execute resolved mutations while the remaining events arrive
+        if len(plan) >= PLAN_WAVE_SIZE:
+            executor.execute(plan)
+
+    _plan_missing()
+    executor.execute(plan)
+    executor.complete(plan)
 
     logger.info(f"Done syncing database {database.name}!")
+
+    return plan
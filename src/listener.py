@@ -0,0 +1,391 @@
+import argparse
+import hmac
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+from urllib.parse import unquote
+
+import pendulum as dt
+from googleapiclient.errors import HttpError
+
+from src.api_client.google import GCalendar
+from src.common.state import read_state, write_state
+from src.main import main, read_config
+from src.models.config import Config
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = "watch_channels"
+
+# Lifetime requested for Google Calendar watch channels
+CHANNEL_TTL_SECONDS = 7 * 24 * 3600
+
+# Channels are checked every interval and replaced when they expire within the margin
+CHANNEL_RENEW_INTERVAL_SECONDS = 3600
+CHANNEL_RENEW_MARGIN_SECONDS = 24 * 3600
+
+# Seconds a triggered sync waits for a running sync, e.g. of the cron schedule, to finish
+LOCK_TIMEOUT_SECONDS = 900
+
+# Notifications with this state only confirm a new channel, they are not changes
+RESOURCE_STATE_SYNC = "sync"
+
+# Webhook calls carry everything in their path and headers, larger bodies are refused
+MAX_BODY_BYTES = 64 * 1024
+
+# Hosts that only accept local connections, an unauthorized listener may only bind to these
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+
+class TriggerQueue:
+    """
+    Coalesces sync triggers per source and runs them on a single worker thread.
+
+    A source runs once no trigger arrived for "debounce_seconds", or at the latest "max_delay_seconds"
+    after its first pending trigger. Sources that are due together are synced in one run, and a
+    trigger that arrives during a run queues the source again.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[List[str]], None],
+        debounce_seconds: float,
+        max_delay_seconds: float,
+    ):
+        self.run = run
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max(max_delay_seconds, debounce_seconds)
+
+        # Time of the first and last pending trigger per source
+        self.pending: Dict[str, Tuple[float, float]] = {}
+
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.work, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the worker after the current run, pending triggers are dropped.
+        """
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+
+    def trigger(self, source: str) -> None:
+        now = time.monotonic()
+        with self.condition:
+            first, _ = self.pending.get(source, (now, now))
+            self.pending[source] = (first, now)
+            self.condition.notify()
+
+    def due_at(self, first: float, last: float) -> float:
+        return min(last + self.debounce_seconds, first + self.max_delay_seconds)
+
+    def next_due(self) -> Optional[List[str]]:
+        """
+        Wait until at least one source is due and take the due sources from the queue.
+
+        :return: None when the queue is stopped.
+        """
+
+        with self.condition:
+            while not self.stopped:
+                now = time.monotonic()
+                due_at = {
+                    source: self.due_at(*times)
+                    for source, times in self.pending.items()
+                }
+                due = sorted(source for source, at in due_at.items() if at <= now)
+                if due:
+                    for source in due:
+                        del self.pending[source]
+                    return due
+
+                self.condition.wait(min(due_at.values()) - now if due_at else None)
+
+        return None
+
+    def work(self) -> None:
+        while True:
+            sources = self.next_due()
+            if sources is None:
+                return
+
+            logger.info(f"Syncing {', '.join(sources)}.")
+            try:
+                self.run(sources)
+            except Exception:
+                logger.exception(f"Sync of {', '.join(sources)} failed.")
+
+
+class WatchChannels:
+    """
+    Google Calendar push notification channels of the synced calendars, kept in the state.
+    """
+
+    def __init__(self, gcalendar: GCalendar):
+        self.gcalendar = gcalendar
+        self.channels: Dict[str, Dict] = read_state(STATE_NAME, {})
+        self.lock = threading.Lock()
+
+    def calendar_id(self, channel_id: str, token: str) -> Optional[str]:
+        """
+        Get the calendar a notification is about, None for unknown channels or a wrong token.
+        """
+
+        channel = self.channels.get(channel_id)
+        if channel and hmac.compare_digest(channel["token"], token):
+            return channel["calendar_id"]
+
+        return None
+
+    def renew(
+        self, calendar_ids: Iterable[str], address: str, now: dt.DateTime = None
+    ) -> None:
+        """
+        Open a channel for every calendar that has no channel to the address that outlives the renewal
+        margin. Channels that are replaced or no longer needed are stopped.
+        """
+
+        now = now or dt.now()
+        renew_before = now.add(seconds=CHANNEL_RENEW_MARGIN_SECONDS)
+        calendar_ids = set(calendar_ids)
+
+        with self.lock:
+            channels = dict(self.channels)
+
+            # Keep channels that stay open long enough
+            keep = {
+                channel_id
+                for channel_id, channel in channels.items()
+                if channel["calendar_id"] in calendar_ids
+                and channel["address"] == address
+                and dt.from_timestamp(channel["expiration"] / 1000) > renew_before
+            }
+            covered = {channels[channel_id]["calendar_id"] for channel_id in keep}
+
+            # Open new channels
+            for calendar_id in sorted(calendar_ids - covered):
+                channel_id, token = str(uuid.uuid4()), secrets.token_urlsafe(32)
+                try:
+                    response = self.gcalendar.watch_events(
+                        calendar_id, channel_id, address, token, CHANNEL_TTL_SECONDS
+                    )
+                except HttpError as e:
+                    logger.warning(f"Failed to watch calendar {calendar_id}: {e}.")
+                    continue
+
+                logger.info(f"Watching calendar {calendar_id} on channel {channel_id}.")
+                channels[channel_id] = {
+                    "calendar_id": calendar_id,
+                    "address": address,
+                    "token": token,
+                    "resource_id": response["resourceId"],
+                    "expiration": int(response["expiration"]),
+                }
+                keep.add(channel_id)
+
+            # Stop the other channels, expired ones are only forgotten
+            for channel_id in set(channels) - keep:
+                channel = channels.pop(channel_id)
+                if dt.from_timestamp(channel["expiration"] / 1000) <= now:
+                    continue
+                try:
+                    self.gcalendar.stop_channel(channel_id, channel["resource_id"])
+                except HttpError as e:
+                    logger.warning(f"Failed to stop channel {channel_id}: {e}.")
+
+            self.channels = channels
+            write_state(STATE_NAME, channels)
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """
+    Http server that turns webhook calls into sync triggers.
+
+    - `POST /trigger/<source>` syncs a single database or ical calendar, authorized with the
+      `Authorization: Bearer <token>` header when a token is set.
+    - `POST /google` receives the notifications of the watch channels and syncs every source of the
+      changed calendar. Changes made by the sync itself also cause notifications, the resulting
+      sync finds nothing to do.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        queue: TriggerQueue,
+        config: Config,
+        channels: Optional[WatchChannels] = None,
+        token: Optional[str] = None,
+    ):
+        super().__init__(address, WebhookHandler)
+        self.queue = queue
+        self.channels = channels
+        self.token = token
+
+        self.sources: Dict[str, str] = {
+            source.name: source.calendar_id
+            for source in [*config.databases, *config.icals]
+        }
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    server: WebhookServer
+
+    def do_POST(self) -> None:
+        try:
+            content_length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            content_length = -1
+        if not 0 <= content_length <= MAX_BODY_BYTES:
+            # The body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self.send_response(413 if content_length > MAX_BODY_BYTES else 400)
+            self.end_headers()
+            return
+
+        # Drain the body, the path and headers contain everything that is needed
+        self.rfile.read(content_length)
+
+        if self.path.startswith("/trigger/"):
+            self.handle_trigger(self.path[len("/trigger/") :])
+        elif self.path == "/google":
+            self.handle_notification(self.headers)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def handle_trigger(self, source: str) -> None:
+        # Source names may contain spaces
+        source = unquote(source)
+        token = self.server.token
+        if token and not hmac.compare_digest(
+            self.headers.get("Authorization", ""), f"Bearer {token}"
+        ):
+            self.send_response(401)
+        elif source not in self.server.sources:
+            self.send_response(404)
+        else:
+            logger.info(f"Received trigger for {source}.")
+            self.server.queue.trigger(source)
+            self.send_response(202)
+        self.end_headers()
+
+    def handle_notification(self, headers: Mapping[str, str]) -> None:
+        calendar_id = None
+        if self.server.channels is not None:
+            calendar_id = self.server.channels.calendar_id(
+                headers.get("X-Goog-Channel-ID", ""),
+                headers.get("X-Goog-Channel-Token", ""),
+            )
+
+        if calendar_id is None:
+            logger.warning(
+                f"Ignoring notification of unknown channel {headers.get('X-Goog-Channel-ID')}."
+            )
+        elif headers.get("X-Goog-Resource-State") != RESOURCE_STATE_SYNC:
+            logger.info(f"Received change notification for calendar {calendar_id}.")
+            for source, source_calendar_id in self.server.sources.items():
+                if source_calendar_id == calendar_id:
+                    self.server.queue.trigger(source)
+
+        # Google retries notifications that are not acknowledged
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+
+def renew_channels(
+    channels: WatchChannels,
+    calendar_ids: Iterable[str],
+    address: str,
+    stopped: threading.Event,
+) -> None:
+    """
+    Keep the watch channels open until stopped.
+    """
+
+    while True:
+        try:
+            channels.renew(calendar_ids, address)
+        except Exception:
+            logger.exception("Failed to renew watch channels.")
+        if stopped.wait(CHANNEL_RENEW_INTERVAL_SECONDS):
+            return
+
+
+def listen(port: int, address: Optional[str] = None, host: str = "") -> None:
+    # Anyone who can reach an unauthorized listener can trigger syncs
+    token = os.environ.get("WEBHOOK_TOKEN") or None
+    if not token and host not in LOCAL_HOSTS:
+        raise ValueError(
+            "WEBHOOK_TOKEN must be set to listen on other hosts than localhost."
+        )
+
+    config = read_config()
+
+    # Triggered runs only sync some sources, they neither replace the report nor ping monitoring
+    queue = TriggerQueue(
+        lambda sources: main(
+            only=sources, lock_timeout=LOCK_TIMEOUT_SECONDS, report=False
+        ),
+        config.settings.webhook_debounce_seconds,
+        config.settings.webhook_max_delay_seconds,
+    )
+
+    # Watch the calendars of all sources when the listener is reachable for Google
+    channels, stopped = None, threading.Event()
+    if address:
+        channels = WatchChannels(GCalendar(config.settings))
+        calendar_ids = {
+            source.calendar_id for source in [*config.databases, *config.icals]
+        }
+        threading.Thread(
+            target=renew_channels,
+            args=(channels, calendar_ids, address, stopped),
+            daemon=True,
+        ).start()
+
+    if not token:
+        logger.warning(
+            "WEBHOOK_TOKEN is not set, trigger requests are only accepted from localhost."
+        )
+
+    server = WebhookServer((host, port), queue, config, channels, token)
+    queue.start()
+    logger.info(f"Listening on port {server.server_address[1]}.")
+    try:
+        server.serve_forever()
+    finally:
+        stopped.set()
+        server.server_close()
+        queue.stop()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--port", type=int, default=8080)
+    # Public https url of the `/google` endpoint, Google Calendar changes are only pushed when set
+    arg_parser.add_argument("--address", required=False)
+    # Interface to listen on, all by default. Without WEBHOOK_TOKEN only localhost is allowed
+    arg_parser.add_argument("--host", default="")
+    args = arg_parser.parse_args()
+
+    listen(port=args.port, address=args.address, host=args.host)
+
+    sys.stdout.flush()
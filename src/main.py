@@ -1,46 +1,305 @@
+import json
 import logging
+import os
 from pathlib import Path
 import sys
 import requests
 import yaml
 import argparse
-from typing import Optional
+import pendulum as dt
+from typing import List, Optional
 
 from src.models.config import Config
+from src.models.database import Database
+from src.models.plan import SyncPlan
 from src.api_client.google import GCalendar
 from src.api_client.ical import ICal
 from src.api_client.notion import Notion
+from src.common.cassette import Cassette
+from src.common.deadline import (
+    BudgetExceeded,
+    Deadline,
+    order_deferred_first,
+    record_deferred,
+)
+from src.common.log import event_log, setup_logging
+from src.common.profiling import NullProfiler, Profiler
+from src.common.scheduler import get_due_sources, record_poll
+from src.common.state import StateLocked, lock_state
+from src.common.tracing import set_source, span, trace_run
+from src.common.tiers import get_due_tiers, record_cold_sync, request_cold_sync
+from src.common.utils import slugify
+from src.jobs.executor import DryRunExecutor, GCalendarExecutor
+from src.jobs.reconcile import reconcile
 from src.jobs.sync_ical import sync_icalendar
 from src.jobs.sync_notion import sync_database
 
-logging.basicConfig(
-    format="%(asctime)s %(levelname)-8s %(message)s", level=logging.INFO
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
+CONFIG_PATH = Path(__file__).parents[1] / "config" / "config.yaml"
+
+REPORT_PATH = Path(__file__).parents[1] / "logs" / "report.json"
+
+LOCK_NAME = "run"
+
+
+def read_config() -> Config:
+    """
+    Read the config file.
+    """
+
+    with open(CONFIG_PATH, "r") as f:
+        return Config.from_dict(yaml.safe_load(f))
+
+
+def dump_plans(plans: List[SyncPlan], directory: Path) -> None:
+    """
+    Write the executed sync plan of every source to a json file for inspection.
+    """
+
+    directory.mkdir(parents=True, exist_ok=True)
+    for plan in plans:
+        with open(directory / f"{slugify(plan.source)}.json", "w") as f:
+            json.dump(plan.dump(), f, indent=2, ensure_ascii=False)
+
+
+def write_report(
+    plans: List[SyncPlan], deferred: List[str], now: dt.DateTime, path: Path
+) -> None:
+    """
+    Write the mutation counts and propagation lag of every synced source, replacing the last report.
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "time": now.isoformat(),
+                "sources": {
+                    plan.source: {"counts": plan.counts(), "lag": plan.lags.dump()}
+                    for plan in plans
+                },
+                "deferred": deferred,
+            },
+            f,
+            indent=2,
+            ensure_ascii=False,
+        )
+
+
+def main(
+    push_url: Optional[str] = None,
+    dry_run: bool = False,
+    dump_plan: Optional[Path] = None,
+    only: Optional[List[str]] = None,
+    lock_timeout: float = 0,
+    profile: Optional[Path] = None,
+    record: Optional[Path] = None,
+    replay: Optional[Path] = None,
+    latency_factor: float = 1.0,
+    report: bool = True,
+):
+    # A replay runs offline against a recorded cassette, with its own state
+    if replay:
+        cassette = Cassette.load(replay, latency_factor)
+        with cassette.offline():
+            sync(read_config(), None, dry_run, dump_plan, only, profile, cassette)
+        return
 
-def main(push_url: Optional[str] = None):
-    # Config
-    with open(Path(__file__).parents[1] / "config" / "config.yaml", "r") as f:
-        config = Config.from_dict(yaml.safe_load(f))
+    cassette = Cassette(record) if record else None
+
+    # Runs never overlap, a run that cannot get the lock in time is skipped
+    try:
+        with lock_state(LOCK_NAME, lock_timeout):
+            config = read_config()
+            with trace_run(config.settings, dt.now()):
+                sync(
+                    config,
+                    push_url,
+                    dry_run,
+                    dump_plan,
+                    only,
+                    profile,
+                    cassette,
+                    report,
+                )
+    except StateLocked:
+        logger.warning("Another run is still in progress, skipping this run.")
+    finally:
+        if cassette:
+            cassette.save()
+
+
+def sync(
+    config: Config,
+    push_url: Optional[str] = None,
+    dry_run: bool = False,
+    dump_plan: Optional[Path] = None,
+    only: Optional[List[str]] = None,
+    profile: Optional[Path] = None,
+    cassette: Optional[Cassette] = None,
+    report: bool = True,
+):
+    now = dt.now()
+    replaying = cassette is not None and cassette.replaying
+
+    # Profiles of every run go to their own directory, profiling adds no overhead when disabled
+    profile = profile or (
+        Path(os.environ["PROFILE_DIR"]) if os.environ.get("PROFILE_DIR") else None
+    )
+    profiler = (
+        Profiler(profile / now.format("YYYYMMDD-HHmmss")) if profile else NullProfiler()
+    )
+
+    run_deadline = Deadline(config.settings.run_budget_seconds)
+    event_log.sample_rate = config.settings.event_log_sample_rate
 
     # API clients
-    gcalendar = GCalendar()
-    notion = Notion()
-    ical = ICal()
+    gcalendar = GCalendar(config.settings, cassette)
+    notion = Notion(config.settings, cassette)
+    ical = ICal(config.settings, cassette)
+    gcalendar.deadline = run_deadline
+
+    # A replay syncs the recorded sources
+    if replaying:
+        only = only or list(cassette.tiers)
+
+    # Only sync the requested sources, or only poll the sources of which the poll interval has passed
+    databases, icals = config.databases, config.icals
+    if only:
+        unknown = set(only) - {source.name for source in [*databases, *icals]}
+        if unknown:
+            raise ValueError(f"Unknown sources: {', '.join(sorted(unknown))}.")
+        databases = [database for database in databases if database.name in only]
+        icals = [icalendar for icalendar in icals if icalendar.name in only]
+    elif config.settings.adaptive_polling:
+        databases = get_due_sources(databases, now)
+        icals = get_due_sources(icals, now)
+
+    # Sync the hot window of every source, and the cold window of sources that are due
+    sources = [*databases, *icals]
+    tiers = get_due_tiers(sources)
+    if replaying:
+        tiers = {source.name: cassette.tiers[source.name] for source in sources}
+    elif cassette:
+        cassette.time, cassette.tiers = now, tiers
+
+    # List calendars that are shared by multiple sources only once
+    with profiler.phase("listings"), span("listings"):
+        gcalendar.plan_listings(
+            sources,
+            windows={
+                source.name: source.sync.window(tiers[source.name])
+                for source in sources
+            },
+        )
+        if config.settings.batch_reads:
+            try:
+                gcalendar.prefetch_listings()
+            except BudgetExceeded:
+                logger.warning("Time budget exceeded while prefetching listings.")
+
+    # Planned mutations are only logged in a dry run
+    executor = DryRunExecutor() if dry_run else GCalendarExecutor(gcalendar)
+    plans: List[SyncPlan] = []
+    synced, deferred = [], []
+
+    # Sync all notion databases and icalendars, sources that ran out of budget last run first
+    for source in order_deferred_first(sources):
+        # Every request of the source is bounded by the budget of the source and of the run
+        deadline = Deadline(config.settings.source_budget_seconds, run_deadline)
+        if deadline.expired():
+            logger.warning(f"Run time budget exceeded, deferring {source.name}.")
+            deferred.append(source.name)
+            gcalendar.release_listing(source.calendar_id)
+            continue
+        notion.deadline = ical.deadline = gcalendar.deadline = deadline
+
+        set_source(source.name)
+        with profiler.phase(source.name), span("job", "job", tier=tiers[source.name]):
+            try:
+                if isinstance(source, Database):
+                    plan = sync_database(
+                        notion,
+                        gcalendar,
+                        source,
+                        executor,
+                        config.settings,
+                        tiers[source.name],
+                    )
+                else:
+                    plan = sync_icalendar(
+                        ical,
+                        gcalendar,
+                        source,
+                        executor,
+                        config.settings,
+                        tiers[source.name],
+                    )
+            except BudgetExceeded:
+                logger.warning(
+                    f"Time budget exceeded while syncing {source.name}, resuming in the next run."
+                )
+                deferred.append(source.name)
+                continue
+            finally:
+                # Release the planned listing of the calendar, close the journal of the source, log the
+                # mutations of the source and save the writes of the job to the calendar mirrors, also
+                # when the job failed
+                gcalendar.release_listing(source.calendar_id)
+                executor.close(source.name)
+                event_log.summary(source.name)
+                if gcalendar.mirror:
+                    gcalendar.mirror.save()
+
+        plans.append(plan)
+        synced.append(source.name)
+        if plan.lags.count:
+            logger.info(
+                f"Propagation lag of {source.name}: {plan.lags.quantile(0.5):.0f}s median, "
+                f"{plan.lags.quantile(0.9):.0f}s p90, {plan.lags.max_seconds:.0f}s max."
+            )
+        if tiers[source.name] == "cold" and not dry_run:
+            record_cold_sync(source)
+        if config.settings.adaptive_polling and not dry_run:
+            record_poll(source, plan.counts(), config.settings, now)
+
+    set_source(None)
+
+    # Catch manual edits in Google Calendar between cold syncs, without listing the calendars in full.
+    # Sources without a hot window are synced cold every run anyway.
+    if config.settings.reconcile_ranges and not dry_run:
+        gcalendar.deadline = run_deadline
+        with profiler.phase("reconcile"), span("reconcile"):
+            try:
+                drifted = reconcile(
+                    gcalendar,
+                    [
+                        source
+                        for source in [*config.databases, *config.icals]
+                        if source.sync.hot
+                    ],
+                    config.settings,
+                )
+                request_cold_sync(drifted)
+            except BudgetExceeded:
+                logger.warning("Time budget exceeded while reconciling calendars.")
 
-    # Sync all notion databases
-    for database in config.databases:
-        sync_database(notion, gcalendar, database)
+    if not dry_run:
+        record_deferred(synced, deferred)
+    profiler.close()
 
-    # Sync all icalendars
-    for icalendar in config.icals:
-        sync_icalendar(ical, gcalendar, icalendar)
+    if dump_plan:
+        dump_plans(plans, dump_plan)
+    # Partial runs, e.g. of webhook triggers, do not replace the report of the scheduled runs
+    if report and not replaying:
+        write_report(plans, deferred, now, REPORT_PATH)
 
     # Ping monitoring url
     if push_url:
         try:
-            requests.get(push_url)
+            requests.get(push_url, timeout=config.settings.read_timeout_seconds)
         except Exception as e:
             logger.warning(f"Failed to reach Uptime Kuma push url: {e}.")
 
@@ -51,8 +310,30 @@ if __name__ == "__main__":
     # Optional Uptime Kuma push url for monitoring
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument("--url", required=False)
+    # Only plan the mutations, without writing to Google Calendar
+    arg_parser.add_argument("--dry-run", action="store_true")
+    # Directory to write the sync plan of every source to
+    arg_parser.add_argument("--dump-plan", type=Path, required=False)
+    # Only sync the named database or ical calendar, can be repeated
+    arg_parser.add_argument("--only", action="append", metavar="SOURCE")
+    # Directory to write cpu and memory profiles of every sync job to, or set PROFILE_DIR
+    arg_parser.add_argument("--profile", type=Path, required=False)
+    # Record the responses of all api calls to a cassette, or replay a cassette offline
+    arg_parser.add_argument("--record", type=Path, required=False)
+    arg_parser.add_argument("--replay", type=Path, required=False)
+    # Scale the recorded latencies during a replay, 0 to replay without waiting
+    arg_parser.add_argument("--latency-factor", type=float, default=1.0)
     args = arg_parser.parse_args()
 
-    main(push_url=args.url)
+    main(
+        push_url=args.url,
+        dry_run=args.dry_run,
+        dump_plan=args.dump_plan,
+        only=args.only,
+        profile=args.profile,
+        record=args.record,
+        replay=args.replay,
+        latency_factor=args.latency_factor,
+    )
 
     sys.stdout.flush()
@@ -3,18 +3,22 @@ from typing import Any, List, Mapping
 
 from src.models.database import Database
 from src.models.ical import ICalendar
+from src.models.settings import Settings
 
 
 @dataclass
 class Config:
     databases: List[Database]
     icals: List[ICalendar]
+    settings: Settings
 
     @classmethod
     def from_dict(cls, data: Mapping[str, Any]):
         databases = data.get("databases", [])
         icals = data.get("icals", [])
+        settings = data.get("settings") or {}
         return cls(
             databases=[Database.from_dict(_) for _ in databases],
             icals=[ICalendar.from_dict(_) for _ in icals],
+            settings=Settings.from_dict(settings),
         )
@@ -1,6 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, Mapping
 
+from src.models.sync_window import SyncTiers
+
 
 class WorkspaceName(str):
     pass
@@ -48,6 +50,9 @@ class Database:
 
     icon_property: str = None
 
+    # Synced time windows
+    sync: SyncTiers = field(default_factory=SyncTiers)
+
     def __post_init__(self):
         self.icon_property = self.icon_property_path.split("/")[0]
 
@@ -63,4 +68,5 @@ class Database:
             icon_property_path=data["icon_property_path"],
             icon_value_mapping=data["icon_value_mapping"],
             icon_default=data["icon_default"],
+            sync=SyncTiers.from_dict(data.get("sync") or {}),
         )
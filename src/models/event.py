@@ -33,6 +33,11 @@ class CalendarEvent:
     recurrence_start: Optional[dt.DateTime] = None
     recurrence_id: Optional[str] = None
     google_event_id: str = ""
+    google_etag: str = ""
+
+    # Isoformat time the event was last edited at its source, to measure how long edits take to reach
+    # Google Calendar. Only parsed for the events that are written.
+    last_modified: Optional[str] = None
 
 
 @dataclass(kw_only=True)
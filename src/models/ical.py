@@ -1,6 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, Mapping
 
+from src.models.sync_window import SyncTiers
+
 
 @dataclass
 class ICalendar:
@@ -17,10 +19,14 @@ class ICalendar:
     # Corresponding Google Calendar id to sync to
     calendar_id: str
 
+    # Synced time windows
+    sync: SyncTiers = field(default_factory=SyncTiers)
+
     @classmethod
     def from_dict(cls, data: Mapping[str, Any]):
         return cls(
             name=data["name"],
             url=data["url"],
             calendar_id=data["calendar_id"],
+            sync=SyncTiers.from_dict(data.get("sync") or {}),
         )
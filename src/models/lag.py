@@ -0,0 +1,79 @@
+import math
+from dataclasses import dataclass, field
+from typing import Any, List, Mapping
+
+# Upper bounds in seconds of the buckets of a lag histogram, lags above the last bound get their own bucket
+LAG_BUCKETS = [
+    10,
+    30,
+    60,
+    2 * 60,
+    5 * 60,
+    10 * 60,
+    15 * 60,
+    30 * 60,
+    3600,
+    2 * 3600,
+    6 * 3600,
+    24 * 3600,
+    7 * 24 * 3600,
+]
+
+
+@dataclass
+class LagHistogram:
+    """
+    Distribution of the time between an edit at the source and its write to Google Calendar.
+    """
+
+    counts: List[int] = field(default_factory=lambda: [0] * (len(LAG_BUCKETS) + 1))
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        # Source clocks can be slightly ahead
+        seconds = max(seconds, 0.0)
+
+        bucket = next(
+            (i for i, bound in enumerate(LAG_BUCKETS) if seconds <= bound),
+            len(LAG_BUCKETS),
+        )
+        self.counts[bucket] += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket that holds the given quantile, the max for the last bucket.
+        """
+
+        rank = math.ceil(q * self.count)
+        seen = 0
+        for bound, count in zip(LAG_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_seconds)
+
+        return self.max_seconds
+
+    def dump(self) -> Mapping[str, Any]:
+        return {
+            "count": self.count,
+            "mean_seconds": self.total_seconds / self.count if self.count else None,
+            "max_seconds": self.max_seconds if self.count else None,
+            **{
+                f"p{round(q * 100)}_seconds": self.quantile(q) if self.count else None
+                for q in [0.5, 0.9, 0.99]
+            },
+            "buckets": {
+                **{
+                    f"le_{bound}": count
+                    for bound, count in zip(LAG_BUCKETS, self.counts)
+                },
+                "inf": self.counts[-1],
+            },
+        }
@@ -0,0 +1,169 @@
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Tuple,
+    Type,
+)
+
+import pendulum as dt
+
+from src.models.event import CalendarEvent, ICalCalendarEvent, NotionCalendarEvent
+from src.models.lag import LagHistogram
+
+
+@dataclass
+class Mutation:
+    """
+    A single planned write to Google Calendar.
+    """
+
+    kind: Literal["create", "update", "delete"]
+
+    # Event to create or update to, or the Google Calendar event to delete
+    event: Type[CalendarEvent]
+
+    # State of the event in Google Calendar before an update
+    event_google: Optional[Type[CalendarEvent]] = None
+
+    # Mutations with a lower priority are executed first
+    priority: Tuple[int, float] = field(init=False)
+
+    def __post_init__(self):
+        self.priority = event_priority(self.event)
+
+    @property
+    def key(self) -> Hashable:
+        """
+        Writes to the same Google Calendar event share a key.
+        """
+
+        if self.kind != "create":
+            return self.event.google_event_id
+        if isinstance(self.event, NotionCalendarEvent):
+            return ("create", self.event.notion_page_id)
+        if isinstance(self.event, ICalCalendarEvent):
+            return ("create", self.event.ical_uid, self.event.recurrence_start)
+        return ("create", id(self.event))
+
+    def dump(self) -> Mapping[str, Any]:
+        return {
+            "kind": self.kind,
+            "google_event_id": self.event.google_event_id or None,
+            "title": self.event.title,
+            "start": self.event.date.start.isoformat(),
+            "end": self.event.date.end.isoformat(),
+            "priority": list(self.priority),
+        }
+
+
+@dataclass
+class SyncPlan:
+    """
+    Planned writes of one sync job.
+
+    Repeated writes to the same Google Calendar event are coalesced and updates that would not change
+    the Google Calendar event are dropped.
+    """
+
+    source: str
+
+    # Check if the new and the Google Calendar version of an event are functionally equivalent
+    are_events_equivalent: Callable[[Any, Any], bool]
+
+    # Keep executed mutations for inspection, otherwise they are only counted
+    keep_done: bool = True
+
+    pending: Dict[Hashable, Mutation] = field(default_factory=dict)
+    done: List[Mutation] = field(default_factory=list)
+    nr_done: Dict[str, int] = field(
+        default_factory=lambda: {"create": 0, "update": 0, "delete": 0}
+    )
+
+    # Time from the edit at the source to the write to Google Calendar, of the written events
+    lags: LagHistogram = field(default_factory=LagHistogram)
+
+    def add(self, mutation: Mutation) -> None:
+        """
+        Add a mutation to the plan, coalescing it with pending writes to the same event.
+        """
+
+        # Drop no-op updates
+        if (
+            mutation.kind == "update"
+            and mutation.event_google
+            and self.are_events_equivalent(mutation.event, mutation.event_google)
+        ):
+            return
+
+        previous = self.pending.get(mutation.key)
+        if previous:
+            # Nothing is written to an event after it is deleted
+            if previous.kind == "delete":
+                return
+
+            # The last write wins, but the plan keeps the original Google Calendar state
+            if mutation.kind == "update":
+                mutation.event_google = previous.event_google
+                if previous.kind == "create":
+                    mutation.kind = "create"
+            mutation.priority = min(mutation.priority, previous.priority)
+
+        self.pending[mutation.key] = mutation
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def drain(self) -> List[Mutation]:
+        """
+        Take all pending mutations, upcoming events first.
+        """
+
+        mutations = sorted(self.pending.values(), key=lambda _: _.priority)
+        self.pending.clear()
+        for mutation in mutations:
+            self.nr_done[mutation.kind] += 1
+        if self.keep_done:
+            self.done.extend(mutations)
+
+        return mutations
+
+    def counts(self) -> Mapping[str, int]:
+        """
+        Nr of mutations per kind.
+        """
+
+        counts = dict(self.nr_done)
+        for mutation in self.pending.values():
+            counts[mutation.kind] += 1
+
+        return counts
+
+    def dump(self) -> Mapping[str, Any]:
+        return {
+            "source": self.source,
+            "counts": self.counts(),
+            "lag": self.lags.dump(),
+            "mutations": [
+                mutation.dump() for mutation in [*self.done, *self.pending.values()]
+            ],
+        }
+
+
+def event_priority(event: Type[CalendarEvent]) -> Tuple[int, float]:
+    """
+    Priority of a write to the given event: ongoing and upcoming events first, soonest first,
+    then past events, most recent first.
+    """
+
+    now = dt.now()
+    if event.date.end >= now:
+        return (0, max((event.date.start - now).total_seconds(), 0.0))
+
+    return (1, (now - event.date.end).total_seconds())
@@ -0,0 +1,97 @@
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional
+
+
+@dataclass
+class Settings:
+    """
+    Global tuning options for the sync.
+    """
+
+    # Nr of parallel time slices a Google Calendar listing is split into
+    list_shards: int = 1
+
+    # How far into the future the sliced part of a sharded listing reaches,
+    # events after the horizon are listed by the last, open-ended slice
+    list_shard_horizon_days: int = 365
+
+    # Plan a listing for every calendar and fetch their first pages in batch http calls
+    batch_reads: bool = False
+
+    # Derive Google Calendar event ids from the Notion page id or ical uid,
+    # this makes creating events idempotent
+    deterministic_ids: bool = False
+
+    # Send only the changed fields of an event when updating, conditional on its etag
+    patch_updates: bool = True
+
+    # Cache parsed ICal events across runs, keyed by the hash of their raw VEVENT block
+    ical_parse_cache: bool = True
+
+    # Skip recurring ICal events of which the last occurence (UNTIL/COUNT) ends before the sync window
+    prune_expired_series: bool = True
+
+    # Parse ICal feeds in a process pool when at least this many events need to be parsed
+    ical_parallel_threshold: int = 5000
+
+    # Nr of processes to parse ICal feeds with, 0 for the nr of cpus. Feeds are parsed serially by default
+    ical_parse_workers: int = 1
+
+    # Sync with bounded memory: events are streamed through bounded queues, join buffers spill to disk
+    # and executed mutations are only counted. Still held in full: the recurring ICal events that have
+    # exceptions, the compact records of a feed with "ical_parse_cache" or "prune_expired_series"
+    streaming_sync: bool = False
+
+    # Nr of events that may be queued between a fetching thread and the sync in streaming mode
+    stream_queue_size: int = 1000
+
+    # Nr of unmatched events held in memory per side before the rest is spilled to disk in streaming mode
+    stream_spill_threshold: int = 10000
+
+    # Poll every source at its own interval, adapted to how often it changes.
+    # The interval shrinks after a sync with mutations and grows after a sync without, within the bounds.
+    # Runs are still triggered by the cron schedule, sources that are not due are skipped.
+    adaptive_polling: bool = False
+    poll_interval_min_minutes: float = 5
+    poll_interval_max_minutes: float = 240
+
+    # Webhook listener: a triggered source is synced once no trigger arrived for the debounce time,
+    # or at the latest after the max delay during a burst of triggers
+    webhook_debounce_seconds: float = 5
+    webhook_max_delay_seconds: float = 30
+
+    # Time budget of a run and of every source within a run, unbounded when not set.
+    # The remaining budget caps the timeouts of every http call. Sources that run out of budget are
+    # skipped and synced first in the next run.
+    run_budget_seconds: Optional[float] = None
+    source_budget_seconds: Optional[float] = None
+
+    # Connect and read timeout of every http call
+    connect_timeout_seconds: float = 10
+    read_timeout_seconds: float = 60
+
+    # Fraction of runs that are traced, and where their spans are exported to:
+    # "file" writes a Chrome trace event file per run to logs/traces, "log" logs every span
+    trace_sample_rate: float = 0.0
+    trace_exporter: str = "file"
+
+    # Journal every create before and after it is written to Google Calendar, a sync that is
+    # interrupted then updates the events it already created instead of creating duplicates
+    journal_mutations: bool = False
+
+    # Reconcile the Google calendars with a local mirror after every run, to catch manual edits in
+    # Google Calendar between cold syncs. The cold window is split into this many ranges by event start,
+    # only ranges of which the digest of event ids and etags differs from the mirror are listed in full.
+    # Sources of a calendar that drifted are synced cold in the next run. 0 disables reconciliation.
+    reconcile_ranges: int = 0
+
+    # Nr of ranges with a matching digest that are listed in full anyway in every reconciliation
+    reconcile_sample_ranges: int = 1
+
+    # Fraction of created, updated and deleted events that get their own log line,
+    # every source logs a summary of its mutations regardless
+    event_log_sample_rate: float = 1.0
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]):
+        return cls(**data)
@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from typing import Any, Literal, Mapping, NamedTuple, Optional
+
+import pendulum as dt
+
+SyncTier = Literal["hot", "cold"]
+
+
+class TimeRange(NamedTuple):
+    time_min: dt.DateTime
+    time_max: Optional[dt.DateTime] = None
+
+    def contains(self, start: dt.DateTime, recurring: bool = False) -> bool:
+        """
+        See if an event that starts at the given time falls in the range.
+        Recurring events that started before the range can still have occurences in it.
+        """
+
+        return (recurring or start >= self.time_min) and (
+            self.time_max is None or start <= self.time_max
+        )
+
+
+@dataclass
+class SyncWindow:
+    """
+    Range of event start times that is synced, relative to the time of the sync.
+    """
+
+    # Nr of days before now
+    past_days: int = 30
+
+    # Nr of days after now, unbounded when not set
+    future_days: Optional[int] = None
+
+    def resolve(self) -> "TimeRange":
+        """
+        Absolute time range of the window for a sync that starts now.
+        """
+
+        now = dt.now()
+        return TimeRange(
+            time_min=now.subtract(days=self.past_days),
+            time_max=(
+                now.add(days=self.future_days) if self.future_days is not None else None
+            ),
+        )
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]):
+        return cls(**data)
+
+
+@dataclass
+class SyncTiers:
+    """
+    Sync windows of a source.
+
+    Without a hot window the cold window is synced every run. With a hot window, only the hot window is
+    synced every run and the cold window once every "cold_interval_minutes".
+    """
+
+    # Full range that is synced
+    cold: SyncWindow = field(default_factory=SyncWindow)
+
+    # Near-term range that is synced every run, e.g. the last day through the next 7 days
+    hot: Optional[SyncWindow] = None
+
+    # Minimum nr of minutes between syncs of the cold window
+    cold_interval_minutes: int = 60
+
+    # New events that started more than this nr of days ago are not created
+    create_cutoff_days: int = 5
+
+    def window(self, tier: SyncTier) -> SyncWindow:
+        return self.hot if tier == "hot" and self.hot else self.cold
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]):
+        return cls(
+            cold=SyncWindow.from_dict(data.get("cold") or {}),
+            hot=SyncWindow.from_dict(data["hot"]) if data.get("hot") else None,
+            cold_interval_minutes=data.get("cold_interval_minutes", 60),
+            create_cutoff_days=data.get("create_cutoff_days", 5),
+        )
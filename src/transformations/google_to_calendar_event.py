@@ -1,4 +1,6 @@
-from typing import Mapping, NamedTuple, Optional
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import Mapping
 import pendulum as dt
 import logging
 
@@ -13,24 +15,11 @@ from src.models.ical import ICalendar
 logger = logging.getLogger(__name__)
 
 
-class EventData(NamedTuple):
-    id: str
-    title: str
-    location: Optional[str]
-    date: CalendarEventDate
-
-
-def parse_event(event: Mapping) -> EventData:
+def parse_date(event: Mapping) -> CalendarEventDate | None:
     """
-    Parse json response of goole calendar event.
+    Parse the start and end of a goole calendar event.
     """
 
-    # General
-    id = event["id"]
-    title = event.get("summary", "Untitled")
-    location = event.get("location")
-
-    # Dates
     time_start = event["start"].get("dateTime")
     time_end = event["end"].get("dateTime")
     date_start = event["start"].get("date")
@@ -73,84 +62,35 @@ def parse_event(event: Mapping) -> EventData:
     if tz_end:
         date.end = date.end.set(tz=tz_end)
 
-    return EventData(id=id, title=title, location=location, date=date)
+    return date
 
 
-def google_to_notion_calendar_event(
-    event: Mapping, database: Database
-) -> NotionCalendarEvent | None:
+def parse_start(event: Mapping) -> datetime | None:
     """
-    Parse json response of a google calendar event to a calendar event.
+    Parse only the start of a goole calendar event, all-day events start at midnight UTC.
+    This is much cheaper than parsing its date, to filter events before they are used.
     """
 
-    # Get event data
-    event_data = parse_event(event)
-
-    # Get Notion-specific data
-    page_id = (
-        event.get("extendedProperties", {})
-        .get("shared", {})
-        .get(NotionCalendarEvent.notion_page_id_property_name)
-    )
-    event_title = (
-        event.get("extendedProperties", {})
-        .get("shared", {})
-        .get(NotionCalendarEvent.notion_title_property_name)
-    )
-    icon_property_value = (
-        event.get("extendedProperties", {})
-        .get("shared", {})
-        .get(NotionCalendarEvent.notion_icon_property_value_property_name)
-    )
-
-    # Validation
-    if not page_id:
-        logger.warning(
-            "An event from google calendar does not have the expected notion page property."
-        )
-        return None
+    start = event.get("start", {})
+    try:
+        if start.get("dateTime"):
+            return datetime.fromisoformat(start["dateTime"].replace("Z", "+00:00"))
+        if start.get("date"):
+            return datetime.fromisoformat(start["date"]).replace(tzinfo=timezone.utc)
+    except ValueError:
+        pass
 
-    # Create event
-    return NotionCalendarEvent(
-        database=database,
-        title=event_title,
-        date=event_data.date,
-        notion_page_id=page_id,
-        google_event_id=event_data.id,
-        icon_property_value=icon_property_value,
-    )
+    return None
 
 
-def google_to_ical_calendar_event(
-    event: Mapping, icalendar: ICalendar
-) -> ICalCalendarEvent | None:
+def parse_recurrence_start(event: Mapping) -> dt.DateTime | None:
     """
-    Parse json response of a google calendar event to an ical calendar event.
+    Parse the original start of an instance of a recurring goole calendar event.
     """
 
-    # Get event data
-    event_data = parse_event(event)
-
-    # Get ICal-specific data
     recurring_time_start = event.get("originalStartTime", {}).get("dateTime")
     recurring_date_start = event.get("originalStartTime", {}).get("date")
     recurring_tz = event.get("originalStartTime", {}).get("timeZone")
-    recurring_rule = event.get("recurrence", [None])[0]
-    recurring_id = event.get("recurringEventId")
-    ical_rrule = (
-        event.get("extendedProperties", {})
-        .get("shared", {})
-        .get(ICalCalendarEvent.ical_rrule_property_name)
-    )
-    ical_uid = (
-        event.get("extendedProperties", {})
-        .get("shared", {})
-        .get(ICalCalendarEvent.ical_uid_property_name)
-    )
-
-    # Validate
-    if not ical_uid:
-        return None
 
     # Parse recurring date: all-day event
     recurring_start = None
@@ -173,16 +113,94 @@ def google_to_ical_calendar_event(
     if recurring_tz:
         recurring_start = recurring_start.set(tz=recurring_tz)
 
+    return recurring_start
+
+
+class GoogleNotionCalendarEvent(NotionCalendarEvent):
+    """
+    Notion calendar event backed by the json response of a google calendar event.
+    The ids are read up front, the dates are parsed on first use. Every event that is compared with
+    its source version or planned as a mutation is parsed, only events that are left alone are not,
+    e.g. in the hot tier the events without a source version.
+    """
+
+    def __init__(self, event: Mapping, database: Database, shared: Mapping):
+        self.google_event = event
+        self.database = database
+        self.notion_page_id = shared.get(self.notion_page_id_property_name)
+        self.notion_page_url = event.get("source", {}).get("url", "")
+        self.google_event_id = event["id"]
+        self.google_etag = event.get("etag", "")
+        self.title = shared.get(self.notion_title_property_name)
+        self.icon_property_value = shared.get(
+            self.notion_icon_property_value_property_name
+        )
+
+    @cached_property
+    def date(self) -> CalendarEventDate | None:
+        return parse_date(self.google_event)
+
+
+class GoogleICalCalendarEvent(ICalCalendarEvent):
+    """
+    ICal calendar event backed by the json response of a google calendar event.
+    The ids are read up front, the dates are parsed on first use. Every event that is compared with
+    its source version or planned as a mutation is parsed, only events that are left alone are not,
+    e.g. in the hot tier the events without a source version.
+    """
+
+    def __init__(self, event: Mapping, icalendar: ICalendar, shared: Mapping):
+        self.google_event = event
+        self.icalendar = icalendar
+        self.ical_uid = shared.get(self.ical_uid_property_name)
+        self.ical_rrule = shared.get(self.ical_rrule_property_name)
+        self.google_event_id = event["id"]
+        self.google_etag = event.get("etag", "")
+        self.title = event.get("summary", "Untitled")
+        self.location = event.get("location")
+        self.status = event.get("status", "confirmed")
+        self.recurrence = event.get("recurrence", [None])[0]
+        self.recurrence_id = event.get("recurringEventId")
+
+    @cached_property
+    def date(self) -> CalendarEventDate | None:
+        return parse_date(self.google_event)
+
+    @cached_property
+    def recurrence_start(self) -> dt.DateTime | None:
+        return parse_recurrence_start(self.google_event)
+
+
+def google_to_notion_calendar_event(
+    event: Mapping, database: Database
+) -> NotionCalendarEvent | None:
+    """
+    Parse json response of a google calendar event to a calendar event.
+    """
+
+    # Validation
+    shared = event.get("extendedProperties", {}).get("shared", {})
+    if not shared.get(NotionCalendarEvent.notion_page_id_property_name):
+        logger.warning(
+            "An event from google calendar does not have the expected notion page property."
+        )
+        return None
+
+    # Create event
+    return GoogleNotionCalendarEvent(event, database, shared)
+
+
+def google_to_ical_calendar_event(
+    event: Mapping, icalendar: ICalendar
+) -> ICalCalendarEvent | None:
+    """
+    Parse json response of a google calendar event to an ical calendar event.
+    """
+
+    # Validate
+    shared = event.get("extendedProperties", {}).get("shared", {})
+    if not shared.get(ICalCalendarEvent.ical_uid_property_name):
+        return None
+
     # Create event
-    return ICalCalendarEvent(
-        icalendar=icalendar,
-        title=event_data.title,
-        recurrence=recurring_rule,
-        recurrence_start=recurring_start,
-        recurrence_id=recurring_id,
-        ical_rrule=ical_rrule,
-        date=event_data.date,
-        location=event_data.location,
-        google_event_id=event_data.id,
-        ical_uid=ical_uid,
-    )
+    return GoogleICalCalendarEvent(event, icalendar, shared)
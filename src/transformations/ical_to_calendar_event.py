@@ -1,8 +1,9 @@
-from typing import Optional
+from typing import List, NamedTuple, Optional, Tuple
 import pendulum as dt
 import datetime
 import logging
 import icalendar as ical
+from dateutil.rrule import rrulestr
 
 from src.common.utils import to_datetime
 from src.models.event import CalendarEventDate, ICalCalendarEvent
@@ -28,6 +29,9 @@ def ical_to_calendar_event(
     all_day: bool = True if type(event.get("DTSTART").dt) is datetime.date else False
     ical_rrule: Optional[ical.vRecur] = event.get("RRULE")
     ical_rid: Optional[ical.vDDDTypes] = event.get("RECURRENCE-ID")
+    ical_modified: Optional[ical.vDDDTypes] = event.get("LAST-MODIFIED") or event.get(
+        "DTSTAMP"
+    )
     rrule = None
 
     # Parse date
@@ -80,4 +84,151 @@ def ical_to_calendar_event(
         ical_rrule=ical_rrule,
         status=status,
         ical_uid=ical_uid,
+        last_modified=(
+            to_datetime(ical_modified.dt).isoformat() if ical_modified else None
+        ),
     )
+
+
+class ICalEventRecord(NamedTuple):
+    """
+    Compact and serializable representation of a parsed ical event.
+    Datetimes are stored as isoformat and timezone name.
+    """
+
+    ical_uid: str
+    title: str
+    location: Optional[str]
+    status: str
+    start: Tuple[str, str]
+    end: Tuple[str, str]
+    all_day: bool
+    ical_rrule: Optional[str]
+    recurrence_start: Optional[Tuple[str, str]]
+
+    # End of the last occurence of a recurring event, None if it recurs indefinitely
+    recurrence_end: Optional[Tuple[str, str]] = None
+
+    # LAST-MODIFIED, or DTSTAMP when the event has no LAST-MODIFIED
+    last_modified: Optional[str] = None
+
+
+def datetime_to_record(date: dt.DateTime) -> Tuple[str, str]:
+    return (date.isoformat(), date.timezone_name)
+
+
+def record_to_datetime(record: Tuple[str, str]) -> dt.DateTime:
+    iso, timezone_name = record
+    date = dt.parse(iso)
+
+    # Fixed offsets are already restored by parsing
+    if timezone_name and timezone_name[0] not in "+-":
+        try:
+            date = date.in_tz(timezone_name)
+        except Exception:
+            pass
+
+    return date
+
+
+def get_recurrence_end(event: ical.Event) -> Optional[dt.DateTime]:
+    """
+    Get the end of the last occurence of a recurring ical event, based on the UNTIL or COUNT of its RRULE.
+    With UNTIL this is an upper bound, the end of an occurence starting at UNTIL.
+    Returns None for events that recur indefinitely or when the last occurence cannot be determined.
+    """
+
+    ical_rrule: Optional[ical.vRecur] = event.get("RRULE")
+    if not ical_rrule or event.get("RDATE"):
+        return None
+    if "UNTIL" not in ical_rrule and "COUNT" not in ical_rrule:
+        return None
+
+    start = event.get("DTSTART").dt
+    end = event.get("DTEND").dt
+    if type(start) is datetime.date:
+        start = datetime.datetime.combine(start, datetime.time.min)
+        end = datetime.datetime.combine(end, datetime.time.min)
+
+    # The last occurence starts at or before UNTIL, which bounds the end without expanding the rule.
+    # A date UNTIL includes occurences on that day.
+    if "UNTIL" in ical_rrule:
+        until = ical_rrule["UNTIL"][0]
+        if type(until) is datetime.date:
+            until = datetime.datetime.combine(until, datetime.time.max)
+        return to_datetime(until) + (end - start)
+
+    # Only a COUNT needs expanding, its nr of occurences is bounded
+    try:
+        rule = rrulestr(ical_rrule.to_ical().decode("utf-8"), dtstart=start)
+        last = None
+        for last in rule:
+            pass
+    except Exception:
+        return None
+
+    if last is None:
+        return None
+
+    return to_datetime(last + (end - start))
+
+
+def calendar_event_to_record(
+    event: ICalCalendarEvent, recurrence_end: Optional[dt.DateTime] = None
+) -> ICalEventRecord:
+    """
+    Convert a parsed ical event to a compact record.
+    """
+
+    return ICalEventRecord(
+        ical_uid=event.ical_uid,
+        title=event.title,
+        location=event.location,
+        status=event.status,
+        start=datetime_to_record(event.date.start),
+        end=datetime_to_record(event.date.end),
+        all_day=event.date.all_day,
+        ical_rrule=event.ical_rrule,
+        recurrence_start=datetime_to_record(event.recurrence_start)
+        if event.recurrence_start
+        else None,
+        recurrence_end=datetime_to_record(recurrence_end) if recurrence_end else None,
+        last_modified=event.last_modified,
+    )
+
+
+def record_to_calendar_event(
+    record: ICalEventRecord, icalendar: ICalendar
+) -> ICalCalendarEvent:
+    """
+    Restore a calendar event from its compact record.
+    """
+
+    return ICalCalendarEvent(
+        icalendar=icalendar,
+        title=record.title,
+        location=record.location,
+        date=CalendarEventDate(
+            record_to_datetime(record.start),
+            record_to_datetime(record.end),
+            record.all_day,
+        ),
+        recurrence="RRULE:" + record.ical_rrule if record.ical_rrule else None,
+        recurrence_start=record_to_datetime(record.recurrence_start)
+        if record.recurrence_start
+        else None,
+        ical_rrule=record.ical_rrule,
+        status=record.status,
+        ical_uid=record.ical_uid,
+        last_modified=record.last_modified,
+    )
+
+
+def record_from_json(data: List) -> ICalEventRecord:
+    """
+    Restore a record from its json (list) representation.
+    """
+
+    data = [tuple(_) if isinstance(_, list) else _ for _ in data]
+
+    return ICalEventRecord(*data)
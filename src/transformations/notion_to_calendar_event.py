@@ -1,59 +1,132 @@
-from typing import Mapping
+import re
+from functools import lru_cache
+from typing import Iterable, List, Mapping, Tuple
+
 import pendulum as dt
 
 from src.models.database import Database
 from src.models.event import CalendarEventDate, NotionCalendarEvent
 
+DATE_FORMATS = [
+    ("YYYY-MM-DD", True),
+    ("YYYY-MM-DDTHH:mm:ssZ", False),
+    ("YYYY-MM-DDTHH:mm:ss.SSSZ", False),
+]
 
-def page_to_calendar_event(page: Mapping, database: Database) -> NotionCalendarEvent:
+# Shape of the dates returned by the Notion api, parsed without pendulum's format tokenizer
+DATE_PATTERN = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})"
+    r"(?:T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{3}))?([+-])(\d{2}):(\d{2}))?"
+)
+
+
+class PageTransformer:
     """
-    Parse json config of a notion page to a calendar event.
+    Converts Notion query results of one database to calendar events.
+    Property lookups are resolved once per database instead of once per page.
     """
 
-    # Get page data
-    id = page["id"]
-    url = page["url"]
-    title = page["properties"][database.title_property]["title"][0]["plain_text"]
-    date_start_string = page["properties"][database.date_property]["date"]["start"]
-    date_end_string = page["properties"][database.date_property]["date"]["end"]
-
-    icon_property_value = page["properties"][database.icon_property]
-    for _ in database.icon_property_path.split("/")[1:]:
-        icon_property_value = icon_property_value[_]
-
-    # Parse date
-    date = {
-        "start": None,
-        "end": None,
-        "all_day": True,
-    }
-    for date_string, date_name in zip(
-        [date_start_string, date_end_string],
-        date.keys(),
-    ):
-        if not date_string:
-            continue
-        for date_format, all_day in zip(
-            ["YYYY-MM-DD", "YYYY-MM-DDTHH:mm:ssZ", "YYYY-MM-DDTHH:mm:ss.SSSZ"],
-            [True, False, False],
-        ):
+    def __init__(self, database: Database):
+        self.database = database
+        self.title_property = database.title_property
+        self.date_property = database.date_property
+        self.icon_property = database.icon_property
+        self.icon_path = tuple(database.icon_property_path.split("/")[1:])
+
+    def __call__(self, pages: Iterable[Mapping]) -> List[NotionCalendarEvent]:
+        """
+        Convert a batch of pages, e.g. one page of query results.
+        """
+
+        return [self.transform_page(page) for page in pages]
+
+    def transform_page(self, page: Mapping) -> NotionCalendarEvent:
+        """
+        Convert a single page.
+        """
+
+        # Get page data
+        properties = page["properties"]
+        title = properties[self.title_property]["title"][0]["plain_text"]
+        date_property = properties[self.date_property]["date"]
+
+        icon_property_value = properties[self.icon_property]
+        for key in self.icon_path:
+            icon_property_value = icon_property_value[key]
+
+        # Parse date
+        start, all_day = self.parse_date(date_property["start"])
+        end = None
+        if date_property["end"]:
+            end, all_day = self.parse_date(date_property["end"])
+
+        # Create event
+        return NotionCalendarEvent(
+            database=self.database,
+            title=title,
+            date=CalendarEventDate(start=start, end=end, all_day=all_day),
+            notion_page_id=page["id"],
+            notion_page_url=page["url"],
+            icon_property_value=icon_property_value,
+            last_modified=page.get("last_edited_time"),
+        )
+
+    def parse_date(self, date_string: str) -> Tuple[dt.DateTime, bool]:
+        """
+        Parse a Notion date string, returns the datetime and whether it is a date without time.
+        """
+
+        match = DATE_PATTERN.fullmatch(date_string)
+        if match:
+            (
+                year,
+                month,
+                day,
+                hour,
+                minute,
+                second,
+                millis,
+                sign,
+                *offset,
+            ) = match.groups()
+            if hour is None:
+                return dt.datetime(int(year), int(month), int(day)), True
+            return (
+                dt.datetime(
+                    int(year),
+                    int(month),
+                    int(day),
+                    int(hour),
+                    int(minute),
+                    int(second),
+                    int(millis or 0) * 1000,
+                    tz=fixed_timezone(sign, *offset),
+                ),
+                False,
+            )
+
+        # Fall back on the formats accepted by pendulum
+        for date_format, all_day in DATE_FORMATS:
             try:
-                date[date_name] = dt.from_format(date_string, date_format)
-                date["all_day"] = all_day
-                break
+                return dt.from_format(date_string, date_format), all_day
             except ValueError:
                 continue
-        if not date[date_name]:
-            raise ValueError(
-                f"Unrecognised date format for property {database.date_property}."
-            )
+        raise ValueError(f"Unrecognised date format for property {self.date_property}.")
+
+
+@lru_cache(maxsize=None)
+def fixed_timezone(sign: str, hours: str, minutes: str):
+    """
+    Timezone for a utc offset, shared between all dates with that offset.
+    """
+
+    offset = int(hours) * 3600 + int(minutes) * 60
+    return dt.timezone(-offset if sign == "-" else offset)
+
+
+def page_to_calendar_event(page: Mapping, database: Database) -> NotionCalendarEvent:
+    """
+    Parse json config of a notion page to a calendar event.
+    """
 
-    # Create event
-    return NotionCalendarEvent(
-        database=database,
-        title=title,
-        date=CalendarEventDate(**date),
-        notion_page_id=id,
-        notion_page_url=url,
-        icon_property_value=icon_property_value,
-    )
+    return PageTransformer(database).transform_page(page)
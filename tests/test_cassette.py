@@ -0,0 +1,94 @@
+from unittest import mock
+
+import httplib2
+import pendulum as dt
+import pytest
+import requests
+from googleapiclient.errors import HttpError
+
+from src.common import state
+from src.common.cassette import Cassette, CassetteMiss
+
+
+def _response(status: int, content: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = content
+    return response
+
+
+def test_record_replay_session(tmp_path):
+    """
+    Test if recorded responses are sanitized and replayed for the same requests at another time.
+    """
+
+    # Arrange
+    path = tmp_path / "cassette.jsonl.gz"
+    content = b'{"results": [{"owner": "jane.doe@example.org"}]}'
+
+    # Act
+    cassette = Cassette(path)
+    cassette.time, cassette.tiers = dt.datetime(2023, 1, 1), {"My source": "hot"}
+    with mock.patch(
+        "requests.adapters.HTTPAdapter.send", return_value=_response(200, content)
+    ):
+        recorded = cassette.session("notion").post(
+            "https://api.notion.com/v1/databases/1/query",
+            json={"filter": {"after": "2023-01-01T00:00:00+00:00"}},
+        )
+    cassette.save()
+
+    replayed_cassette = Cassette.load(path, latency_factor=0)
+    session = replayed_cassette.session("notion")
+    replayed = session.post(
+        "https://api.notion.com/v1/databases/1/query",
+        json={"filter": {"after": "2023-01-08T12:00:00+00:00"}},
+    )
+
+    # Assert
+    assert recorded.content == content
+    assert replayed_cassette.tiers == {"My source": "hot"}
+    assert replayed.status_code == 200
+    owner = replayed.json()["results"][0]["owner"]
+    assert owner.endswith("@example.com") and "jane" not in owner
+    with pytest.raises(CassetteMiss):
+        session.post(
+            "https://api.notion.com/v1/databases/1/query",
+            json={"filter": {"after": "2023-01-08T12:00:00+00:00"}},
+        )
+
+
+def test_record_replay_google(tmp_path):
+    """
+    Test if Google api responses and errors are replayed offline, at the recorded time.
+    """
+
+    # Arrange
+    path = tmp_path / "cassette.jsonl.gz"
+    found = mock.Mock(method="GET", uri="https://test/calendars/1/events/a", body=None)
+    missing = mock.Mock(
+        method="GET", uri="https://test/calendars/1/events/b", body=None
+    )
+    error = HttpError(httplib2.Response({"status": 404}), b"")
+
+    # Act
+    cassette = Cassette(path)
+    cassette.time = dt.datetime(2023, 1, 1)
+    cassette.execute("google", found, lambda: {"id": "a"})
+    with pytest.raises(HttpError):
+        cassette.execute("google", missing, mock.Mock(side_effect=error))
+    cassette.save()
+
+    replayed_cassette = Cassette.load(path, latency_factor=0)
+    with replayed_cassette.offline():
+        now = dt.now()
+        state_path = state.STATE_PATH
+        response = replayed_cassette.execute("google", found, mock.Mock())
+        with pytest.raises(HttpError) as exc_info:
+            replayed_cassette.execute("google", missing, mock.Mock())
+
+    # Assert
+    assert response == {"id": "a"}
+    assert exc_info.value.resp.status == 404
+    assert now == dt.datetime(2023, 1, 1)
+    assert state_path != state.STATE_PATH
@@ -0,0 +1,91 @@
+from unittest import mock
+
+import pytest
+
+from src import main as main_module
+from src.common.deadline import BudgetExceeded, Deadline
+from src.common.state import StateLocked, lock_state
+from src.models.config import Config
+from src.models.ical import ICalendar
+from src.models.plan import SyncPlan
+from src.models.settings import Settings
+
+
+@pytest.fixture(autouse=True)
+def state_path(tmp_path):
+    with mock.patch("src.common.state.STATE_PATH", tmp_path):
+        yield tmp_path
+
+
+def test_deadline():
+    """
+    Test if request timeouts are capped by the remaining budget of the deadline and its parent.
+    """
+
+    # Arrange
+    unbounded = Deadline()
+    run = Deadline(30)
+    source = Deadline(3600, parent=run)
+    expired = Deadline(0, parent=unbounded)
+
+    # Assert
+    assert unbounded.timeout(10, 60) == (10, 60)
+    assert source.expires_at == run.expires_at
+    assert 29 < source.timeout(10, 60)[1] <= 30
+    assert source.timeout(10, 60)[0] == 10
+    with pytest.raises(BudgetExceeded):
+        expired.timeout(10, 60)
+
+
+def test_lock_state():
+    """
+    Test if a held lock cannot be taken again until it is released.
+    """
+
+    with lock_state("run"):
+        with pytest.raises(StateLocked):
+            with lock_state("run"):
+                pass
+
+    with lock_state("run"):
+        pass
+
+
+def test_main_defers_sources(state_path):
+    """
+    Test if a source that runs out of budget is skipped and synced first in the next run.
+    """
+
+    # Arrange
+    icals = [
+        ICalendar(name=name, url="test", calendar_id="test")
+        for name in ["fast", "slow", "other"]
+    ]
+    config = Config(databases=[], icals=icals, settings=Settings())
+    calls = []
+
+    def _sync_icalendar(ical, gcalendar, icalendar, *args):
+        calls.append(icalendar.name)
+        if icalendar.name == "slow" and len(calls) <= 3:
+            raise BudgetExceeded()
+        return SyncPlan(
+            source=icalendar.name, are_events_equivalent=lambda a, b: a == b
+        )
+
+    # Act
+    with mock.patch.object(
+        main_module, "read_config", return_value=config
+    ), mock.patch.object(main_module, "GCalendar"), mock.patch.object(
+        main_module, "Notion"
+    ), mock.patch.object(
+        main_module, "ICal"
+    ), mock.patch.object(
+        main_module, "sync_icalendar", side_effect=_sync_icalendar
+    ), mock.patch.object(
+        main_module, "REPORT_PATH", state_path / "report.json"
+    ):
+        main_module.main()
+        main_module.main()
+
+    # Assert
+    assert calls == ["fast", "slow", "other", "slow", "fast", "other"]
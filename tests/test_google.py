@@ -0,0 +1,541 @@
+import threading
+import time
+from unittest import mock
+
+import httplib2
+import pendulum as dt
+import pytest
+from googleapiclient.errors import HttpError
+
+from src.api_client.google import (
+    BATCH_SIZE,
+    GCalendar,
+    SharedCredentials,
+    diff_request_body,
+)
+from src.models.ical import ICalendar
+from src.models.settings import Settings
+from src.models.sync_window import SyncTiers
+from src.transformations.google_to_calendar_event import (
+    google_to_ical_calendar_event,
+    parse_date,
+)
+
+
+@pytest.fixture()
+def gcalendar() -> GCalendar:
+    with mock.patch(
+        "src.api_client.google.Credentials.from_service_account_file"
+    ), mock.patch("src.api_client.google.build"):
+        return GCalendar(Settings(list_shards=3))
+
+
+class _Batch:
+    """
+    Batch http request that answers every request with the given response function, by default with the
+    request itself, or raises the request if it is an error. Callbacks are called in reverse order, like
+    responses of a batch may arrive in any order.
+    """
+
+    def __init__(self, batches, callback, respond=lambda request: request):
+        self.callback = callback
+        self.respond = respond
+        self.requests = []
+        batches.append(self)
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self, http):
+        for request_id, request in reversed(self.requests):
+            if isinstance(request, Exception):
+                self.callback(request_id, None, request)
+            else:
+                self.callback(request_id, self.respond(request), None)
+
+
+@pytest.fixture()
+def batches(gcalendar: GCalendar):
+    batches = []
+    gcalendar.calendar.new_batch_http_request.side_effect = lambda callback: _Batch(
+        batches, callback
+    )
+    return batches
+
+
+def test_execute_batch(gcalendar: GCalendar, batches):
+    """
+    Test if requests are sent in batches of at most BATCH_SIZE and responses keep the order of the requests.
+    """
+
+    # Arrange
+    requests = [{"id": i} for i in range(BATCH_SIZE * 2 + 1)]
+
+    # Act
+    responses = gcalendar.execute_batch(requests)
+
+    # Assert
+    assert responses == requests
+    assert [len(batch.requests) for batch in batches] == [BATCH_SIZE, BATCH_SIZE, 1]
+
+
+def test_execute_batch_error(gcalendar: GCalendar, batches):
+    """
+    Test if the error of the first failed request is raised, and later batches are not sent.
+    """
+
+    # Arrange
+    errors = [
+        HttpError(httplib2.Response({"status": status}), b"") for status in [404, 500]
+    ]
+    requests = [{"id": 0}, errors[0], {"id": 2}, errors[1], *[{}] * BATCH_SIZE]
+
+    # Act
+    with pytest.raises(HttpError) as e:
+        gcalendar.execute_batch(requests)
+
+    # Assert
+    assert e.value is errors[0]
+    assert len(batches) == 1
+
+
+def test_prefetch_listings(gcalendar: GCalendar, batches):
+    """
+    Test if the first pages of all planned listings are fetched in one batch and follow-up pages on their own.
+    """
+
+    # Arrange
+    gcalendar.settings.batch_reads = True
+    sources = [
+        mock.Mock(id=calendar_id, calendar_id=calendar_id, sync=SyncTiers())
+        for calendar_id in ["a", "b"]
+    ]
+    gcalendar.plan_listings(sources)
+
+    def _list_request(page_token, calendar_id, time_min, time_max=None, **params):
+        return {"calendar_id": calendar_id, "time_min": time_min, "page": page_token}
+
+    def _first_page(request):
+        # Every slice of calendar "a" has a follow-up page
+        page = {"items": [{"id": f"{request['calendar_id']}_{request['time_min']}"}]}
+        if request["calendar_id"] == "a":
+            page["nextPageToken"] = "next"
+        return page
+
+    def _execute(request):
+        return {"items": [{"id": f"a_{request['time_min']}_next"}]}
+
+    # Act
+    with mock.patch.object(
+        gcalendar, "list_request", side_effect=_list_request
+    ), mock.patch.object(
+        gcalendar, "execute_batch", wraps=gcalendar.execute_batch
+    ) as mock_batch, mock.patch.object(
+        gcalendar, "execute", side_effect=_execute
+    ) as mock_execute:
+        gcalendar.calendar.new_batch_http_request.side_effect = lambda callback: (
+            _Batch(batches, callback, _first_page)
+        )
+        gcalendar.prefetch_listings()
+
+    # Assert
+    mock_batch.assert_called_once()
+    assert len(batches) == 1 and len(batches[0].requests) == 6
+    assert mock_execute.call_count == 3
+    assert [len(listing.events) for listing in gcalendar.listings.values()] == [6, 3]
+    assert all(event["id"].startswith("a_") for event in gcalendar.listings["a"].events)
+
+
+def test_list_events_sharded(gcalendar: GCalendar):
+    """
+    Test if a sharded listing lists every slice and deduplicates events returned by multiple slices.
+    """
+
+    # Mock api response: "root" is a recurring root, "long" spans a slice boundary
+    slices = [
+        [{"id": "root"}, {"id": "a"}, {"id": "long"}],
+        [{"id": "root"}, {"id": "long"}, {"id": "b"}],
+        [{"id": "root"}, {"id": "c"}],
+    ]
+    calls = []
+
+    def _list_events(calendar_id, time_min, time_max=None, **params):
+        calls.append((time_min, time_max))
+        return iter(slices[len(calls) - 1])
+
+    # Act
+    with mock.patch.object(gcalendar, "list_events", side_effect=_list_events):
+        result = [
+            event["id"]
+            for event in gcalendar.list_events_sharded(
+                "test", time_min=dt.now().subtract(days=30), singleEvents=False
+            )
+        ]
+
+    # Assert
+    assert len(calls) == 3
+    assert calls[-1][1] is None
+    assert sorted(result) == ["a", "b", "c", "long", "root"]
+
+
+def test_shared_listing(gcalendar: GCalendar):
+    """
+    Test if a calendar shared by multiple databases is listed once and fanned out per database.
+    """
+
+    # Mock api response
+    events = [
+        {
+            "id": f"event_{database_id}",
+            "start": {"date": dt.now().to_date_string()},
+            "end": {"date": dt.tomorrow().to_date_string()},
+            "extendedProperties": {
+                "shared": {
+                    "NotionDatabaseId": database_id,
+                    "NotionPageId": f"page_{database_id}",
+                }
+            },
+        }
+        for database_id in ["db_1", "db_2"]
+    ]
+    databases = [
+        mock.Mock(id=database_id, calendar_id="shared", sync=SyncTiers())
+        for database_id in ["db_1", "db_2"]
+    ]
+
+    # Act
+    gcalendar.plan_listings(databases)
+    with mock.patch.object(
+        gcalendar, "list_events_sharded", return_value=iter(events)
+    ) as mock_list:
+        result = []
+        for database in databases:
+            result.append(
+                [
+                    event.google_event_id
+                    for event in gcalendar.get_events_notion(database)
+                ]
+            )
+            gcalendar.release_listing(database.calendar_id)
+
+    # Assert
+    mock_list.assert_called_once()
+    assert result == [["event_db_1"], ["event_db_2"]]
+    assert not gcalendar.listings
+
+
+def test_release_listing(gcalendar: GCalendar):
+    """
+    Test if a listing is dropped once all its sources released it, also when they never got the events.
+    """
+
+    # Arrange
+    databases = [
+        mock.Mock(id=database_id, calendar_id="shared", sync=SyncTiers())
+        for database_id in ["db_1", "db_2"]
+    ]
+    gcalendar.plan_listings(databases)
+
+    # Act
+    gcalendar.release_listing("shared")
+    remaining = list(gcalendar.listings)
+    gcalendar.release_listing("shared")
+    gcalendar.release_listing("unplanned")
+
+    # Assert
+    assert remaining == ["shared"]
+    assert not gcalendar.listings
+
+
+def test_get_events_notion_filters_raw_start(gcalendar: GCalendar):
+    """
+    Test if events are filtered on their start without parsing their dates.
+    """
+
+    # Mock api response
+    database = mock.Mock(id="db", calendar_id="calendar", sync=SyncTiers())
+    events = [
+        {
+            "id": event_id,
+            "start": start,
+            "end": start,
+            "extendedProperties": {"shared": {"NotionPageId": event_id}},
+        }
+        for event_id, start in [
+            ("in", {"dateTime": dt.now().add(days=1).isoformat()}),
+            ("in_all_day", {"date": dt.now().add(days=1).to_date_string()}),
+            ("before", {"date": dt.now().subtract(years=1).to_date_string()}),
+            ("invalid", {"dateTime": "tomorrow"}),
+        ]
+    ]
+
+    # Act
+    with mock.patch.object(gcalendar, "list_events_sharded", return_value=iter(events)):
+        result = list(gcalendar.get_events_notion(database))
+
+    # Assert
+    assert [event.google_event_id for event in result] == ["in", "in_all_day"]
+    assert all("date" not in vars(event) for event in result)
+
+
+def test_find_events_notion_batch(gcalendar: GCalendar, batches):
+    """
+    Test if the events of multiple notion pages are looked up in a single batch.
+    """
+
+    # Arrange
+    database = mock.Mock(id="db", calendar_id="calendar", sync=SyncTiers())
+
+    def _list_request(page_token, sharedExtendedProperty, **params):
+        notion_page_id = sharedExtendedProperty[1].split("=")[1]
+        if notion_page_id == "missing":
+            return {"items": []}
+        return {
+            "items": [
+                {
+                    "id": f"event_{notion_page_id}",
+                    "extendedProperties": {"shared": {"NotionPageId": notion_page_id}},
+                }
+            ]
+        }
+
+    # Act
+    with mock.patch.object(gcalendar, "list_request", side_effect=_list_request):
+        result = gcalendar.find_events_notion_batch(database, ["a", "missing", "b"])
+
+    # Assert
+    assert len(batches) == 1
+    assert {
+        notion_page_id: event.google_event_id
+        for notion_page_id, event in result.items()
+    } == {"a": "event_a", "b": "event_b"}
+
+
+def test_insert_event_conflict(gcalendar: GCalendar):
+    """
+    Test if inserting an event with an existing deterministic id turns into an update.
+    """
+
+    # Mock api response
+    conflict = HttpError(httplib2.Response({"status": 409}), b"")
+    body = {"id": "abc", "summary": "test"}
+
+    # Act
+    with mock.patch.object(
+        gcalendar, "execute", side_effect=[conflict, {"id": "abc"}]
+    ) as mock_execute:
+        result = gcalendar.insert_event("test", body)
+
+    # Assert
+    assert result == {"id": "abc"}
+    assert mock_execute.call_count == 2
+    gcalendar.calendar.events().update.assert_called_once_with(
+        calendarId="test",
+        eventId="abc",
+        body={"status": "confirmed", **body},
+    )
+
+
+def test_patch_event_conflict(gcalendar: GCalendar):
+    """
+    Test if a patch of an event that changed since it was listed is diffed against the fresh version.
+    """
+
+    # Mock api response
+    precondition_failed = HttpError(httplib2.Response({"status": 412}), b"")
+    resource = {"id": "abc", "etag": "2", "summary": "new", "location": "there"}
+    body = {"summary": "new", "location": "here"}
+
+    # Act
+    with mock.patch.object(
+        gcalendar, "execute", side_effect=[precondition_failed, resource, {}]
+    ) as mock_execute:
+        gcalendar.patch_event(
+            "test",
+            "abc",
+            body=body,
+            body_google={"summary": "old", "location": "here"},
+            etag="1",
+            to_body_google=lambda _: {key: _[key] for key in body},
+        )
+
+    # Assert
+    assert mock_execute.call_count == 3
+    assert [
+        call.kwargs["body"] for call in gcalendar.calendar.events().patch.call_args_list
+    ] == [{"summary": "new"}, {"location": "here"}]
+    assert mock_execute.call_args[0][0].headers.__setitem__.call_args[0] == (
+        "If-Match",
+        "2",
+    )
+
+
+def test_patch_event_conflict_again(gcalendar: GCalendar):
+    """
+    Test if an event that keeps changing is left for the next run instead of patched unconditionally.
+    """
+
+    # Mock api response
+    precondition_failed = HttpError(httplib2.Response({"status": 412}), b"")
+    resource = {"id": "abc", "etag": "2", "summary": "other"}
+
+    # Act
+    with mock.patch.object(
+        gcalendar,
+        "execute",
+        side_effect=[precondition_failed, resource, precondition_failed],
+    ) as mock_execute:
+        gcalendar.patch_event(
+            "test",
+            "abc",
+            body={"summary": "new"},
+            body_google={"summary": "old"},
+            etag="1",
+            to_body_google=lambda _: {"summary": _["summary"]},
+        )
+
+    # Assert
+    assert mock_execute.call_count == 3
+    assert gcalendar.calendar.events().patch.call_count == 2
+
+
+def test_diff_request_body():
+    """
+    Test if only changed fields and extended properties end up in a patch.
+    """
+
+    body_old = {
+        "summary": "old",
+        "location": "here",
+        "extendedProperties": {"shared": {"a": "1", "b": "2"}},
+    }
+
+    # Act & Assert
+    assert diff_request_body(
+        body_old,
+        {
+            **body_old,
+            "summary": "new",
+            "extendedProperties": {"shared": {"a": "1", "b": "3"}},
+        },
+    ) == {"summary": "new", "extendedProperties": {"shared": {"b": "3"}}}
+    assert diff_request_body(body_old, body_old) == {}
+    assert diff_request_body(body_old, {"summary": "old"}) is None
+
+
+def test_google_to_ical_calendar_event_lazy():
+    """
+    Test if events listed from Google Calendar expose their ids up front and parse dates on first use.
+    """
+
+    # Arrange
+    icalendar = ICalendar(name="test", url="test", calendar_id="test")
+    event_google = {
+        "id": "id",
+        "summary": "title",
+        "start": {
+            "dateTime": "2023-03-01T10:00:00+01:00",
+            "timeZone": "Europe/Amsterdam",
+        },
+        "end": {
+            "dateTime": "2023-03-01T11:00:00+01:00",
+            "timeZone": "Europe/Amsterdam",
+        },
+        "originalStartTime": {"dateTime": "2023-03-01T09:00:00+01:00"},
+        "extendedProperties": {"shared": {"ICalUID": "uid"}},
+    }
+
+    # Act
+    with mock.patch(
+        "src.transformations.google_to_calendar_event.parse_date",
+        wraps=parse_date,
+    ) as mock_parse_date:
+        event = google_to_ical_calendar_event(event_google, icalendar)
+        ids = (event.google_event_id, event.ical_uid)
+        nr_parses_listed = mock_parse_date.call_count
+        start = event.date.start
+        event.date
+
+    # Assert
+    assert ids == ("id", "uid")
+    assert nr_parses_listed == 0
+    assert mock_parse_date.call_count == 1
+    assert start == dt.datetime(2023, 3, 1, 9)
+    assert start.timezone_name == "Europe/Amsterdam"
+    assert event.recurrence_start == dt.datetime(2023, 3, 1, 8)
+    assert event.title == "title"
+    assert (
+        google_to_ical_calendar_event(
+            {**event_google, "extendedProperties": {}}, icalendar
+        )
+        is None
+    )
+
+
+def test_execute_parallel(gcalendar: GCalendar):
+    """
+    Test if parallel requests keep their order, stay within the in-flight limit and share pooled transports.
+    """
+
+    # Arrange
+    lock = threading.Lock()
+    in_flight, max_in_flight, transports = [0], [0], set()
+
+    def _request(i: int):
+        def _execute(http):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+                transports.add(id(http))
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return {"id": i}
+
+        return mock.Mock(execute=_execute)
+
+    # Act
+    responses = gcalendar.execute_parallel([_request(i) for i in range(20)], 4)
+    responses_next = gcalendar.execute_parallel([_request(i) for i in range(4)], 4)
+
+    # Assert
+    assert responses == [{"id": i} for i in range(20)]
+    assert len(responses_next) == 4
+    assert max_in_flight[0] <= 4
+    assert len(transports) <= 4
+    assert gcalendar.pool.qsize() == len(transports)
+
+
+def test_shared_credentials_refresh():
+    """
+    Test if threads that find an expired token refresh it only once.
+    """
+
+    # Arrange
+    credentials = SharedCredentials(
+        mock.Mock(), "test@example.com", "https://oauth2.googleapis.com/token"
+    )
+
+    def _refresh(self, request):
+        time.sleep(0.05)
+        self.token, self.expiry = "token", dt.now("UTC").add(hours=1).naive()
+
+    # Act
+    with mock.patch(
+        "google.oauth2.service_account.Credentials.refresh",
+        autospec=True,
+        side_effect=_refresh,
+    ) as mock_refresh:
+        threads = [
+            threading.Thread(
+                target=credentials.before_request, args=(None, "GET", "url", {})
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # Assert
+    assert mock_refresh.call_count == 1
@@ -0,0 +1,161 @@
+import time
+from unittest import mock
+
+import icalendar as ical
+import pendulum as dt
+import pytest
+
+from src.api_client import ical as ical_module
+from src.api_client.ical import ICal
+from src.models.ical import ICalendar
+from src.models.settings import Settings
+from src.transformations.ical_to_calendar_event import get_recurrence_end
+
+FEED = b"""BEGIN:VCALENDAR\r
+VERSION:2.0\r
+BEGIN:VEVENT\r
+UID:1\r
+SUMMARY:First\r
+STATUS:CONFIRMED\r
+DTSTAMP:20230301T000000Z\r
+LAST-MODIFIED:20221231T120000Z\r
+DTSTART;VALUE=DATE:20230101\r
+DTEND;VALUE=DATE:20230102\r
+RRULE:FREQ=YEARLY\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:2\r
+SUMMARY:Second\r
+STATUS:TENTATIVE\r
+DTSTAMP:20230301T000000Z\r
+DTSTART:20230101T100000Z\r
+DTEND:20230101T110000Z\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+@pytest.fixture()
+def icalendar() -> ICalendar:
+    return ICalendar(name="test", url="test", calendar_id="test")
+
+
+@pytest.fixture(autouse=True)
+def state_path(tmp_path):
+    with mock.patch("src.common.state.STATE_PATH", tmp_path):
+        yield tmp_path
+
+
+def test_parse_events_cache(icalendar: ICalendar):
+    """
+    Test if only new or changed VEVENT blocks are parsed when the parse cache is warm.
+    """
+
+    ical = ICal()
+
+    # Act
+    with mock.patch.object(
+        ical_module, "parse_block", wraps=ical_module.parse_block
+    ) as mock_parse:
+        records_cold = list(ical.parse_events(icalendar, FEED))
+        records_warm = list(ical.parse_events(icalendar, FEED))
+        records_changed = list(
+            ical.parse_events(
+                icalendar, FEED.replace(b"SUMMARY:Second", b"SUMMARY:Changed")
+            )
+        )
+
+    # Assert
+    assert mock_parse.call_count == 3
+    assert records_cold == records_warm
+    assert [_.title for _ in records_changed] == ["First", "Changed"]
+    assert records_cold[1].status == "tentative"
+    assert [_.last_modified for _ in records_cold] == [
+        "2022-12-31T12:00:00+00:00",
+        "2023-03-01T00:00:00+00:00",
+    ]
+
+
+def test_parse_events_parallel(icalendar: ICalendar, caplog):
+    """
+    Test if parsing in a process pool gives the same records and warnings as parsing serially.
+    """
+
+    # Arrange: the second event has an invalid start
+    feed = FEED.replace(b"DTSTART:20230101T100000Z", b"DTSTART:invalid")
+    feed = feed.replace(b"END:VCALENDAR", FEED[FEED.index(b"BEGIN:VEVENT") :])
+    settings = dict(ical_parse_cache=False, ical_parallel_threshold=0)
+
+    # Act
+    results = []
+    for nr_workers in [1, 2]:
+        caplog.clear()
+        records = list(
+            ICal(Settings(ical_parse_workers=nr_workers, **settings)).parse_events(
+                icalendar, feed
+            )
+        )
+        warnings = [
+            record.getMessage()
+            for record in caplog.records
+            if record.levelname == "WARNING"
+        ]
+        results.append((records, warnings))
+
+    # Assert
+    (records_serial, warnings_serial), (records_parallel, warnings_parallel) = results
+    assert records_parallel == records_serial
+    assert warnings_parallel == warnings_serial
+    assert [record is None for record in records_serial] == [False, True, False, False]
+    assert len(warnings_serial) == 1
+
+
+def test_get_events_prunes_expired_series(icalendar: ICalendar):
+    """
+    Test if recurring events that ended before the sync window are skipped, together with their exceptions.
+    """
+
+    # Yearly event with 2 occurences in 2023, with an exception moved into the sync window
+    now = dt.now().in_tz("UTC")
+    feed = FEED.replace(b"RRULE:FREQ=YEARLY", b"RRULE:FREQ=YEARLY;COUNT=2")
+    feed = feed.replace(b"UID:2", b"UID:1\r\nRECURRENCE-ID;VALUE=DATE:20240101")
+    feed = feed.replace(
+        b"20230101T100000Z", now.format("YYYYMMDD[T]HHmmss[Z]").encode()
+    )
+    feed = feed.replace(
+        b"20230101T110000Z", now.add(hours=1).format("YYYYMMDD[T]HHmmss[Z]").encode()
+    )
+
+    # Act
+    with mock.patch.object(ical_module.requests, "get") as mock_get:
+        mock_get.return_value.iter_content.return_value = [feed]
+        events = list(ICal(Settings(prune_expired_series=False)).get_events(icalendar))
+        events_pruned = list(ICal().get_events(icalendar))
+
+    # Assert
+    assert len(events) == 2
+    assert events_pruned == []
+
+
+def test_get_recurrence_end():
+    """
+    Test if the end of a series is bounded by its UNTIL without expanding it, and counted for a COUNT.
+    """
+
+    def _event(rrule: str) -> ical.Event:
+        return ical.Event.from_ical(
+            "BEGIN:VEVENT\r\nUID:1\r\nDTSTART:20230101T090000Z\r\nDTEND:20230101T093000Z\r\n"
+            f"RRULE:{rrule}\r\nEND:VEVENT\r\n"
+        )
+
+    # Act
+    start = time.perf_counter()
+    end_until = get_recurrence_end(_event("FREQ=MINUTELY;UNTIL=20330101T000000Z"))
+    duration = time.perf_counter() - start
+    end_count = get_recurrence_end(_event("FREQ=DAILY;COUNT=3"))
+
+    # Assert
+    assert end_until == dt.datetime(2033, 1, 1, 0, 30)
+    assert duration < 0.1
+    assert end_count == dt.datetime(2023, 1, 3, 9, 30)
+    assert get_recurrence_end(_event("FREQ=DAILY")) is None
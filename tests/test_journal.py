@@ -0,0 +1,122 @@
+from unittest import mock
+
+import pendulum as dt
+import pytest
+
+from src.common.journal import Journal
+from src.jobs.executor import GCalendarExecutor
+from src.models.event import CalendarEventDate, NotionCalendarEvent
+from src.models.plan import Mutation, SyncPlan
+from src.models.settings import Settings
+
+
+@pytest.fixture(autouse=True)
+def state_path(tmp_path):
+    with mock.patch("src.common.state.STATE_PATH", tmp_path):
+        yield tmp_path
+
+
+def event(notion_page_id: str) -> NotionCalendarEvent:
+    return NotionCalendarEvent(
+        title=notion_page_id,
+        date=CalendarEventDate(dt.now().add(days=1)),
+        database=mock.Mock(),
+        notion_page_id=notion_page_id,
+    )
+
+
+def plan(*notion_page_ids: str) -> SyncPlan:
+    plan = SyncPlan(source="My source", are_events_equivalent=lambda a, b: False)
+    for notion_page_id in notion_page_ids:
+        plan.add(Mutation("create", event(notion_page_id)))
+    return plan
+
+
+def test_journal_recover(state_path):
+    """
+    Test if an interrupted run leaves its confirmed and unconfirmed creates behind, and a completed run nothing.
+    """
+
+    # Arrange
+    created, unconfirmed = Mutation("create", event("a")), Mutation(
+        "create", event("b")
+    )
+    journal = Journal("My source")
+    journal.planned([created, unconfirmed])
+    created.event.google_event_id = "google_a"
+    journal.done(created)
+
+    # Act
+    journal_resumed = Journal("My source")
+    journal_resumed.complete()
+
+    # Assert
+    assert (
+        journal_resumed.created_event_id(Mutation("create", event("a"))) == "google_a"
+    )
+    assert journal_resumed.is_unconfirmed(Mutation("create", event("b")))
+    assert not journal_resumed.is_unconfirmed(Mutation("create", event("c")))
+    assert not list((state_path / "journal").iterdir())
+
+
+def test_executor_resumes_creates():
+    """
+    Test if events created by an interrupted run are updated instead of created again.
+    """
+
+    # Arrange
+    gcalendar = mock.Mock(settings=Settings(journal_mutations=True))
+    gcalendar.create_event_from_notion.side_effect = [
+        "google_a",
+        "google_b",
+        "google_c",
+    ]
+    gcalendar.find_event_notion.return_value = None
+
+    # Interrupted after the first create was confirmed and during the second
+    executor = GCalendarExecutor(gcalendar)
+    executor.journal("My source").planned(plan("b").drain())
+    executor.execute(plan("a"))
+    executor_resumed = GCalendarExecutor(gcalendar)
+    gcalendar.reset_mock()
+
+    # Act
+    plan_resumed = plan("a", "b")
+    executor_resumed.execute(plan_resumed)
+    executor_resumed.complete(plan_resumed)
+
+    # Assert
+    gcalendar.update_event_from_notion.assert_called_once()
+    assert (
+        gcalendar.update_event_from_notion.call_args[0][0].google_event_id == "google_a"
+    )
+    gcalendar.find_event_notion.assert_called_once()
+    gcalendar.create_event_from_notion.assert_called_once()
+    assert Journal("My source").created == {}
+
+
+def test_executor_keeps_journal_of_failed_job(state_path):
+    """
+    Test if the journal of a failed job is closed and kept for the next run, with only its creates.
+    """
+
+    # Arrange
+    gcalendar = mock.Mock(settings=Settings(journal_mutations=True))
+    gcalendar.create_event_from_notion.side_effect = ["google_a", Exception()]
+    executor = GCalendarExecutor(gcalendar)
+    failed = plan("a", "b")
+    failed.add(Mutation("update", event("c")))
+
+    # Act
+    with pytest.raises(Exception):
+        executor.execute(failed)
+    journal = executor.journals["My source"]
+    executor.close("My source")
+
+    # Assert
+    assert journal.file.closed
+    assert not executor.journals
+    journal_resumed = Journal("My source")
+    assert list(journal_resumed.created.values()) == ["google_a"]
+    assert len(journal_resumed.unconfirmed) == 1
+    assert journal_resumed.nr_recovered == 3
@@ -0,0 +1,168 @@
+import threading
+from http.client import HTTPConnection
+from unittest import mock
+
+import pendulum as dt
+import pytest
+
+from src.listener import TriggerQueue, WatchChannels, WebhookServer, listen
+from src.models.config import Config
+from src.models.ical import ICalendar
+from src.models.settings import Settings
+
+
+@pytest.fixture(autouse=True)
+def state_path(tmp_path):
+    with mock.patch("src.common.state.STATE_PATH", tmp_path):
+        yield tmp_path
+
+
+def test_trigger_queue_coalesces():
+    """
+    Test if a burst of triggers for multiple sources results in a single run.
+    """
+
+    # Arrange
+    runs = []
+    done = threading.Event()
+
+    def run(sources):
+        runs.append(sources)
+        done.set()
+
+    queue = TriggerQueue(run, debounce_seconds=0.2, max_delay_seconds=5)
+    queue.start()
+
+    # Act
+    for source in ["a", "b", "a", "a"]:
+        queue.trigger(source)
+    done.wait(5)
+    queue.stop()
+
+    # Assert
+    assert runs == [["a", "b"]]
+    assert queue.due_at(first=0, last=1) == 1.2
+    assert queue.due_at(first=0, last=10) == 5
+
+
+def test_webhook_server():
+    """
+    Test if trigger requests and change notifications trigger the affected sources only, and large
+    requests are refused.
+    """
+
+    # Arrange
+    config = Config(
+        databases=[],
+        icals=[
+            ICalendar(name="work", url="test", calendar_id="calendar_work"),
+            ICalendar(name="work 2", url="test", calendar_id="calendar_work"),
+            ICalendar(name="home", url="test", calendar_id="calendar_home"),
+        ],
+        settings=Settings(),
+    )
+    channels = mock.Mock(spec=WatchChannels)
+    channels.calendar_id.side_effect = lambda channel_id, token: (
+        "calendar_work" if (channel_id, token) == ("channel", "secret") else None
+    )
+    queue = mock.Mock(spec=TriggerQueue)
+    server = WebhookServer(("127.0.0.1", 0), queue, config, channels, token="token")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def post(path, headers):
+        connection = HTTPConnection(*server.server_address)
+        connection.request("POST", path, body=b"{}", headers=headers)
+        status = connection.getresponse().status
+        connection.close()
+        return status
+
+    # Act
+    statuses = [
+        post(
+            "/trigger/home",
+            {"Authorization": "Bearer token", "Content-Length": "1000000"},
+        ),
+        post("/trigger/work%202", {"Authorization": "Bearer token"}),
+        post("/trigger/home", {"Authorization": "Bearer wrong"}),
+        post("/trigger/unknown", {"Authorization": "Bearer token"}),
+        post(
+            "/google",
+            {
+                "X-Goog-Channel-ID": "channel",
+                "X-Goog-Channel-Token": "secret",
+                "X-Goog-Resource-State": "sync",
+            },
+        ),
+        post(
+            "/google",
+            {
+                "X-Goog-Channel-ID": "channel",
+                "X-Goog-Channel-Token": "secret",
+                "X-Goog-Resource-State": "exists",
+            },
+        ),
+        post(
+            "/google",
+            {
+                "X-Goog-Channel-ID": "channel",
+                "X-Goog-Channel-Token": "wrong",
+                "X-Goog-Resource-State": "exists",
+            },
+        ),
+    ]
+    server.shutdown()
+    server.server_close()
+
+    # Assert
+    assert statuses == [413, 202, 401, 404, 204, 204, 204]
+    assert queue.trigger.call_args_list == [
+        mock.call("work 2"),
+        mock.call("work"),
+        mock.call("work 2"),
+    ]
+
+
+def test_watch_channels_renew():
+    """
+    Test if channels are only replaced when they are about to expire.
+    """
+
+    # Arrange
+    now = dt.datetime(2023, 1, 1)
+    gcalendar = mock.Mock()
+    gcalendar.watch_events.side_effect = lambda calendar_id, *args: {
+        "resourceId": f"resource_{calendar_id}",
+        "expiration": str(now.add(days=7).int_timestamp * 1000),
+    }
+    channels = WatchChannels(gcalendar)
+
+    # Act
+    channels.renew(["a", "b"], "https://test/google", now)
+    first = dict(channels.channels)
+    channels.renew(["a", "b"], "https://test/google", now.add(days=1))
+    second = dict(channels.channels)
+    channels.renew(["a"], "https://test/google", now.add(days=6, hours=1))
+
+    # Assert
+    assert gcalendar.watch_events.call_count == 3
+    assert first == second
+    assert [channel["calendar_id"] for channel in channels.channels.values()] == ["a"]
+    assert gcalendar.stop_channel.call_count == 2
+    assert WatchChannels(gcalendar).channels == channels.channels
+    channel_id, channel = next(iter(channels.channels.items()))
+    assert channels.calendar_id(channel_id, channel["token"]) == "a"
+    assert channels.calendar_id(channel_id, "wrong") is None
+
+
+def test_listen_requires_token():
+    """
+    Test if a listener without token refuses to listen on other hosts than localhost.
+    """
+
+    with mock.patch.dict("os.environ", {"WEBHOOK_TOKEN": ""}), mock.patch(
+        "src.listener.read_config"
+    ) as mock_read_config:
+        with pytest.raises(ValueError):
+            listen(port=0)
+
+    mock_read_config.assert_not_called()
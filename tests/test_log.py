@@ -0,0 +1,80 @@
+import logging
+import threading
+
+from src.common.log import DeferredQueueHandler, EventLog, setup_logging
+
+
+class _Handler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        record.thread_name = threading.current_thread().name
+        self.records.append(record)
+
+
+def test_setup_logging():
+    """
+    Test if records are written by the background thread, and all of them once the listener stops.
+    """
+
+    # Arrange
+    handler = _Handler()
+    root = logging.getLogger()
+    handlers = root.handlers
+    root.handlers = [_ for _ in handlers if not isinstance(_, DeferredQueueHandler)]
+
+    # Act
+    listener = setup_logging(handler=handler)
+    try:
+        assert setup_logging(handler=handler) is None
+        for i in range(100):
+            logging.getLogger("test").info("Record %s", i)
+    finally:
+        listener.stop()
+        root.handlers = handlers
+
+    # Assert
+    assert [record.getMessage() for record in handler.records] == [
+        f"Record {i}" for i in range(100)
+    ]
+    assert handler.records[0].thread_name != threading.current_thread().name
+
+
+def test_event_log(caplog):
+    """
+    Test if every mutation is counted for the summary, while only a sample is logged.
+    """
+
+    # Arrange
+    event_log = EventLog(sample_rate=0.0)
+    test_logger = logging.getLogger("test")
+
+    # Act
+    with caplog.at_level(logging.INFO):
+        for title in ["a", "b", "c"]:
+            event_log.event(test_logger, "create", title, "Created event '%s'.")
+        event_log.event(test_logger, "delete", "d", "Deleted event '%s'.")
+        event_log.summary("My source")
+        event_log.summary("Other source")
+
+    # Assert
+    assert [record.getMessage() for record in caplog.records] == [
+        "Mutations of My source: create 3, delete 1 (0 of 4 logged)."
+    ]
+    assert caplog.records[0].mutations == {"create": 3, "delete": 1}
+
+
+def test_event_log_sampled(caplog):
+    """
+    Test if sampled lines carry the kind and title of the event.
+    """
+
+    event_log = EventLog(sample_rate=1.0)
+
+    with caplog.at_level(logging.INFO):
+        event_log.event(logging.getLogger("test"), "update", "a", "Updating '%s'.")
+
+    assert caplog.records[0].getMessage() == "Updating 'a'."
+    assert caplog.records[0].event_title == "a"
@@ -2,16 +2,19 @@ import json
 from unittest import mock
 from unittest.mock import ANY
 
+import pendulum as dt
 import pytest
 from requests.models import Response
 
 from src.api_client.notion import Notion
 from src.models.database import Database, DatabaseName, WorkspaceName
+from src.transformations.notion_to_calendar_event import PageTransformer
 
 
 @pytest.fixture()
 def notion_client() -> Notion:
-    notion_client = Notion()
+    with mock.patch.object(Notion, "init_integration_tokens_per_workspace"):
+        notion_client = Notion()
     notion_client.auth_headers = {WorkspaceName("test"): {}}
     return notion_client
 
@@ -80,6 +83,7 @@ def test_post_paginated(
                 },
                 params=ANY,
                 headers=ANY,
+                timeout=ANY,
             ),
             mock.call(
                 ANY,
@@ -90,8 +94,48 @@ def test_post_paginated(
                 },
                 params=ANY,
                 headers=ANY,
+                timeout=ANY,
             ),
         ],
     )
 
-    assert result == ["result_3", "result_1", "result_2"]
+    assert result == ["result_1", "result_2", "result_3"]
+
+
+def test_page_transformer(database: Database):
+    """
+    Test if a batch of pages is converted with the Notion date formats.
+    """
+
+    # Arrange
+    def page(id: str, start: str, end: str = None):
+        return {
+            "id": id,
+            "url": f"https://www.notion.so/{id}",
+            "properties": {
+                "test": {
+                    "title": [{"plain_text": id}],
+                    "date": {"start": start, "end": end},
+                }
+            },
+        }
+
+    pages = [
+        page("date", "2023-01-01"),
+        page("datetime", "2023-01-01T10:00:00.000+01:00", "2023-01-01T11:30:00-05:30"),
+    ]
+
+    # Act
+    events = PageTransformer(database)(pages)
+
+    # Assert
+    assert [event.notion_page_id for event in events] == ["date", "datetime"]
+    assert events[0].date.all_day
+    assert events[0].date.start == dt.datetime(2023, 1, 1)
+    assert events[0].date.end == dt.datetime(2023, 1, 2)
+    assert not events[1].date.all_day
+    assert events[1].date.start == dt.from_format(
+        "2023-01-01T10:00:00.000+01:00", "YYYY-MM-DDTHH:mm:ss.SSSZ"
+    )
+    assert events[1].date.end.timezone_name == "-05:30"
+    assert events[1].date.end.hour == 11
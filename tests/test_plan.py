@@ -0,0 +1,93 @@
+from unittest import mock
+
+import pendulum as dt
+
+from src.jobs.executor import DryRunExecutor, GCalendarExecutor
+from src.models.event import CalendarEvent, CalendarEventDate
+from src.models.lag import LagHistogram
+from src.models.plan import Mutation, SyncPlan
+from src.models.settings import Settings
+
+
+def event(google_event_id: str, title: str, days: int) -> CalendarEvent:
+    return CalendarEvent(
+        title=title,
+        date=CalendarEventDate(dt.now().add(days=days)),
+        google_event_id=google_event_id,
+    )
+
+
+def test_sync_plan():
+    """
+    Test if a sync plan coalesces writes to the same event, drops no-op updates and orders upcoming events first.
+    """
+
+    plan = SyncPlan(
+        source="test",
+        are_events_equivalent=lambda a, b: a.title == b.title,
+    )
+
+    # Act
+    plan.add(Mutation("update", event("past", "new", -3), event("past", "old", -3)))
+    plan.add(Mutation("update", event("same", "title", 1), event("same", "title", 1)))
+    plan.add(Mutation("update", event("soon", "first", 2), event("soon", "old", 2)))
+    plan.add(Mutation("update", event("soon", "second", 2), event("soon", "old", 2)))
+    plan.add(Mutation("delete", event("later", "old", 5)))
+    plan.add(Mutation("update", event("later", "new", 5), event("later", "old", 5)))
+    mutations = plan.drain()
+
+    # Assert
+    assert [(_.kind, _.event.title) for _ in mutations] == [
+        ("update", "second"),
+        ("delete", "old"),
+        ("update", "new"),
+    ]
+    assert plan.counts() == {"create": 0, "update": 2, "delete": 1}
+    assert not len(plan)
+
+
+def test_record_lag():
+    """
+    Test if the lag from the source edit to the Google Calendar write is recorded for written events only.
+    """
+
+    # Arrange
+    def _plan():
+        plan = SyncPlan(source="test", are_events_equivalent=lambda a, b: False)
+        for title, minutes in [("a", 5), ("b", 50), ("c", None)]:
+            mutation = Mutation("update", event(title, title, 1), event(title, "", 1))
+            if minutes is not None:
+                mutation.event.last_modified = (
+                    dt.now().subtract(minutes=minutes).isoformat()
+                )
+            plan.add(mutation)
+        plan.add(Mutation("delete", event("d", "d", 1)))
+        return plan
+
+    plan, plan_dry_run = _plan(), _plan()
+
+    # Act
+    GCalendarExecutor(mock.Mock(settings=Settings())).execute(plan)
+    DryRunExecutor().execute(plan_dry_run)
+
+    # Assert
+    assert plan.lags.count == 2
+    assert plan.lags.dump()["buckets"]["le_600"] == 1
+    assert plan.lags.dump()["buckets"]["le_3600"] == 1
+    assert plan_dry_run.lags.count == 0
+
+
+def test_lag_histogram():
+    """
+    Test if quantiles are estimated by the upper bound of their bucket, capped by the max.
+    """
+
+    histogram = LagHistogram()
+    for seconds in [1, 2, 20, 25, 29, 45, 100, 1000, 5000, -5]:
+        histogram.observe(seconds)
+
+    assert histogram.count == 10
+    assert histogram.quantile(0.5) == 30
+    assert histogram.quantile(0.9) == 30 * 60
+    assert histogram.quantile(0.99) == 5000
+    assert histogram.dump()["buckets"]["le_10"] == 3
@@ -0,0 +1,46 @@
+import json
+import pstats
+import tracemalloc
+
+from src.common.profiling import NullProfiler, Profiler
+from src.common.utils import run_concurrently
+
+
+def _allocate():
+    return [str(i) for i in range(100000)]
+
+
+def test_profiler(tmp_path):
+    """
+    Test if a phase is profiled including the threads it starts, and its stats are reported.
+    """
+
+    # Act
+    profiler = Profiler(tmp_path)
+    with profiler.phase("My source"):
+        run_concurrently(_allocate)
+    profiler.close()
+
+    # Assert
+    stats = pstats.Stats(str(tmp_path / "my_source.prof"))
+    assert any(function == "_allocate" for _, _, function in stats.stats)
+    assert (tmp_path / "my_source.snapshot").exists()
+
+    with open(tmp_path / "report.json") as f:
+        report = json.load(f)
+    assert report["My source"]["peak_memory_bytes"] > 1000000
+    assert report["My source"]["wall_seconds"] > 0
+    assert not tracemalloc.is_tracing()
+
+
+def test_null_profiler():
+    """
+    Test if disabled profiling does not trace allocations.
+    """
+
+    profiler = NullProfiler()
+    with profiler.phase("My source"):
+        _allocate()
+    profiler.close()
+
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,125 @@
+from unittest import mock
+
+import pendulum as dt
+import pytest
+
+from src.common.deadline import BudgetExceeded
+from src.common.mirror import MirrorStore
+from src.jobs.reconcile import reconcile, reconcile_calendar
+from src.models.settings import Settings
+from src.models.sync_window import SyncTiers
+
+
+@pytest.fixture(autouse=True)
+def state_path(tmp_path):
+    with mock.patch("src.common.state.STATE_PATH", tmp_path):
+        yield tmp_path
+
+
+def google_event(event_id: str, days: int, etag: str = "1"):
+    return {
+        "id": event_id,
+        "etag": etag,
+        "start": {"dateTime": dt.now().add(days=days).isoformat()},
+        "summary": event_id,
+    }
+
+
+def test_reconcile_calendar():
+    """
+    Test if only ranges of which the digest differs, and a sample of the others, are listed in full.
+    """
+
+    # Arrange
+    events = {
+        event_id: google_event(event_id, days)
+        for event_id, days in [("a", 1), ("b", 11), ("c", 21), ("d", 31)]
+    }
+    gcalendar = mock.Mock()
+    gcalendar.list_digest_events.side_effect = lambda *args: [
+        {key: event[key] for key in ["id", "etag", "start"]}
+        for event in events.values()
+    ]
+    gcalendar.list_events.side_effect = lambda *args, **kwargs: iter(
+        list(events.values())
+    )
+    mirror = MirrorStore().get("calendar")
+    settings = Settings(reconcile_ranges=4, reconcile_sample_ranges=1)
+    time_min, time_max = dt.now(), dt.now().add(days=40)
+
+    # Act
+    nr_drifted_new = reconcile_calendar(gcalendar, mirror, time_min, time_max, settings)
+    gcalendar.list_events.reset_mock()
+    nr_drifted_same = reconcile_calendar(
+        gcalendar, mirror, time_min, time_max, settings
+    )
+    nr_listed_same = gcalendar.list_events.call_count
+
+    events["b"] = google_event("b", 11, etag="2")
+    del events["d"]
+    gcalendar.list_events.reset_mock()
+    nr_drifted = reconcile_calendar(gcalendar, mirror, time_min, time_max, settings)
+
+    # Assert
+    assert nr_drifted_new == 0
+    assert nr_drifted_same == 0
+    assert nr_listed_same == 1
+    assert nr_drifted == 2
+    assert gcalendar.list_events.call_count == 3
+    assert sorted(mirror.events) == ["a", "b", "c"]
+    assert mirror.events["b"]["etag"] == "2"
+
+
+def test_mirror_record_write(state_path):
+    """
+    Test if writes of the sync are applied to the mirror of their calendar, and the mirror is persisted.
+    """
+
+    # Arrange
+    mirrors = MirrorStore()
+    uri = "https://www.googleapis.com/calendar/v3/calendars/me%40example.com/events"
+
+    # Act
+    mirrors.record_write(
+        mock.Mock(methodId="calendar.events.insert", uri=uri), google_event("a", 1)
+    )
+    mirrors.record_write(
+        mock.Mock(methodId="calendar.events.insert", uri=uri), google_event("b", 1)
+    )
+    mirrors.record_write(
+        mock.Mock(methodId="calendar.events.delete", uri=f"{uri}/b"), None
+    )
+    mirrors.record_write(mock.Mock(methodId="calendar.events.list", uri=uri), {})
+    mirrors.save()
+
+    # Assert
+    assert list(MirrorStore().get("me@example.com").events) == ["a"]
+
+
+def test_reconcile_budget_exceeded(state_path):
+    """
+    Test if the mirrors that were reconciled are saved when the budget runs out on a later calendar.
+    """
+
+    # Arrange
+    gcalendar = mock.Mock(mirror=MirrorStore())
+
+    def list_digest_events(calendar_id, time_min, time_max):
+        if calendar_id == "second":
+            raise BudgetExceeded()
+        return [google_event("a", 1)]
+
+    gcalendar.list_digest_events.side_effect = list_digest_events
+    gcalendar.list_events.return_value = [google_event("a", 1)]
+    sources = [
+        mock.Mock(calendar_id=calendar_id, sync=SyncTiers())
+        for calendar_id in ["first", "second"]
+    ]
+
+    # Act
+    with pytest.raises(BudgetExceeded):
+        reconcile(gcalendar, sources, Settings(reconcile_ranges=1))
+
+    # Assert
+    assert list(MirrorStore().get("first").events) == ["a"]
+    assert not (state_path / "mirror" / "second.json").exists()
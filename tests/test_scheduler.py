@@ -0,0 +1,63 @@
+from unittest import mock
+
+import pendulum as dt
+import pytest
+
+from src.common.scheduler import get_due_sources, record_poll
+from src.common.state import read_state
+from src.models.ical import ICalendar
+from src.models.settings import Settings
+
+
+@pytest.fixture(autouse=True)
+def state_path(tmp_path):
+    with mock.patch("src.common.state.STATE_PATH", tmp_path):
+        yield tmp_path
+
+
+def test_adaptive_polling():
+    """
+    Test if idle sources back off to the max interval and active sources speed up to the min interval.
+    """
+
+    # Arrange
+    settings = Settings(poll_interval_min_minutes=5, poll_interval_max_minutes=60)
+    idle = ICalendar(name="idle", url="test", calendar_id="test")
+    active = ICalendar(name="active", url="test", calendar_id="test")
+    now = dt.datetime(2023, 1, 1)
+
+    # Act: poll every 5 minutes for an hour, only the active source changes
+    polls = {"idle": 0, "active": 0}
+    for tick in range(12):
+        time = now.add(minutes=5 * tick)
+        for source in get_due_sources([idle, active], time):
+            polls[source.name] += 1
+            counts = {"create": 0, "update": int(source is active), "delete": 0}
+            record_poll(source, counts, settings, time)
+
+    # Assert
+    assert polls == {"idle": 3, "active": 12}
+    assert get_due_sources([idle, active], now.add(hours=1)) == [active]
+    assert get_due_sources([idle, active], now.add(hours=3)) == [idle, active]
+
+
+def test_adaptive_polling_change_rate():
+    """
+    Test if the interval follows the moving average of the change rate of a source.
+    """
+
+    # Arrange
+    settings = Settings(poll_interval_min_minutes=5, poll_interval_max_minutes=240)
+    source = ICalendar(name="source", url="test", calendar_id="test")
+    now = dt.datetime(2023, 1, 1)
+
+    # Act: a change in the first 5 minutes, then none
+    intervals = []
+    for minutes, nr_mutations in [(0, 1), (5, 0), (15, 0)]:
+        record_poll(
+            source, {"update": nr_mutations}, settings, now.add(minutes=minutes)
+        )
+        intervals.append(read_state("scheduler")["source"]["interval_minutes"])
+
+    # Assert: 1 mutation per 5 minutes, then an average of 0.7 * 0.2 and 0.7 * 0.7 * 0.2 per minute
+    assert intervals == pytest.approx([5, 1 / 0.14, 1 / 0.098])
@@ -0,0 +1,57 @@
+from unittest import mock
+
+import pendulum as dt
+import pytest
+
+from src.common.tiers import get_due_tiers, record_cold_sync
+from src.models.ical import ICalendar
+from src.models.sync_window import SyncTiers, SyncWindow
+
+
+@pytest.fixture(autouse=True)
+def state_path(tmp_path):
+    with mock.patch("src.common.state.STATE_PATH", tmp_path):
+        yield tmp_path
+
+
+def test_get_due_tiers():
+    """
+    Test if sources with a hot window sync their cold window only once per interval.
+    """
+
+    # Arrange
+    tiered = SyncTiers(hot=SyncWindow(past_days=1, future_days=7))
+    sources = [
+        ICalendar(name="untiered", url="test", calendar_id="test"),
+        ICalendar(name="tiered", url="test", calendar_id="test", sync=tiered),
+    ]
+
+    # Act
+    tiers_first = get_due_tiers(sources)
+    for source in sources:
+        record_cold_sync(source)
+    tiers_next = get_due_tiers(sources)
+    with mock.patch("src.common.tiers.dt.now", return_value=dt.now().add(minutes=61)):
+        tiers_later = get_due_tiers(sources)
+
+    # Assert
+    assert tiers_first == {"untiered": "cold", "tiered": "cold"}
+    assert tiers_next == {"untiered": "cold", "tiered": "hot"}
+    assert tiers_later == {"untiered": "cold", "tiered": "cold"}
+    assert tiered.window("hot") is tiered.hot
+    assert sources[0].sync.window("hot") is sources[0].sync.cold
+
+
+def test_time_range_contains():
+    """
+    Test if recurring events that started before a window are kept, as long as they start before its end.
+    """
+
+    # Arrange
+    time_range = SyncWindow(past_days=1, future_days=7).resolve()
+
+    # Assert
+    assert time_range.contains(dt.now())
+    assert not time_range.contains(dt.now().subtract(days=2))
+    assert time_range.contains(dt.now().subtract(days=2), recurring=True)
+    assert not time_range.contains(dt.now().add(days=8), recurring=True)
@@ -0,0 +1,80 @@
+import json
+from unittest import mock
+
+import pendulum as dt
+import pytest
+
+from src.api_client.google import TracedHttp
+from src.common import tracing
+from src.common.tracing import NULL_SPAN, set_source, span, trace_run, traced
+from src.common.utils import run_concurrently
+from src.models.settings import Settings
+
+
+@pytest.fixture(autouse=True)
+def traces_path(tmp_path):
+    with mock.patch.object(tracing, "TRACES_PATH", tmp_path):
+        yield tmp_path
+
+
+def read_trace(path):
+    # Trace viewers accept a missing closing bracket and a trailing comma, json does not
+    with open(path) as f:
+        return json.loads(f.read().rstrip().rstrip(",") + "]")
+
+
+def test_trace_run(traces_path):
+    """
+    Test if the spans of a sampled run, including those of other threads, are exported as trace events.
+    """
+
+    # Arrange
+    now = dt.datetime(2023, 1, 1)
+    http = mock.Mock()
+    http.request.side_effect = [
+        (mock.Mock(status=503), b""),
+        (mock.Mock(status=200), b"{}"),
+    ]
+
+    # Act
+    with trace_run(Settings(trace_sample_rate=1.0), now):
+        set_source("My source")
+        with span("job", "job", tier="cold"):
+            run_concurrently(lambda: list(traced(range(3), "fetch.google")))
+            traced_http = TracedHttp(http)
+            traced_http.request("https://test/calendars/1/events?pageToken=2")
+            traced_http.request("https://test/calendars/1/events?pageToken=2")
+            with pytest.raises(ValueError):
+                with span("map"):
+                    raise ValueError()
+
+    # Assert
+    events = read_trace(traces_path / "20230101-000000.json")
+    spans = {event["name"]: event for event in events if event["ph"] == "X"}
+    requests = [event for event in events if event["name"] == "google.request"]
+
+    assert spans.keys() == {"run", "job", "fetch.google", "google.request", "map"}
+    assert spans["fetch.google"]["args"] == {"source": "My source", "items": 3}
+    assert spans["fetch.google"]["tid"] != spans["job"]["tid"]
+    assert spans["map"]["args"]["error"] == "ValueError"
+    assert [(_["args"]["retry"], _["args"]["status"]) for _ in requests] == [
+        (0, 503),
+        (1, 200),
+    ]
+    assert requests[0]["args"]["endpoint"] == "/calendars/1/events"
+    assert spans["run"]["ts"] <= spans["job"]["ts"]
+    assert spans["job"]["ts"] + spans["job"]["dur"] <= (
+        spans["run"]["ts"] + spans["run"]["dur"]
+    )
+
+
+def test_trace_run_not_sampled(traces_path):
+    """
+    Test if a run that is not sampled records nothing.
+    """
+
+    with trace_run(Settings(trace_sample_rate=0.0), dt.now()):
+        assert span("job") is NULL_SPAN
+        assert traced([1], "fetch.google") == [1]
+
+    assert list(traces_path.iterdir()) == []
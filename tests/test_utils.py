@@ -0,0 +1,133 @@
+import threading
+from unittest import mock
+
+from src.common.spill import SpillBuffer
+from src.common.utils import iterate_concurrently, join_concurrently
+
+
+def test_join_concurrently():
+    """
+    Test if two streams are joined on their key, with unmatched items on both sides.
+    """
+
+    # Act
+    result = list(
+        join_concurrently(
+            iter([("a", 1), ("b", 1), ("c", 1)]),
+            iter([("c", 2), ("d", 2), ("a", 2), ("a", 3)]),
+            key=lambda item: item[0],
+        )
+    )
+
+    # Assert
+    assert sorted(result, key=str) == sorted(
+        [
+            (("a", 1), ("a", 2)),
+            (("b", 1), None),
+            (("c", 1), ("c", 2)),
+            (None, ("d", 2)),
+        ],
+        key=str,
+    )
+    assert result[-1] == (None, ("d", 2))
+
+
+def test_join_concurrently_bounded_duplicates():
+    """
+    Test if a join with a spill threshold does not keep joined keys, a duplicate is yielded on its own.
+    """
+
+    # Arrange: the duplicate arrives after the pair was joined
+    joined = threading.Event()
+
+    def _left():
+        yield ("a", 1)
+        joined.set()
+
+    def _right():
+        yield ("a", 2)
+        joined.wait()
+        yield ("a", 3)
+
+    # Act
+    result = list(
+        join_concurrently(
+            _left(), _right(), key=lambda item: item[0], spill_threshold=10
+        )
+    )
+
+    # Assert
+    assert (("a", 1), ("a", 2)) in result
+    assert (None, ("a", 3)) in result
+    assert len(result) == 2
+
+
+def test_join_concurrently_bounded():
+    """
+    Test if a join with a bounded queue and a spill threshold gives the same pairs as an unbounded join.
+    """
+
+    # Arrange: the sides arrive in opposite order, so nearly all items wait for their counterpart
+    left = [(f"key_{i}", "left") for i in range(200)]
+    right = [(f"key_{i}", "right") for i in reversed(range(50, 250))]
+
+    # Act
+    with mock.patch.object(
+        SpillBuffer, "write", autospec=True, side_effect=SpillBuffer.write
+    ) as mock_write:
+        result = list(
+            join_concurrently(
+                iter(left),
+                iter(right),
+                key=lambda item: item[0],
+                queue_size=5,
+                spill_threshold=10,
+            )
+        )
+    result_unbounded = list(
+        join_concurrently(iter(left), iter(right), key=lambda item: item[0])
+    )
+
+    # Assert
+    assert mock_write.called
+    assert sorted(result, key=str) == sorted(result_unbounded, key=str)
+    assert len(result) == 250
+
+
+def test_iterate_concurrently_stop():
+    """
+    Test if the consuming threads stop when the items are no longer consumed from a full queue.
+    """
+
+    # Act
+    items = iterate_concurrently([iter(range(1000)), iter(range(1000))], queue_size=1)
+    first = next(items)
+    items.close()
+
+    # Assert
+    assert first == 0
+
+
+def test_spill_buffer_append():
+    """
+    Test if appending to a spilled list only writes the new item, and the list reads back whole.
+    """
+
+    # Arrange
+    buffer = SpillBuffer(threshold=1)
+    buffer.append("a", 1)
+
+    # Act
+    with mock.patch.object(
+        SpillBuffer, "write", autospec=True, side_effect=SpillBuffer.write
+    ) as mock_write:
+        for i in range(3):
+            buffer.append("b", i)
+        buffer.append("a", 2)
+
+    # Assert
+    assert [call.args[1] for call in mock_write.call_args_list] == [[0], [1], [2]]
+    assert buffer["a"] == [1, 2]
+    assert buffer["b"] == [0, 1, 2]
+    assert list(buffer.values()) == [[1, 2], [0, 1, 2]]
+    buffer.close()